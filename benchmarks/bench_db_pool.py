@@ -0,0 +1,110 @@
+"""
+    Mixed read/write load benchmark for the SQLite layer.
+    Runs --threads threads for --duration seconds; each operation is a
+    save_inv_extraction write with probability --write-ratio, otherwise a
+    getInvoiceById read. Compares the pooled WAL connections of db_util
+    with the previous behaviour (a new connection per call, rollback journal).
+    Usage:
+        python benchmarks/bench_db_pool.py --threads 8 --duration 3 --write-ratio 0.2
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_util
+
+SEED_INVOICES = 2000
+
+
+@contextmanager
+def legacy_get_db():
+    conn = sqlite3.connect(db_util.DB_PATH)
+    try:
+        yield conn
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def make_result(n):
+    return {"data": {
+        "InvoiceId": f"INV-{n}",
+        "VendorName": f"Vendor-{n % 50}",
+        "InvoiceTotal": float(n),
+        "Items": [{"Description": "Item", "Name": "Item", "Quantity": 1, "UnitPrice": 1.0, "Amount": 1.0}] * 3
+    }}
+
+
+def run_load(threads, duration, write_ratio):
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(seed):
+        rng = random.Random(seed)
+        reads = writes = errors = 0
+        while time.perf_counter() < deadline:
+            n = rng.randrange(SEED_INVOICES)
+            try:
+                if rng.random() < write_ratio:
+                    db_util.save_inv_extraction(make_result(n))
+                    writes += 1
+                else:
+                    db_util.getInvoiceById(f"INV-{n}")
+                    reads += 1
+            except sqlite3.OperationalError:
+                errors += 1
+        with lock:
+            counts["reads"] += reads
+            counts["writes"] += writes
+            counts["errors"] += errors
+
+    pool = [threading.Thread(target=worker, args=(seed,)) for seed in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return counts
+
+
+def report(label, counts, duration):
+    total = counts["reads"] + counts["writes"]
+    print(f"{label:<28} {total / duration:>9.0f} ops/s "
+          f"(reads {counts['reads'] / duration:.0f}/s, writes {counts['writes'] / duration:.0f}/s, "
+          f"lock errors {counts['errors']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=3.0)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Previous behaviour: connection per call, default rollback journal
+        db_util.DB_PATH = os.path.join(tmp, "legacy.db")
+        db_util.init_db(journal_mode="DELETE", synchronous="FULL")
+        db_util.save_inv_extractions([make_result(n) for n in range(SEED_INVOICES)])
+        db_util.close_connection()
+        with patch("db_util.get_db", legacy_get_db):
+            report("connection per call", run_load(args.threads, args.duration, args.write_ratio), args.duration)
+
+        # Pooled per-thread connections with WAL and tuned pragmas
+        db_util.DB_PATH = os.path.join(tmp, "pooled.db")
+        db_util.init_db(journal_mode="WAL", synchronous="NORMAL")
+        db_util.save_inv_extractions([make_result(n) for n in range(SEED_INVOICES)])
+        report("pooled WAL connections", run_load(args.threads, args.duration, args.write_ratio), args.duration)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+    Benchmark for the NDJSON invoice export on a synthetic database.
+    Builds a database with --invoices invoices (--items line items each),
+    then streams the whole table through invoice_export.iter_ndjson and
+    through GET /invoices/export, reporting rows/sec. The peak Python memory
+    of the direct export is measured in a separate traced run, since
+    tracemalloc slows allocation down several times (httpx's ASGITransport
+    buffers the whole response body, so the HTTP run is not traced).
+    Usage:
+        python benchmarks/bench_export.py --invoices 100000 --items 3
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_util
+import invoice_export
+from app import app
+from bench_vendor_query import build_database
+
+
+def export_direct():
+    lines = 0
+    size = 0
+    for chunk in invoice_export.iter_ndjson():
+        lines += chunk.count("\n")
+        size += len(chunk)
+    return lines, size
+
+
+async def export_http():
+    lines = 0
+    size = 0
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async with client.stream("GET", "/invoices/export") as response:
+            async for chunk in response.aiter_bytes():
+                lines += chunk.count(b"\n")
+                size += len(chunk)
+    return lines, size
+
+
+def report(name, func, invoices, items):
+    start = time.perf_counter()
+    lines, size = func()
+    elapsed = time.perf_counter() - start
+    assert lines == invoices
+    rows = invoices * (1 + items)
+    print(f"{name:<7}: {lines} invoices ({size / 2**20:.1f} MiB) in {elapsed:.2f}s, "
+          f"{invoices / elapsed:,.0f} invoices/s, {rows / elapsed:,.0f} rows/s")
+
+
+def report_peak_memory():
+    tracemalloc.start()
+    export_direct()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"peak Python memory of the direct export: {peak / 2**20:.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--invoices", type=int, default=100000)
+    parser.add_argument("--items", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_util.DB_PATH = os.path.join(tmp, "bench.db")
+        build_database(args.invoices, 0, args.items)
+        print(f"built {args.invoices} invoices x {args.items} items")
+        report("direct", export_direct, args.invoices, args.items)
+        report("http", lambda: asyncio.run(export_http()), args.invoices, args.items)
+        report_peak_memory()
+        db_util.close_connection()
+
+
+if __name__ == "__main__":
+    main()
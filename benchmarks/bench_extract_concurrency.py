@@ -0,0 +1,97 @@
+"""
+    Concurrency benchmark for POST /extract.
+    Starts N extractions against a fake OCI client that sleeps for a fixed
+    latency, and while they are in flight measures the latency of
+    GET /invoice/{invoice_id} reads served by the same event loop.
+    Usage:
+        python benchmarks/bench_extract_concurrency.py --extractions 16 --latency 0.5
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+import db_util
+import fake_oci
+from test.test_extract_new import build_fake_oci_response
+
+
+class SlowFakeClient:
+    """Stands in for AIServiceDocumentClient with a fixed blocking latency."""
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def analyze_document(self, request):
+        time.sleep(self.latency)
+        return build_fake_oci_response(doc_type_confidence=0.95)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run(extractions, latency, min_reads, interval):
+    from app import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        pdf = fake_oci.minimal_pdf("Fake PDF content")
+
+        async def extract_one():
+            files = {"file": ("bench.pdf", pdf, "application/pdf")}
+            return await client.post("/extract", files=files)
+
+        async def read_loop(in_flight):
+            latencies = []
+            while not in_flight.done() or len(latencies) < min_reads:
+                start = time.perf_counter()
+                response = await client.get("/invoice/bench-1")
+                latencies.append(time.perf_counter() - start)
+                assert response.status_code == 200
+                await asyncio.sleep(interval)
+            return latencies
+
+        start = time.perf_counter()
+        in_flight = asyncio.gather(*(extract_one() for _ in range(extractions)))
+        latencies = await read_loop(in_flight)
+        responses = await in_flight
+        elapsed = time.perf_counter() - start
+
+    ok = sum(1 for r in responses if r.status_code == 200)
+    print(f"extractions in flight : {extractions} (ok={ok}) @ {latency:.2f}s OCI latency")
+    print(f"total wall time       : {elapsed:.2f}s")
+    print(f"reads while in flight : {len(latencies)}")
+    print(f"read p50              : {statistics.median(latencies) * 1000:.1f} ms")
+    print(f"read p99              : {percentile(latencies, 99) * 1000:.1f} ms")
+    print(f"read max              : {max(latencies) * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--extractions", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--reads", type=int, default=20, help="minimum number of reads")
+    parser.add_argument("--interval", type=float, default=0.005)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_util.DB_PATH = os.path.join(tmp, "bench.db")
+        db_util.init_db()
+        db_util.save_inv_extraction({"data": {"InvoiceId": "bench-1", "VendorName": "Bench", "Items": []}})
+        with patch("app.get_doc_client", return_value=SlowFakeClient(args.latency)):
+            asyncio.run(run(args.extractions, args.latency, args.reads, args.interval))
+
+
+if __name__ == "__main__":
+    main()
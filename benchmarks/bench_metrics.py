@@ -0,0 +1,64 @@
+"""
+    Overhead of the metrics primitives used on the request path.
+    Reports the cost of a histogram observation, a labelled counter
+    increment, a timed block, and of rendering /metrics with the current
+    registry, single-threaded and with --threads threads contending.
+    Usage:
+        python benchmarks/bench_metrics.py --iterations 200000 --threads 8
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics
+import app  # registers the application's metrics
+
+
+def per_call(func, iterations, threads=1):
+    def run():
+        for _ in range(iterations):
+            func()
+
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return (time.perf_counter() - start) / (iterations * threads)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=200000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    stage = app.extract_stage_seconds
+    requests = metrics.http_requests_total
+
+    def timed_block():
+        with stage.labels("parse").time():
+            pass
+
+    cases = [
+        ("histogram observe", lambda: stage.labels("oci_call").observe(0.42)),
+        ("counter labels().inc", lambda: requests.labels("GET", "getInvoice", 200).inc()),
+        ("timed block", timed_block),
+    ]
+    for name, func in cases:
+        single = per_call(func, args.iterations)
+        contended = per_call(func, args.iterations // args.threads, args.threads)
+        print(f"{name:<22}: {single * 1e9:7.0f} ns, {contended * 1e9:7.0f} ns/op with {args.threads} threads")
+
+    start = time.perf_counter()
+    text = metrics.render_metrics()
+    print(f"render /metrics       : {(time.perf_counter() - start) * 1000:.2f} ms for {len(text.splitlines())} lines")
+
+
+if __name__ == "__main__":
+    main()
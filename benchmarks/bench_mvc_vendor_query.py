@@ -0,0 +1,74 @@
+"""
+    Benchmark of the MVC controller's vendor read on a synthetic database.
+    Builds a database of --invoices invoices (--items line items each),
+    --vendor-invoices of them belonging to one vendor, and compares
+    getInvoiceByVendorNameCon before eager loading (one items query per
+    invoice), with selectin loading of the ORM instances, and with
+    as_dict=True. Reports the time to load the vendor and turn it into
+    plain dictionaries, and the number of SQL statements.
+    Usage:
+        python benchmarks/bench_mvc_vendor_query.py --invoices 50000 --vendor-invoices 10000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+import db_util
+from benchmarks.bench_vendor_query import build_database
+from mvc_model import db as mvc_db
+from mvc_model.controller.controller import getInvoiceByVendorNameCon
+from test.test_mvc_queries import as_dicts, legacy_getInvoiceByVendorNameCon
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--invoices", type=int, default=50000)
+    parser.add_argument("--vendor-invoices", type=int, default=10000)
+    parser.add_argument("--items", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_util.DB_PATH = os.path.join(tmp, "bench.db")
+        start = time.perf_counter()
+        build_database(args.invoices, args.vendor_invoices, args.items)
+        db_util.close_connection()
+        print(f"built {args.invoices} invoices x {args.items} items in {time.perf_counter() - start:.1f}s, "
+              f"{args.vendor_invoices} of them for BigVendor")
+
+        engine = mvc_db.create_db_engine(f"sqlite:///{db_util.DB_PATH}")
+        statements = []
+        event.listen(engine, "before_cursor_execute", lambda conn, cursor, statement, *rest: statements.append(statement))
+        session_factory = sessionmaker(bind=engine, expire_on_commit=False)
+
+        variants = [
+            ("legacy (query per invoice)", lambda db: as_dicts(legacy_getInvoiceByVendorNameCon(db, "BigVendor"))),
+            ("selectinload ORM", lambda db: as_dicts(getInvoiceByVendorNameCon(db, "BigVendor"))),
+            ("as_dict=True", lambda db: getInvoiceByVendorNameCon(db, "BigVendor", as_dict=True)),
+        ]
+        print(f"{'controller':<28} {'ms':>9} {'queries':>8}")
+        expected = None
+        for name, load in variants:
+            # A fresh session each time, as for a request
+            db = session_factory()
+            del statements[:]
+            start = time.perf_counter()
+            result = load(db)
+            seconds = time.perf_counter() - start
+            db.close()
+            if expected is None:
+                expected = result
+            elif result != expected:
+                sys.exit(f"{name} returned a different result")
+            print(f"{name:<28} {seconds * 1e3:>9.0f} {len(statements):>8}")
+        engine.dispose()
+
+
+if __name__ == "__main__": # pragma: no cover
+    main()
@@ -0,0 +1,68 @@
+"""
+    Cost of parsing an OCI AnalyzeDocument response into the extraction
+    result. Builds a synthetic response with --items line items out of the
+    real oci.ai_document model objects, checks that oci_parser.parse_fields
+    returns the same result as the parser app.py and the MVC controller used
+    to duplicate, and reports the time per parse of both.
+    Usage:
+        python benchmarks/bench_oci_parser.py --items 500 --iterations 200
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fake_oci
+import oci_parser
+from test.test_oci_parser import as_response, legacy_parse_document_fields
+
+
+"""
+    A synthetic invoice with the given number of line items.
+"""
+def large_invoice(items):
+    invoice = fake_oci.synthetic_invoice(fake_oci.minimal_pdf("bench"))
+    products = fake_oci.SYNTHETIC_PRODUCTS
+    invoice["items"] = [
+        {
+            "Description": products[n % len(products)],
+            "Name": products[n % len(products)],
+            "Quantity": str(n % 9 + 1),
+            "UnitPrice": f"${n * 1.25 + 2:,.2f}",
+            "Amount": f"${(n % 9 + 1) * (n * 1.25 + 2):,.2f}",
+        }
+        for n in range(items)
+    ]
+    return invoice
+
+
+def time_per_call(func, response, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(response)
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=500)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    response = as_response(fake_oci.build_result(large_invoice(args.items)))
+    if oci_parser.parse_fields(response) != legacy_parse_document_fields(response):
+        sys.exit("oci_parser.parse_fields and the legacy parser disagree")
+
+    legacy = time_per_call(legacy_parse_document_fields, response, args.iterations)
+    shared = time_per_call(oci_parser.parse_fields, response, args.iterations)
+    print(f"response with {args.items} line items, {args.iterations} parses each")
+    print(f"{'parser':<28} {'ms/parse':>9} {'us/item':>9}")
+    for name, seconds in (("legacy (copy-pasted)", legacy), ("oci_parser.parse_fields", shared)):
+        print(f"{name:<28} {seconds * 1e3:>9.3f} {seconds * 1e6 / max(args.items, 1):>9.2f}")
+    print(f"speedup: {legacy / shared:.2f}x")
+
+
+if __name__ == "__main__": # pragma: no cover
+    main()
@@ -0,0 +1,87 @@
+"""
+    Cost of the local PDF checks (pdf_validation) that run before every OCI
+    call. Validates the PDFs of invoices_sample and a corpus of malformed
+    files derived from them (empty, not a PDF, truncated, broken xref,
+    encrypted, no pages, too many pages, oversized), checks that each one
+    gets the expected verdict, and reports the time per validation.
+    Usage:
+        python benchmarks/bench_pdf_validation.py --iterations 20000
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fake_oci
+import pdf_validation
+
+SAMPLES = os.path.join(fake_oci.SAMPLES_DIR, "*.pdf")
+
+
+"""
+    Malformed variants of a valid PDF, as (name, bytes, expected reason).
+"""
+def malformed_corpus(valid):
+    xref = valid.rfind(b"xref")
+    return [
+        ("empty", b"", "empty"),
+        ("html", b"<!DOCTYPE html><html><body>not a pdf</body></html>" * 20, "not_pdf"),
+        ("png", b"\x89PNG\r\n\x1a\n" + os.urandom(4096), "not_pdf"),
+        ("truncated", valid[:len(valid) // 2], "truncated"),
+        ("broken_xref", valid[:xref] + b"XREF" + valid[xref + 4:], "broken_xref"),
+        ("encrypted", valid.replace(b"trailer\n<<", b"trailer\n<< /Encrypt 9 0 R", 1), "encrypted"),
+        ("no_pages", fake_oci.minimal_pdf("none", pages=0), "no_pages"),
+        ("too_many_pages", fake_oci.minimal_pdf("long", pages=pdf_validation.PDF_MAX_PAGES + 1), "too_many_pages"),
+        ("oversized", valid + b"%" * pdf_validation.PDF_MAX_BYTES, "too_large"),
+    ]
+
+
+def verdict(pdf_bytes):
+    try:
+        pdf_validation.validate_pdf(pdf_bytes)
+    except pdf_validation.InvalidPDF as e:
+        return e.reason
+    return "valid"
+
+
+def time_per_call(pdf_bytes, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        try:
+            pdf_validation.validate_pdf(pdf_bytes)
+        except pdf_validation.InvalidPDF:
+            pass
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    corpus = []
+    for path in sorted(glob.glob(SAMPLES)):
+        with open(path, "rb") as f:
+            corpus.append((os.path.basename(path), f.read(), "valid"))
+    corpus.append(("minimal_50_pages", fake_oci.minimal_pdf("pages", pages=pdf_validation.PDF_MAX_PAGES), "valid"))
+    corpus.extend(malformed_corpus(corpus[0][1]))
+
+    print(f"{'file':<36} {'bytes':>10} {'verdict':>15} {'us/call':>9}")
+    failures = 0
+    for name, pdf_bytes, expected in corpus:
+        got = verdict(pdf_bytes)
+        failures += got != expected
+        # Large inputs are slower per call, keep the run short
+        iterations = max(10, args.iterations * 16384 // max(len(pdf_bytes), 16384))
+        seconds = time_per_call(pdf_bytes, iterations)
+        flag = "" if got == expected else f"  EXPECTED {expected}"
+        print(f"{name:<36} {len(pdf_bytes):>10} {got:>15} {seconds * 1e6:>9.1f}{flag}")
+    if failures:
+        sys.exit(f"{failures} files got an unexpected verdict")
+
+
+if __name__ == "__main__": # pragma: no cover
+    main()
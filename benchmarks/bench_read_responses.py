@@ -0,0 +1,87 @@
+"""
+    Serialization time and bytes on the wire of the vendor listing.
+    Builds a database where one vendor has --vendor-invoices invoices, loads
+    its listing with db_util.get_invoices_by_vendor, and times rendering it
+    through FastAPI's default path (jsonable_encoder, then the stdlib
+    encoder of JSONResponse), through fast_json with the stdlib encoder and
+    with orjson, and compressing the body with gzip and brotli (when
+    installed).
+    Usage:
+        python benchmarks/bench_read_responses.py --vendor-invoices 10000 --items 3
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+import db_util
+import fast_json
+from benchmarks.bench_vendor_query import build_database
+
+
+def time_per_call(func, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        result = func()
+    return result, (time.perf_counter() - start) / iterations
+
+
+def fastapi_default(payload):
+    return JSONResponse(jsonable_encoder(payload)).body
+
+
+def fast_json_stdlib(payload):
+    fast_json.FAST_JSON_ENABLED = False
+    try:
+        return fast_json.FastJSONResponse(payload).body
+    finally:
+        fast_json.FAST_JSON_ENABLED = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--vendor-invoices", type=int, default=10000)
+    parser.add_argument("--items", type=int, default=3)
+    parser.add_argument("--iterations", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_util.DB_PATH = os.path.join(tmp, "bench.db")
+        build_database(args.vendor_invoices, args.vendor_invoices, args.items)
+        invoices = db_util.get_invoices_by_vendor("BigVendor")
+        db_util.close_connection()
+    payload = {"VendorName": "BigVendor", "TotalInvoices": len(invoices), "invoices": invoices, "nextCursor": None}
+    print(f"vendor listing of {len(invoices)} invoices x {args.items} items, {args.iterations} renders each")
+
+    renderers = [("FastAPI default", lambda: fastapi_default(payload)),
+                 ("fast_json, stdlib json", lambda: fast_json_stdlib(payload))]
+    if fast_json.orjson is not None:
+        renderers.append(("fast_json, orjson", lambda: fast_json.FastJSONResponse(payload).body))
+    else:
+        print("orjson is not installed, skipping it")
+    print(f"{'serialization':<24} {'ms':>9} {'speedup':>8}")
+    baseline = None
+    for name, render in renderers:
+        body, seconds = time_per_call(render, args.iterations)
+        baseline = baseline or seconds
+        print(f"{name:<24} {seconds * 1e3:>9.1f} {baseline / seconds:>7.2f}x")
+
+    encodings = [("identity", lambda: body), ("gzip", lambda: fast_json.compress(body, "gzip"))]
+    if fast_json.brotli is not None:
+        encodings.append(("br", lambda: fast_json.compress(body, "br")))
+    else:
+        print("brotli is not installed, skipping it")
+    print(f"{'encoding':<24} {'ms':>9} {'bytes':>12} {'ratio':>7}")
+    for name, encode in encodings:
+        encoded, seconds = time_per_call(encode, args.iterations)
+        print(f"{name:<24} {seconds * 1e3:>9.1f} {len(encoded):>12,} {len(body) / len(encoded):>6.1f}x")
+
+
+if __name__ == "__main__": # pragma: no cover
+    main()
@@ -0,0 +1,91 @@
+"""
+    Benchmark for db_util.get_invoices_by_vendor on a synthetic database.
+    Builds a database with --invoices invoices (--items line items each),
+    --vendor-invoices of them belonging to one large vendor, then compares
+    the set-based implementation with the previous N+1 implementation.
+    The N+1 version is timed on the first --legacy-invoices invoices of the
+    vendor only, and its per-invoice cost is extrapolated.
+    Usage:
+        python benchmarks/bench_vendor_query.py --invoices 100000 --vendor-invoices 40000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_util
+
+
+def build_database(invoices, vendor_invoices, items):
+    db_util.init_db()
+    with db_util.get_db() as conn:
+        conn.executemany(
+            "INSERT INTO invoices (InvoiceId, VendorName, InvoiceDate, InvoiceTotal) VALUES (?, ?, ?, ?)",
+            (
+                (
+                    f"INV-{n}",
+                    "BigVendor" if n < vendor_invoices else f"Vendor-{n % 500}",
+                    f"2024-01-{n % 28 + 1:02d}T00:00:00+00:00",
+                    float(n)
+                )
+                for n in range(invoices)
+            )
+        )
+        conn.executemany(
+            "INSERT INTO items (InvoiceId, Description, Name, Quantity, UnitPrice, Amount) VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                (f"INV-{n}", f"Item {k}", f"Item {k}", 1, 2.5, 2.5)
+                for n in range(invoices)
+                for k in range(items)
+            )
+        )
+
+
+"""
+    The previous implementation: one query for the ids, then getInvoiceById
+    (a new connection and two queries) per invoice.
+"""
+def legacy_get_invoices_by_vendor(vendor_name, limit):
+    with db_util.get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("select InvoiceId from invoices where VendorName = ? limit ?", (vendor_name, limit))
+        rows = cursor.fetchall()
+    return [db_util.getInvoiceById(r[0]) for r in rows]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--invoices", type=int, default=100000)
+    parser.add_argument("--vendor-invoices", type=int, default=40000)
+    parser.add_argument("--items", type=int, default=3)
+    parser.add_argument("--legacy-invoices", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_util.DB_PATH = os.path.join(tmp, "bench.db")
+        _, build_time = timed(build_database, args.invoices, args.vendor_invoices, args.items)
+        print(f"built {args.invoices} invoices x {args.items} items in {build_time:.1f}s")
+
+        invoices, new_time = timed(db_util.get_invoices_by_vendor, "BigVendor")
+        assert len(invoices) == args.vendor_invoices
+        print(f"set-based : {len(invoices)} invoices in {new_time * 1000:.0f} ms")
+
+        legacy, legacy_time = timed(legacy_get_invoices_by_vendor, "BigVendor", args.legacy_invoices)
+        per_invoice = legacy_time / len(legacy)
+        estimate = per_invoice * args.vendor_invoices
+        print(f"N+1       : {len(legacy)} invoices in {legacy_time * 1000:.0f} ms "
+              f"({per_invoice * 1000:.2f} ms/invoice, ~{estimate:.1f}s for {args.vendor_invoices})")
+        print(f"speedup   : ~{estimate / new_time:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
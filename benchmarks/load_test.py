@@ -0,0 +1,158 @@
+"""
+    End-to-end load generator for the service.
+    Drives POST /extract with the PDFs in invoices_sample/ and the read
+    endpoints (GET /invoice/{id}, GET /invoices/vendor/{name}) from
+    --concurrency closed-loop clients, then reports the throughput and the
+    p50/p95/p99 latency of each endpoint.
+
+    By default the app runs in-process on a temporary database with
+    fake_oci.FakeDocumentClient (--latency, --error-rate). With --url the
+    load goes to a running service instead, e.g. one started with
+    FAKE_OCI=http://localhost:9090 next to `python fake_oci.py`.
+    Usage:
+        python benchmarks/load_test.py --duration 10 --concurrency 32 --latency lognormal:0.5,0.3
+        python benchmarks/load_test.py --url http://localhost:8080 --mix extract=1,invoice=8,vendor=2
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import fake_oci
+
+SAMPLE_PDFS = sorted(glob.glob(os.path.join(fake_oci.SAMPLES_DIR, "*.pdf")))
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def parse_mix(spec):
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ("extract", "invoice", "vendor"):
+            raise argparse.ArgumentTypeError(f"Unknown endpoint in mix: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class LoadTest:
+    def __init__(self, client, mix, use_cache):
+        self.client = client
+        self.endpoints = list(mix)
+        self.weights = list(mix.values())
+        self.use_cache = use_cache
+        self.pdfs = [(os.path.basename(path), open(path, "rb").read()) for path in SAMPLE_PDFS]
+        samples = json.load(open(fake_oci.SAMPLE_RESPONSES, encoding="utf-8"))
+        self.invoice_ids = [sample["fields"]["InvoiceId"] for sample in samples.values()]
+        self.results = {name: [] for name in self.endpoints}
+        self.errors = {name: 0 for name in self.endpoints}
+
+    async def extract(self, rng):
+        filename, pdf = rng.choice(self.pdfs)
+        headers = {} if self.use_cache else {"Cache-Control": "no-cache"}
+        files = {"file": (filename, pdf, "application/pdf")}
+        return await self.client.post("/extract", files=files, headers=headers)
+
+    async def invoice(self, rng):
+        return await self.client.get(f"/invoice/{rng.choice(self.invoice_ids)}")
+
+    async def vendor(self, rng):
+        return await self.client.get("/invoices/vendor/SuperStore", params={"limit": 50, "include_items": "false"})
+
+    async def warm_up(self):
+        # Make sure the sample invoices exist for the read endpoints
+        for filename, pdf in self.pdfs:
+            await self.client.post("/extract", files={"file": (filename, pdf, "application/pdf")})
+
+    async def worker(self, seed, deadline, remaining):
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline and remaining[0] > 0:
+            remaining[0] -= 1
+            name = rng.choices(self.endpoints, self.weights)[0]
+            start = time.perf_counter()
+            try:
+                response = await getattr(self, name)(rng)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            self.results[name].append(time.perf_counter() - start)
+            if not ok:
+                self.errors[name] += 1
+
+    async def run(self, concurrency, duration, requests):
+        await self.warm_up()
+        deadline = time.perf_counter() + duration
+        remaining = [requests or float("inf")]
+        start = time.perf_counter()
+        await asyncio.gather(*(self.worker(n, deadline, remaining) for n in range(concurrency)))
+        return time.perf_counter() - start
+
+    def report(self, elapsed):
+        print(f"{'endpoint':<9} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        total = 0
+        for name in self.endpoints:
+            latencies = self.results[name]
+            total += len(latencies)
+            if not latencies:
+                continue
+            print(f"{name:<9} {len(latencies):>8} {self.errors[name]:>6} {len(latencies) / elapsed:>8.1f} "
+                  f"{percentile(latencies, 50) * 1000:>8.1f} {percentile(latencies, 95) * 1000:>8.1f} "
+                  f"{percentile(latencies, 99) * 1000:>8.1f}")
+        print(f"total     {total:>8} in {elapsed:.2f}s, {total / elapsed:.1f} req/s")
+
+
+async def run(args):
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+    else:
+        import app
+        app.doc_client = fake_oci.FakeDocumentClient(args.latency, args.error_rate, seed=args.seed)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app.app), base_url="http://load", timeout=args.timeout)
+    async with client:
+        load_test = LoadTest(client, args.mix, args.use_cache)
+        elapsed = await load_test.run(args.concurrency, args.duration, args.requests)
+    load_test.report(elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="base URL of a running service; the app runs in-process if omitted")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run")
+    parser.add_argument("--requests", type=int, help="stop after this many requests")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("extract=1,invoice=4,vendor=2"),
+                        help="endpoint weights, e.g. extract=1,invoice=4,vendor=2")
+    parser.add_argument("--use-cache", action="store_true", help="let /extract answer from the extraction cache")
+    parser.add_argument("--latency", default="lognormal:0.5,0.3", help="in-process fake OCI latency spec")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="in-process fake OCI 503 rate")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.url:
+        asyncio.run(run(args))
+        return
+    import db_util
+    with tempfile.TemporaryDirectory() as tmp:
+        db_util.DB_PATH = os.path.join(tmp, "load.db")
+        db_util.init_db()
+        asyncio.run(run(args))
+        db_util.close_connection()
+
+
+if __name__ == "__main__":
+    main()
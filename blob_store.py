@@ -0,0 +1,263 @@
+import contextlib
+import hashlib
+import os
+import tempfile
+import traceback
+import uuid
+
+import oci
+
+import metrics
+import oci_resilience
+import uploads
+
+# Where uploaded documents are stored to be sent to OCI by reference:
+# unset (always inline), "local" (a directory, for tests and local runs)
+# or "oci" (an Object Storage bucket)
+BLOB_STORE = os.getenv("BLOB_STORE", "")
+# Directory of the local backend
+BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", "blob_store")
+# Object Storage namespace and bucket OCI Document AI reads the documents
+# from; the local backend uses them only to name its references
+BLOB_STORE_NAMESPACE = os.getenv("BLOB_STORE_NAMESPACE", "local")
+BLOB_STORE_BUCKET = os.getenv("BLOB_STORE_BUCKET", "invoices")
+# Prefix of the object names, which start with the SHA-256 of the documents
+BLOB_STORE_PREFIX = os.getenv("BLOB_STORE_PREFIX", "documents/")
+# Larger documents are sent by reference when a store is configured
+OCI_INLINE_MAX_BYTES = int(os.getenv("OCI_INLINE_MAX_BYTES", str(1024 * 1024)))
+
+documents_sent = metrics.Counter(
+    "oci_documents_total",
+    "Documents sent to OCI Document AI, by mode: inline (Base64 in the request) or object_storage (by reference).",
+    ("mode",)
+)
+
+
+class StoredDocument:
+    """
+    A document already in the blob store, known by the SHA-256 of its
+    content and its object name.
+    """
+
+    def __init__(self, pdf_hash, name=None):
+        self.pdf_hash = pdf_hash
+        self.name = name or object_name(pdf_hash)
+
+
+class LocalBlobStore:
+    """
+    Blob store keeping each object in a file under a directory. References
+    name the configured namespace and bucket; only the fake OCI can read them.
+    """
+
+    def __init__(self, root=BLOB_STORE_DIR, namespace=BLOB_STORE_NAMESPACE, bucket=BLOB_STORE_BUCKET):
+        self.root = root
+        self.namespace = namespace
+        self.bucket = bucket
+
+    def path(self, name):
+        return os.path.join(self.root, *name.split("/"))
+
+    def exists(self, name):
+        return os.path.exists(self.path(name))
+
+    def put(self, name, data):
+        path = self.path(name)
+        if os.path.exists(path):
+            # Objects are named by content, an existing one is the same document
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written under a temporary name so readers never see a partial file
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def get(self, name):
+        with open(self.path(name), "rb") as f:
+            return f.read()
+
+    def delete(self, name):
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            pass
+
+
+class ObjectStorageBlobStore:
+    """
+    Blob store backed by an OCI Object Storage bucket. The client is built
+    from ~/.oci/config by start(), called at startup, or by the first call
+    when there is none (scripts, tests); OCI Document AI needs a policy
+    letting it read the bucket.
+    """
+
+    def __init__(self, namespace=BLOB_STORE_NAMESPACE, bucket=BLOB_STORE_BUCKET, client=None):
+        self.namespace = namespace
+        self.bucket = bucket
+        self._client = client
+
+    def start(self):
+        if self._client is None:
+            self._client = oci.object_storage.ObjectStorageClient(
+                oci.config.from_file(),
+                timeout=(oci_resilience.OCI_CONNECT_TIMEOUT, oci_resilience.OCI_READ_TIMEOUT),
+                retry_strategy=oci.retry.DEFAULT_RETRY_STRATEGY
+            )
+
+    @property
+    def client(self):
+        if self._client is None:
+            self.start()
+        return self._client
+
+    def exists(self, name):
+        try:
+            self.client.head_object(self.namespace, self.bucket, name)
+        except oci.exceptions.ServiceError as e:
+            if e.status == 404:
+                return False
+            raise
+        return True
+
+    def put(self, name, data):
+        if self.exists(name):
+            return
+        self.client.put_object(self.namespace, self.bucket, name, data)
+
+    def get(self, name):
+        return self.client.get_object(self.namespace, self.bucket, name).data.content
+
+    def delete(self, name):
+        try:
+            self.client.delete_object(self.namespace, self.bucket, name)
+        except oci.exceptions.ServiceError as e:
+            if e.status != 404:
+                raise
+
+
+"""
+    Builds the blob store selected by BLOB_STORE.
+    Returns:
+        LocalBlobStore | ObjectStorageBlobStore | None: None when documents
+                                                        are always sent inline.
+    Raises:
+        ValueError: If BLOB_STORE is not "", "local" or "oci".
+"""
+def create_store(backend=BLOB_STORE):
+    if not backend:
+        return None
+    if backend == "local":
+        return LocalBlobStore()
+    if backend == "oci":
+        return ObjectStorageBlobStore()
+    raise ValueError(f"Invalid BLOB_STORE: {backend!r}, expected local or oci")
+
+
+"""
+    Builds the client of the configured store, if it needs one, at startup
+    rather than in the first request that stores a document.
+"""
+def start():
+    if isinstance(store, ObjectStorageBlobStore):
+        store.start()
+
+
+"""
+    Returns the object name of a document from the SHA-256 of its content,
+    with a suffix making it unique to one extraction or job when given.
+"""
+def object_name(pdf_hash, suffix=""):
+    return f"{BLOB_STORE_PREFIX}{pdf_hash}{suffix and '-' + suffix}.pdf"
+
+
+"""
+    Checks whether a document is sent to OCI by reference: it is already
+    stored, or it is larger than OCI_INLINE_MAX_BYTES and a store is
+    configured.
+    Parameters:
+        document (bytes-like | StoredDocument): The PDF.
+"""
+def by_reference(document):
+    if isinstance(document, StoredDocument):
+        return True
+    return store is not None and len(document) > OCI_INLINE_MAX_BYTES
+
+
+"""
+    Returns the reference OCI Document AI reads a stored document from.
+    Parameters:
+        document (StoredDocument): The PDF, see stored_for_call.
+    Returns:
+        ObjectStorageDocumentDetails: The document part of an AnalyzeDocument request.
+"""
+def reference_details(document):
+    documents_sent.labels("object_storage").inc()
+    return oci.ai_document.models.ObjectStorageDocumentDetails(
+        namespace_name=store.namespace,
+        bucket_name=store.bucket,
+        object_name=document.name
+    )
+
+
+"""
+    Returns the document part of an AnalyzeDocument request carrying the
+    PDF inline, Base64 encoded.
+"""
+def inline_details(pdf_bytes):
+    documents_sent.labels("inline").inc()
+    return oci.ai_document.models.InlineDocumentDetails(data=uploads.base64_encode(pdf_bytes))
+
+
+"""
+    Stores a document to be sent by reference later, e.g. by a job worker,
+    under a name of its own: whoever stored it deletes it with
+    delete_document once done, without affecting other uploads of the
+    same PDF.
+    Returns:
+        StoredDocument: The stored document.
+"""
+def put_document(pdf_bytes, pdf_hash):
+    stored = StoredDocument(pdf_hash, object_name(pdf_hash, uuid.uuid4().hex))
+    store.put(stored.name, pdf_bytes)
+    return stored
+
+
+"""
+    Deletes a stored document once nothing needs it any more. Failures are
+    logged and leave the object to the bucket's lifecycle policy; other
+    documents are ignored.
+"""
+def delete_document(document):
+    if store is None or not isinstance(document, StoredDocument):
+        return
+    try:
+        store.delete(document.name)
+    except Exception:
+        traceback.print_exc()
+
+
+"""
+    Makes a document ready to be sent to OCI in one call. A document over
+    OCI_INLINE_MAX_BYTES is stored for the duration of the call and deleted
+    afterwards; a document already stored (e.g. by a job, which deletes it
+    when the job ends) and one sent inline are yielded unchanged.
+    Parameters:
+        document (bytes-like | StoredDocument): The PDF.
+        timer (Histogram, optional): Observes the time taken to store it.
+"""
+@contextlib.contextmanager
+def stored_for_call(document, timer=None):
+    if isinstance(document, StoredDocument) or not by_reference(document):
+        yield document
+        return
+    with timer.time() if timer else contextlib.nullcontext():
+        stored = put_document(document, hashlib.sha256(document).hexdigest())
+    try:
+        yield stored
+    finally:
+        delete_document(stored)
+
+
+# Shared by app.py, the job workers and the MVC controller
+store = create_store()
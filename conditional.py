@@ -0,0 +1,76 @@
+"""
+    Conditional GET support for the invoice and vendor endpoints: ETag and
+    Last-Modified validators built from the content versions the database
+    triggers of db_util keep, and the If-None-Match / If-Modified-Since checks that let an
+    unchanged resource be answered with 304 Not Modified.
+"""
+import email.utils
+from datetime import timezone
+
+from fastapi import Response
+
+import metrics
+
+not_modified_total = metrics.Counter(
+    "http_not_modified_total",
+    "Conditional GETs answered with 304 Not Modified, by endpoint.",
+    ("endpoint",)
+)
+
+
+"""
+    Builds the ETag of a content version. The ETag is weak, so it stays
+    valid whatever encoding the body is sent with; the modification time
+    is part of it so a version number reused after the data was deleted
+    and written again gives a different ETag.
+"""
+def etag(version, modified_at):
+    if modified_at is None:
+        return f'W/"{version or 0}"'
+    return f'W/"{version}-{round(modified_at * 1e6):x}"'
+
+
+"""
+    Returns the validator headers of a content version. Cache-Control:
+    no-cache lets clients store the response but makes them revalidate it
+    before every use.
+"""
+def headers(version, modified_at):
+    result = {"ETag": etag(version, modified_at), "Cache-Control": "no-cache"}
+    if modified_at is not None:
+        result["Last-Modified"] = email.utils.formatdate(modified_at, usegmt=True)
+    return result
+
+
+"""
+    Evaluates the request's preconditions against the current content
+    version (RFC 9110 section 13.2.2): If-None-Match when present, compared
+    weakly; otherwise If-Modified-Since, at the one second resolution of
+    HTTP dates. A malformed If-Modified-Since is ignored.
+    Returns:
+        bool: True if the client's copy is current and 304 can be sent.
+"""
+def is_not_modified(if_none_match, if_modified_since, version, modified_at):
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        current = etag(version, modified_at).removeprefix("W/")
+        return any(tag.strip().removeprefix("W/") == current for tag in if_none_match.split(","))
+    if if_modified_since is None or modified_at is None:
+        return False
+    try:
+        since = email.utils.parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return int(modified_at) <= since.timestamp()
+
+
+"""
+    The 304 Not Modified response of a content version: the validator
+    headers and no body.
+"""
+def not_modified(endpoint, version, modified_at):
+    not_modified_total.labels(endpoint).inc()
+    return Response(status_code=304, headers=headers(version, modified_at))
@@ -1,21 +1,211 @@
+import os
 import sqlite3
+import threading
+import time
 from contextlib import contextmanager
 
+import invoice_cache
+import metrics
+
 
 
 DB_PATH = "invoices.db"
 
+# Settings applied to every pooled connection. Defaults come from the
+# environment and can be overridden at startup through init_db().
+DB_SETTINGS = {
+    # WAL lets readers run while a writer commits
+    "journal_mode": os.getenv("DB_JOURNAL_MODE", "WAL"),
+    # NORMAL is durable against application crashes in WAL mode
+    "synchronous": os.getenv("DB_SYNCHRONOUS", "NORMAL"),
+    # How long to wait for a lock held by another connection
+    "busy_timeout_ms": int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000")),
+    # Bytes of the database file to memory-map, 0 disables mmap
+    "mmap_size": int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024))),
+    # Page cache per connection, negative values are KiB
+    "cache_size": int(os.getenv("DB_CACHE_SIZE", "-65536")),
+}
+JOURNAL_MODES = ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF")
+SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+# sqlite3 connections must stay in the thread that created them, so the
+# pool keeps one long-lived connection per thread.
+_local = threading.local()
+# Bumped when the settings change so every thread reopens its connection
+_generation = 0
+
+db_query_seconds = metrics.Histogram(
+    "db_query_seconds",
+    "Latency of database reads and writes by function.",
+    ("query",)
+)
+
+
+"""
+    Updates the connection settings (see DB_SETTINGS).
+    Connections opened with older settings are reopened on their next use.
+"""
+def configure(**settings):
+    global _generation
+    for key, value in settings.items():
+        if key not in DB_SETTINGS:
+            raise ValueError(f"Unknown database setting: {key}")
+        if key == "journal_mode" and str(value).upper() not in JOURNAL_MODES:
+            raise ValueError(f"Invalid journal_mode: {value}")
+        if key == "synchronous" and str(value).upper() not in SYNCHRONOUS_MODES:
+            raise ValueError(f"Invalid synchronous mode: {value}")
+    if any(DB_SETTINGS[key] != value for key, value in settings.items()):
+        DB_SETTINGS.update(settings)
+        _generation += 1
+
+
+"""
+    Opens a new connection to DB_PATH and applies DB_SETTINGS.
+    check_same_thread=False is for connections owned by a single consumer
+    that may resume in a different thread, such as a streaming response.
+"""
+def _connect(check_same_thread=True):
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=DB_SETTINGS["busy_timeout_ms"] / 1000,
+        check_same_thread=check_same_thread
+    )
+    conn.execute(f"PRAGMA busy_timeout = {int(DB_SETTINGS['busy_timeout_ms'])}")
+    conn.execute(f"PRAGMA journal_mode = {DB_SETTINGS['journal_mode'].upper()}")
+    conn.execute(f"PRAGMA synchronous = {DB_SETTINGS['synchronous'].upper()}")
+    conn.execute(f"PRAGMA mmap_size = {int(DB_SETTINGS['mmap_size'])}")
+    conn.execute(f"PRAGMA cache_size = {int(DB_SETTINGS['cache_size'])}")
+    return conn
+
+
+"""
+    Returns the calling thread's pooled connection, opening it on first use
+    or when DB_PATH or the settings changed.
+"""
+def get_connection():
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.depth == 0 and (_local.path != DB_PATH or _local.generation != _generation):
+        conn.close()
+        conn = None
+    if conn is None:
+        conn = _connect()
+        _local.conn = conn
+        _local.path = DB_PATH
+        _local.generation = _generation
+        _local.depth = 0
+    return conn
+
+
+"""
+    Closes the calling thread's pooled connection, if any.
+"""
+def close_connection():
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+
+"""
+    Yields the calling thread's pooled connection as a unit of work: the
+    outermost block commits on success and rolls back on error.
+"""
 @contextmanager
 def get_db():
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
+    _local.depth += 1
     try:
         yield conn
-        conn.commit()
+        if _local.depth == 1:
+            conn.commit()
+    except BaseException:
+        if _local.depth == 1:
+            conn.rollback()
+        raise
     finally:
-        conn.close()
+        _local.depth -= 1
+
+
+# Current time in seconds since the epoch, in SQL
+_SQL_NOW = "(julianday('now') - 2440587.5) * 86400.0"
+INVOICE_CONTENT_COLUMNS = ("VendorName", "InvoiceDate", "BillingAddressRecipient",
+                           "ShippingAddress", "SubTotal", "ShippingCost", "InvoiceTotal")
+
+
+def _bump_vendors(vendor_names_query):
+    return f"""
+        INSERT INTO vendor_versions (VendorName, Version, ModifiedAt)
+        SELECT VendorName, 1, {_SQL_NOW} FROM ({vendor_names_query}) WHERE VendorName IS NOT NULL
+        ON CONFLICT(VendorName) DO UPDATE SET
+            Version = vendor_versions.Version + 1,
+            ModifiedAt = excluded.ModifiedAt;
+    """
 
 
-def init_db():
+def _changed(columns):
+    return " OR ".join(f"OLD.{column} IS NOT NEW.{column}" for column in columns)
+
+
+# The content versions served as ETag / Last-Modified. Triggers on invoices
+# version its rows for every writer: inserting or changing an invoice bumps
+# it and its vendor, moving it to another vendor bumps both vendors, and
+# writes that leave the content as it was bump nothing. Items have no
+# triggers, which would fire once per row: their writers bump the invoice
+# once per save with bump_invoice_versions (write_inv_extraction, and the
+# MVC session on commit).
+VERSION_TRIGGERS = {
+    "invoices_version_insert": f"""
+        AFTER INSERT ON invoices
+        BEGIN
+            UPDATE invoices SET Version = 1, ModifiedAt = {_SQL_NOW} WHERE InvoiceId = NEW.InvoiceId;
+            {_bump_vendors("SELECT NEW.VendorName AS VendorName")}
+        END
+    """,
+    "invoices_version_update": f"""
+        AFTER UPDATE OF {", ".join(INVOICE_CONTENT_COLUMNS)} ON invoices
+        WHEN {_changed(INVOICE_CONTENT_COLUMNS)}
+        BEGIN
+            UPDATE invoices SET Version = COALESCE(Version, 0) + 1, ModifiedAt = {_SQL_NOW}
+            WHERE InvoiceId = NEW.InvoiceId;
+            {_bump_vendors("SELECT NEW.VendorName AS VendorName UNION SELECT OLD.VendorName")}
+        END
+    """,
+    "invoices_version_delete": f"""
+        AFTER DELETE ON invoices
+        BEGIN
+            {_bump_vendors("SELECT OLD.VendorName AS VendorName")}
+        END
+    """,
+}
+# Per-row item triggers of earlier versions, dropped by init_db
+_OBSOLETE_TRIGGERS = ("items_version_insert", "items_version_update", "items_version_delete")
+
+
+"""
+    Bumps the content version of invoices whose items were written, and of
+    their vendors, with two statements whatever the number of items.
+    Parameters:
+        cursor: A cursor of the writing transaction.
+        invoice_ids (list | None): The invoices, None for all of them.
+"""
+def bump_invoice_versions(cursor, invoice_ids):
+    if invoice_ids is None:
+        where, params = "", ()
+    else:
+        params = list(invoice_ids)
+        if not params:
+            return
+        where = f"WHERE InvoiceId IN ({', '.join('?' * len(params))})"
+    cursor.execute(f"UPDATE invoices SET Version = COALESCE(Version, 0) + 1, ModifiedAt = {_SQL_NOW} {where}", params)
+    cursor.execute(_bump_vendors(f"SELECT DISTINCT VendorName FROM invoices {where}"), params)
+
+
+"""
+    Creates the schema. Connection settings (see DB_SETTINGS) can be passed
+    as keyword arguments, e.g. init_db(journal_mode="WAL", cache_size=-131072).
+"""
+def init_db(**settings):
+    configure(**settings)
     with get_db() as conn:
         cursor = conn.cursor()
         
@@ -28,10 +218,33 @@ def init_db():
                 ShippingAddress TEXT,
                 SubTotal REAL,
                 ShippingCost REAL,
-                InvoiceTotal REAL
-                
+                InvoiceTotal REAL,
+                Version INTEGER,
+                ModifiedAt REAL
+            )
+        """)
+        # Content version of each invoice and of each vendor's invoices,
+        # bumped by the VERSION_TRIGGERS and served as ETag / Last-Modified
+        # by the API
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS vendor_versions (
+                VendorName TEXT PRIMARY KEY,
+                Version INTEGER,
+                ModifiedAt REAL
             )
         """)
+        columns = [row[1] for row in cursor.execute("PRAGMA table_info(invoices)")]
+        if "Version" not in columns:
+            # Databases created before the versions existed: every invoice
+            # and vendor starts at version 1
+            now = time.time()
+            cursor.execute("ALTER TABLE invoices ADD COLUMN Version INTEGER")
+            cursor.execute("ALTER TABLE invoices ADD COLUMN ModifiedAt REAL")
+            cursor.execute("UPDATE invoices SET Version = 1, ModifiedAt = ?", (now,))
+            cursor.execute("""
+                INSERT OR IGNORE INTO vendor_versions (VendorName, Version, ModifiedAt)
+                SELECT DISTINCT VendorName, 1, ? FROM invoices WHERE VendorName IS NOT NULL
+            """, (now,))
         
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS confidences (
@@ -60,95 +273,393 @@ def init_db():
             )
         """)
 
+        # Secondary indexes for the hot lookups. CREATE INDEX IF NOT EXISTS
+        # also adds them to databases created before they existed.
+        # Serves vendor lookups and the (InvoiceDate, InvoiceId) keyset pages
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_invoices_vendor_date_id
+            ON invoices(VendorName, InvoiceDate, InvoiceId)
+        """)
+        # Superseded by idx_invoices_vendor_date_id
+        cursor.execute("DROP INDEX IF EXISTS idx_invoices_vendor_name")
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_invoices_invoice_date
+            ON invoices(InvoiceDate)
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_items_invoice_id
+            ON items(InvoiceId)
+        """)
+        # Recreated so a database always has the current definitions
+        for name in _OBSOLETE_TRIGGERS:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        for name, definition in VERSION_TRIGGERS.items():
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+            cursor.execute(f"CREATE TRIGGER {name} {definition}")
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS extraction_cache (
+                PdfHash TEXT PRIMARY KEY,
+                Result TEXT,
+                CreatedAt REAL,
+                LastAccessAt REAL
+            )
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_extraction_cache_last_access
+            ON extraction_cache(LastAccessAt)
+        """)
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                JobId TEXT PRIMARY KEY,
+                Status TEXT,
+                Filename TEXT,
+                PdfHash TEXT,
+                Document BLOB,
+                DocumentName TEXT,
+                Result TEXT,
+                Error TEXT,
+                StatusCode INTEGER,
+                Attempts INTEGER,
+                WorkerId TEXT,
+                LeaseExpiresAt REAL,
+                AvailableAt REAL,
+                CreatedAt REAL,
+                UpdatedAt REAL
+            )
+        """)
+        job_columns = [row[1] for row in cursor.execute("PRAGMA table_info(jobs)")]
+        if "AvailableAt" not in job_columns:
+            # Databases created before retries were delayed
+            cursor.execute("ALTER TABLE jobs ADD COLUMN AvailableAt REAL")
+            cursor.execute("UPDATE jobs SET AvailableAt = CreatedAt")
+        if "DocumentName" not in job_columns:
+            # Databases created before stored PDFs were named per job; their
+            # PDFs are found from the PdfHash
+            cursor.execute("ALTER TABLE jobs ADD COLUMN DocumentName TEXT")
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_jobs_status_created
+            ON jobs(Status, CreatedAt)
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_jobs_pdf_hash
+            ON jobs(PdfHash)
+        """)
+
+        # Rewritten invoices, read by the invoice caches of the other
+        # worker processes (see invoice_cache)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS invoice_invalidations (
+                Seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                InvoiceId TEXT,
+                CreatedAt REAL
+            )
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_invoice_invalidations_created
+            ON invoice_invalidations(CreatedAt)
+        """)
+
 
+@db_query_seconds.labels("save_inv_extraction").time()
 def save_inv_extraction(result):
+    with get_db() as conn:
+        cursor = conn.cursor()
+        invoice_id = write_inv_extraction(cursor, result)
+        invoice_cache.log_invalidations(cursor, [invoice_id] if invoice_id else [])
+    # Once committed, so a concurrent read cannot cache the old invoice again
+    if invoice_id:
+        invoice_cache.invalidate([invoice_id])
+
+
+"""
+    Saves several extraction results in a single transaction.
+    Used by the batch endpoint so a whole batch costs one commit.
+    Parameters:
+        results (list): Extraction results as returned by /extract.
+"""
+@db_query_seconds.labels("save_inv_extractions").time()
+def save_inv_extractions(results):
+    with get_db() as conn:
+        cursor = conn.cursor()
+        invoice_ids = [write_inv_extraction(cursor, result) for result in results]
+        invoice_ids = [invoice_id for invoice_id in invoice_ids if invoice_id]
+        invoice_cache.log_invalidations(cursor, invoice_ids)
+    invoice_cache.invalidate(invoice_ids)
+
+
+"""
+    Writes one extraction result (invoice, confidences and line items)
+    using the given cursor. Results without an InvoiceId are skipped.
+    Only what differs from the stored invoice is written, so saving the
+    same result again (e.g. a repeat upload answered from the extraction
+    cache) writes nothing and keeps the content versions: the
+    VERSION_TRIGGERS bump them when the invoice row changes, and new
+    items bump them once.
+    The caller owns the transaction and invalidates the invoice cache.
+    Returns:
+        str | None: The InvoiceId if the invoice or its items changed, None
+                    if the result was skipped or nothing changed.
+"""
+def write_inv_extraction(cursor, result):
     data = result.get("data", {})
     data_confidence = result.get("dataConfidence", {})
     
     invoice_id = data.get("InvoiceId")
-    if invoice_id:
-        with get_db() as conn:
-            cursor = conn.cursor()
-            
-            # Insert invoice
-            cursor.execute("""
-                INSERT OR REPLACE INTO invoices 
-                (InvoiceId, VendorName, InvoiceDate, BillingAddressRecipient, 
-                 ShippingAddress, SubTotal, ShippingCost, InvoiceTotal)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                invoice_id,
-                data.get("VendorName"),
-                data.get("InvoiceDate"),
-                data.get("BillingAddressRecipient"),
-                data.get("ShippingAddress"),
-                data.get("SubTotal"),
-                data.get("ShippingCost"),
-                data.get("InvoiceTotal")
-            ))
-            
-            # Insert confidences
-            cursor.execute("""
-                INSERT OR REPLACE INTO confidences 
-                (InvoiceId, VendorName, InvoiceDate, BillingAddressRecipient,
-                 ShippingAddress, SubTotal, ShippingCost, InvoiceTotal)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                invoice_id,
-                data_confidence.get("VendorName"),
-                data_confidence.get("InvoiceDate"),
-                data_confidence.get("BillingAddressRecipient"),
-                data_confidence.get("ShippingAddress"),
-                data_confidence.get("SubTotal"),
-                data_confidence.get("ShippingCost"),
-                data_confidence.get("InvoiceTotal")
-            ))
-            
-            # Insert line items
-            line_items = data.get("Items", [])
-            cursor.execute("DELETE FROM items WHERE InvoiceId = ?", (invoice_id,))
-            for item in line_items:
-                cursor.execute("""
-                    INSERT INTO items 
-                    (InvoiceId, Description, Name, Quantity, UnitPrice, Amount)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """, (
-                    invoice_id,
-                    item.get("Description"),
-                    item.get("Name"),
-                    item.get("Quantity"),
-                    item.get("UnitPrice"),
-                    item.get("Amount")
-                ))
-"""
-    Retrieves all invoices associated with a given vendor name.
-    This function queries the database for invoice IDs that match the provided
-    vendor name, then fetches the full invoice details for each invoice ID.
+    if not invoice_id:
+        return None
+    
+    # Insert or update the invoice; an identical row is left alone
+    cursor.execute("""
+        INSERT INTO invoices 
+        (InvoiceId, VendorName, InvoiceDate, BillingAddressRecipient, 
+         ShippingAddress, SubTotal, ShippingCost, InvoiceTotal)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(InvoiceId) DO UPDATE SET
+            VendorName = excluded.VendorName,
+            InvoiceDate = excluded.InvoiceDate,
+            BillingAddressRecipient = excluded.BillingAddressRecipient,
+            ShippingAddress = excluded.ShippingAddress,
+            SubTotal = excluded.SubTotal,
+            ShippingCost = excluded.ShippingCost,
+            InvoiceTotal = excluded.InvoiceTotal
+        WHERE (invoices.VendorName, invoices.InvoiceDate, invoices.BillingAddressRecipient,
+               invoices.ShippingAddress, invoices.SubTotal, invoices.ShippingCost, invoices.InvoiceTotal)
+            IS NOT (excluded.VendorName, excluded.InvoiceDate, excluded.BillingAddressRecipient,
+                    excluded.ShippingAddress, excluded.SubTotal, excluded.ShippingCost, excluded.InvoiceTotal)
+    """, (
+        invoice_id,
+        data.get("VendorName"),
+        data.get("InvoiceDate"),
+        data.get("BillingAddressRecipient"),
+        data.get("ShippingAddress"),
+        data.get("SubTotal"),
+        data.get("ShippingCost"),
+        data.get("InvoiceTotal")
+    ))
+    invoice_changed = cursor.rowcount > 0
+    
+    # Insert or update confidences
+    cursor.execute("""
+        INSERT INTO confidences 
+        (InvoiceId, VendorName, InvoiceDate, BillingAddressRecipient,
+         ShippingAddress, SubTotal, ShippingCost, InvoiceTotal)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(InvoiceId) DO UPDATE SET
+            VendorName = excluded.VendorName,
+            InvoiceDate = excluded.InvoiceDate,
+            BillingAddressRecipient = excluded.BillingAddressRecipient,
+            ShippingAddress = excluded.ShippingAddress,
+            SubTotal = excluded.SubTotal,
+            ShippingCost = excluded.ShippingCost,
+            InvoiceTotal = excluded.InvoiceTotal
+        WHERE (confidences.VendorName, confidences.InvoiceDate, confidences.BillingAddressRecipient,
+               confidences.ShippingAddress, confidences.SubTotal, confidences.ShippingCost, confidences.InvoiceTotal)
+            IS NOT (excluded.VendorName, excluded.InvoiceDate, excluded.BillingAddressRecipient,
+                    excluded.ShippingAddress, excluded.SubTotal, excluded.ShippingCost, excluded.InvoiceTotal)
+    """, (
+        invoice_id,
+        data_confidence.get("VendorName"),
+        data_confidence.get("InvoiceDate"),
+        data_confidence.get("BillingAddressRecipient"),
+        data_confidence.get("ShippingAddress"),
+        data_confidence.get("SubTotal"),
+        data_confidence.get("ShippingCost"),
+        data_confidence.get("InvoiceTotal")
+    ))
+    
+    # Replace the line items if they differ, all in one executemany call
+    line_items = item_values(data.get("Items", []))
+    cursor.execute(f"SELECT {ITEM_COLUMNS} FROM items WHERE InvoiceId = ? ORDER BY id", (invoice_id,))
+    if cursor.fetchall() == line_items:
+        return invoice_id if invoice_changed else None
+    cursor.execute("DELETE FROM items WHERE InvoiceId = ?", (invoice_id,))
+    if not invoice_changed:
+        # A changed invoice row was already bumped by its trigger
+        bump_invoice_versions(cursor, [invoice_id])
+    cursor.executemany("""
+        INSERT INTO items 
+        (InvoiceId, Description, Name, Quantity, UnitPrice, Amount)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, [(invoice_id,) + item for item in line_items])
+    return invoice_id
+
+
+"""
+    Returns the stored values of line items, in ITEM_COLUMNS order, as
+    tuples comparable to rows read from the items table.
+"""
+def item_values(items):
+    return [
+        (
+            item.get("Description"),
+            item.get("Name"),
+            item.get("Quantity"),
+            item.get("UnitPrice"),
+            item.get("Amount")
+        )
+        for item in items
+    ]
+"""
+    Retrieves the invoices associated with a given vendor name, ordered by
+    (InvoiceDate, InvoiceId).
+    This function runs two set-based queries, one for the vendor's invoices
+    and one for all of their items, and groups the items by invoice in memory.
+    The number of queries does not depend on the number of invoices.
+    Pages use keyset pagination: pass the (InvoiceDate, InvoiceId) of the
+    last invoice of the previous page as `after`, so a deep page costs the
+    same as the first one.
     Parameters:
         vendor_name (str): The name of the vendor.
+        limit (int | None): Maximum number of invoices to return, None for all.
+        after (tuple | None): (InvoiceDate, InvoiceId) to continue after.
+        include_items (bool): Whether to load the invoices' items.
     Returns:
         list: A list of invoice records associated with the vendor.
               Returns an empty list if no invoices are found.
 """
-def get_invoices_by_vendor(vendor_name):
+@db_query_seconds.labels("get_invoices_by_vendor").time()
+def get_invoices_by_vendor(vendor_name, limit=None, after=None, include_items=True):
+    where, params = vendor_page_filter(vendor_name, after)
+    # LIMIT -1 means no limit in SQLite
+    params.append(limit if limit is not None else -1)
     # Open a database connection using the context manager
     with get_db() as conn:
         # Create a database cursor to execute SQL queries
         cursor = conn.cursor()
-        # Execute a query to retrieve invoice IDs for the given vendor name
-        cursor.execute("select InvoiceId from invoices where VendorName = ?",(vendor_name,))
-        # Fetch all matching rows from the query result
-        rows= cursor.fetchall()
-        invoices = []
-        # Iterate over each returned row
-        for r in rows:
-            invoice_id = r[0]  
-            # Retrieve the full invoice details using the invoice ID
-            invoices.append(getInvoiceById(invoice_id))  
-    # Return the list of invoices associated with the vendor        
-    return invoices
+        # Retrieve the invoices of the page in one query
+        cursor.execute(vendor_page_query(INVOICE_COLUMNS, where), params)
+        rows = cursor.fetchall()
+        if not rows:
+            return []
+        if not include_items:
+            return [invoice_row_to_dict(row, None) for row in rows]
+        # Retrieve the items of all those invoices in one query
+        cursor.execute(f"""
+            SELECT InvoiceId, {ITEM_COLUMNS}
+            FROM items
+            WHERE InvoiceId IN ({vendor_page_query("InvoiceId", where)})
+            ORDER BY id;
+        """, params)
+        items_rows = cursor.fetchall()
+
+    # Group the items by invoice id
+    items_by_invoice = {}
+    for item in items_rows:
+        items_by_invoice.setdefault(item[0], []).append(item_row_to_dict(item[1:]))
+    # Return the list of invoices associated with the vendor
+    return [invoice_row_to_dict(row, items_by_invoice.get(row[0], [])) for row in rows]
+
+
+"""
+    Streams invoices with their items, optionally filtered by vendor and
+    InvoiceDate range, without loading the table into memory.
+    Invoices are read through a server-side cursor in batches of batch_size;
+    the items of each batch are fetched with one query. The generator uses
+    its own connection, which is closed when it is exhausted or closed.
+    Parameters:
+        vendor_name (str | None): Only invoices of this vendor.
+        date_from (str | None): Only invoices with InvoiceDate >= date_from (ISO 8601).
+        date_to (str | None): Only invoices with InvoiceDate < date_to (ISO 8601).
+        batch_size (int): Invoices fetched per round trip.
+    Yields:
+        list: Invoice dictionaries (same shape as getInvoiceById), one list per batch.
+"""
+def iter_invoice_batches(vendor_name=None, date_from=None, date_to=None, batch_size=1000):
+    conditions = []
+    params = []
+    if vendor_name is not None:
+        conditions.append("VendorName = ?")
+        params.append(vendor_name)
+    if date_from is not None:
+        conditions.append("InvoiceDate >= ?")
+        params.append(date_from)
+    if date_to is not None:
+        conditions.append("InvoiceDate < ?")
+        params.append(date_to)
+    where = " AND ".join(conditions) or "1"
+    # Follow the order of the index that serves the filter, so SQLite never sorts
+    if vendor_name is not None:
+        order_by = "InvoiceDate, InvoiceId"
+    elif date_from is not None or date_to is not None:
+        order_by = "InvoiceDate"
+    else:
+        order_by = "InvoiceId"
+
+    conn = _connect(check_same_thread=False)
+    try:
+        invoices_cursor = conn.execute(f"""
+            SELECT {INVOICE_COLUMNS}
+            FROM invoices
+            WHERE {where}
+            ORDER BY {order_by};
+        """, params)
+        while True:
+            rows = invoices_cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            invoice_ids = [row[0] for row in rows]
+            items_by_invoice = {}
+            for item in conn.execute(f"""
+                SELECT InvoiceId, {ITEM_COLUMNS}
+                FROM items
+                WHERE InvoiceId IN ({", ".join("?" * len(invoice_ids))})
+                ORDER BY id;
+            """, invoice_ids):
+                items_by_invoice.setdefault(item[0], []).append(item_row_to_dict(item[1:]))
+            yield [invoice_row_to_dict(row, items_by_invoice.get(row[0], [])) for row in rows]
+    finally:
+        conn.close()
+
+
+"""
+    Counts the invoices of a vendor with a single indexed COUNT query.
+"""
+@db_query_seconds.labels("count_invoices_by_vendor").time()
+def count_invoices_by_vendor(vendor_name):
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM invoices WHERE VendorName = ?", (vendor_name,))
+        return cursor.fetchone()[0]
+
+
+"""
+    Builds the WHERE clause and parameters selecting a vendor's invoices
+    after the (InvoiceDate, InvoiceId) keyset position `after`.
+    Invoices without a date sort first.
+"""
+def vendor_page_filter(vendor_name, after):
+    if after is None:
+        return "VendorName = ?", [vendor_name]
+    after_date, after_id = after
+    if after_date is None:
+        # The remaining undated invoices, then every dated one
+        return (
+            "VendorName = ? AND ((InvoiceDate IS NULL AND InvoiceId > ?) OR InvoiceDate IS NOT NULL)",
+            [vendor_name, after_id]
+        )
+    # Row-value comparison, answered by a range search on idx_invoices_vendor_date_id
+    return (
+        "VendorName = ? AND (InvoiceDate, InvoiceId) > (?, ?)",
+        [vendor_name, after_date, after_id]
+    )
+
+
+"""
+    Builds the page query for vendor_page_filter() with a trailing LIMIT parameter.
+"""
+def vendor_page_query(columns, where):
+    return f"""
+        SELECT {columns}
+        FROM invoices
+        WHERE {where}
+        ORDER BY InvoiceDate, InvoiceId
+        LIMIT ?
+    """
 """
     Retrieves a single invoice and its associated items by invoice ID.
+    See get_versioned_invoice() for the invoice with its content version.
     This function queries the database for an invoice record using the given
     invoice ID. If the invoice exists, it also retrieves all related line items
     from the items table and returns a structured dictionary containing the
@@ -160,11 +671,25 @@ def get_invoices_by_vendor(vendor_name):
                      or None if the invoice does not exist.
 """
 def getInvoiceById(invoice_id):
+    record = get_versioned_invoice(invoice_id)
+    return record[0] if record else None
+
+
+"""
+    Same as getInvoiceById, along with the content version of the invoice
+    read from the same row, so the version always matches the returned
+    invoice header. Timed as getInvoiceById.
+    Returns:
+        tuple | None: (invoice, (Version, ModifiedAt)), or None if the
+                      invoice does not exist.
+"""
+@db_query_seconds.labels("getInvoiceById").time()
+def get_versioned_invoice(invoice_id):
     with get_db() as conn:
         cursor = conn.cursor()
         # Query the invoices table for the invoice with the given ID
-        cursor.execute("""
-            SELECT *
+        cursor.execute(f"""
+            SELECT {INVOICE_COLUMNS}, Version, ModifiedAt
             FROM invoices
             WHERE InvoiceId = ?;
         """, (invoice_id,))
@@ -173,26 +698,59 @@ def getInvoiceById(invoice_id):
         if not row:
             return None
         # Query the items table for all items related to the invoice
-        cursor.execute("""
-            SELECT Description, Name, Quantity, UnitPrice, Amount
+        cursor.execute(f"""
+            SELECT {ITEM_COLUMNS}
             FROM items
-            WHERE InvoiceId = ?;
+            WHERE InvoiceId = ?
+            ORDER BY id;
         """, (invoice_id,))
         # Fetch all item rows related to the invoice
         items_rows = cursor.fetchall()
     
-    items = []
-    # Iterate over each item row and build a structured dictionary
-    for item in items_rows:
-        items.append({
-            "Description": item[0],
-            "Name": item[1],
-            "Quantity": item[2],
-            "UnitPrice": item[3],
-            "Amount": item[4]
-        })
+    # Build a structured dictionary for each item row
+    items = [item_row_to_dict(item) for item in items_rows]
     # Return the full invoice data including its items
-    return {
+    return invoice_row_to_dict(row, items), (row[8], row[9])
+
+
+"""
+    Returns the content version of an invoice, (Version, ModifiedAt), with
+    a primary key lookup that does not read the items; None if the invoice
+    does not exist.
+"""
+@db_query_seconds.labels("get_invoice_version").time()
+def get_invoice_version(invoice_id):
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT Version, ModifiedAt FROM invoices WHERE InvoiceId = ?", (invoice_id,))
+        return cursor.fetchone()
+
+
+"""
+    Returns the aggregate content version of a vendor's invoices,
+    (Version, ModifiedAt), bumped by every write of one of them. A vendor
+    without invoices has version (0, None).
+"""
+@db_query_seconds.labels("get_vendor_version").time()
+def get_vendor_version(vendor_name):
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT Version, ModifiedAt FROM vendor_versions WHERE VendorName = ?", (vendor_name,))
+        return cursor.fetchone() or (0, None)
+
+
+# Column lists matching invoice_row_to_dict() and item_row_to_dict()
+INVOICE_COLUMNS = """InvoiceId, VendorName, InvoiceDate, BillingAddressRecipient,
+                   ShippingAddress, SubTotal, ShippingCost, InvoiceTotal"""
+ITEM_COLUMNS = "Description, Name, Quantity, UnitPrice, Amount"
+
+
+"""
+    Builds the invoice dictionary returned by the API from an invoices row
+    selected with INVOICE_COLUMNS. "Items" is left out when items is None.
+"""
+def invoice_row_to_dict(row, items):
+    invoice = {
         "InvoiceId": row[0],
         "VendorName": row[1],
         "InvoiceDate": row[2],
@@ -201,8 +759,25 @@ def getInvoiceById(invoice_id):
         "SubTotal": row[5],
         "ShippingCost": row[6],
         "InvoiceTotal": row[7],
-        "Items": items
     }
+    if items is not None:
+        invoice["Items"] = items
+    return invoice
+
+
+"""
+    Builds an item dictionary from an items row selected with ITEM_COLUMNS.
+"""
+def item_row_to_dict(item):
+    return {
+        "Description": item[0],
+        "Name": item[1],
+        "Quantity": item[2],
+        "UnitPrice": item[3],
+        "Amount": item[4]
+    }
+
+
 def clean_db():
     """
     Cleans the database by removing all test data.
@@ -215,8 +790,13 @@ def clean_db():
         # Delete child table first (because of FK relations)
         cursor.execute("DELETE FROM items;")
         cursor.execute("DELETE FROM invoices;")
+        cursor.execute("DELETE FROM vendor_versions;")
+        cursor.execute("DELETE FROM extraction_cache;")
+        cursor.execute("DELETE FROM jobs;")
+        cursor.execute("DELETE FROM invoice_invalidations;")
 
         conn.commit()
+    invoice_cache.cache.clear()
 
 
     
\ No newline at end of file
@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+import time
+
+import db_util
+import metrics
+
+# Entries older than this many seconds are treated as misses and evicted
+CACHE_TTL_SECONDS = float(os.getenv("EXTRACTION_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+# Upper bound on stored results, least recently used entries are evicted first
+CACHE_MAX_ENTRIES = int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", "10000"))
+# Set EXTRACTION_CACHE_ENABLED=0 to always call OCI
+CACHE_ENABLED = os.getenv("EXTRACTION_CACHE_ENABLED", "1") != "0"
+
+cache_hits = metrics.Counter(
+    "extraction_cache_hits_total",
+    "Extractions answered from the PDF hash cache without calling OCI."
+)
+cache_misses = metrics.Counter(
+    "extraction_cache_misses_total",
+    "Extractions that were not found in the PDF hash cache."
+)
+
+
+"""
+    Returns the cache key of a PDF: the SHA-256 hex digest of its bytes.
+"""
+def pdf_hash(pdf_bytes):
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+"""
+    Looks up a cached extraction result by PDF hash.
+    Expired entries are deleted and reported as a miss.
+    Parameters:
+        key (str): The PDF hash returned by pdf_hash().
+    Returns:
+        dict | None: The cached result (confidence, data, dataConfidence),
+                     or None on a miss.
+"""
+def get(key):
+    if not CACHE_ENABLED:
+        return None
+    now = time.time()
+    with db_util.get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT Result, CreatedAt FROM extraction_cache WHERE PdfHash = ?",
+            (key,)
+        )
+        row = cursor.fetchone()
+        if row and now - row[1] > CACHE_TTL_SECONDS:
+            cursor.execute("DELETE FROM extraction_cache WHERE PdfHash = ?", (key,))
+            row = None
+        if not row:
+            cache_misses.inc()
+            return None
+        # Track recency for the LRU eviction in put()
+        cursor.execute(
+            "UPDATE extraction_cache SET LastAccessAt = ? WHERE PdfHash = ?",
+            (now, key)
+        )
+    cache_hits.inc()
+    return json.loads(row[0])
+
+
+"""
+    Stores a parsed extraction result under its PDF hash and applies the
+    TTL and size eviction policy.
+    Only the parsed fields are kept; predictionTime describes a single OCI call.
+"""
+def put(key, result):
+    put_many([(key, result)])
+
+
+"""
+    Stores several (key, result) pairs in one transaction, then applies the
+    TTL and size eviction policy once.
+"""
+def put_many(entries):
+    if not CACHE_ENABLED or not entries:
+        return
+    now = time.time()
+    rows = []
+    for key, result in entries:
+        cached = {
+            "confidence": result.get("confidence"),
+            "data": result.get("data"),
+            "dataConfidence": result.get("dataConfidence"),
+        }
+        rows.append((key, json.dumps(cached), now, now))
+    with db_util.get_db() as conn:
+        cursor = conn.cursor()
+        cursor.executemany("""
+            INSERT OR REPLACE INTO extraction_cache
+            (PdfHash, Result, CreatedAt, LastAccessAt)
+            VALUES (?, ?, ?, ?)
+        """, rows)
+        # Drop expired entries
+        cursor.execute(
+            "DELETE FROM extraction_cache WHERE CreatedAt < ?",
+            (now - CACHE_TTL_SECONDS,)
+        )
+        # Keep only the most recently used CACHE_MAX_ENTRIES entries
+        cursor.execute("""
+            DELETE FROM extraction_cache
+            WHERE PdfHash IN (
+                SELECT PdfHash FROM extraction_cache
+                ORDER BY LastAccessAt DESC
+                LIMIT -1 OFFSET ?
+            )
+        """, (CACHE_MAX_ENTRIES,))
@@ -0,0 +1,397 @@
+"""
+    Local stand-in for OCI Document AI (AIServiceDocumentClient.analyze_document).
+
+    FakeDocumentClient answers in-process with real oci.ai_document model
+    objects, so the same parsing code runs as in production. The PDFs in
+    invoices_sample/ get the fields printed on them (recorded in
+    invoices_sample/fake_oci_responses.json); any other PDF gets a synthetic
+    invoice derived from its SHA-256, so the answer for a document is stable.
+
+    The same responses can be served over HTTP for load tests against a
+    running service:
+        python fake_oci.py --port 9090 --latency lognormal:1.2,0.4 --error-rate 0.02
+        FAKE_OCI=http://localhost:9090 python app.py
+
+    Latency specs: "fixed:S", "uniform:MIN,MAX" or "lognormal:MEDIAN,SIGMA" (seconds).
+"""
+import argparse
+import base64
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import oci
+from oci._vendor import requests
+from oci.ai_document import models
+
+import blob_store
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "invoices_sample")
+SAMPLE_RESPONSES = os.path.join(SAMPLES_DIR, "fake_oci_responses.json")
+
+SYNTHETIC_VENDORS = ["SuperStore", "OfficeMart", "PaperCo", "TechDepot"]
+SYNTHETIC_PRODUCTS = [
+    "Newell 330 Art, Office Supplies, OFF-AR-5309",
+    "Xerox 1906 Paper, Office Supplies, OFF-PA-6457",
+    "Panasonic Kx-TS550 Phones, Technology, TEC-PH-5566",
+    "36X48 HARDFLOOR CHAIRMAT Furnishings, Furniture, FUR-FU-2864",
+]
+
+
+class LatencyModel:
+    """
+    Samples a latency in seconds from a spec string.
+    Raises:
+        ValueError: If the spec is not fixed:S, uniform:MIN,MAX or lognormal:MEDIAN,SIGMA.
+    """
+
+    def __init__(self, spec="fixed:0"):
+        kind, _, args = str(spec).partition(":")
+        if not args:
+            # A bare number is a fixed latency
+            kind, args = "fixed", kind
+        try:
+            params = [float(a) for a in args.split(",")]
+        except ValueError:
+            raise ValueError(f"Invalid latency spec: {spec!r}")
+        expected = {"fixed": 1, "uniform": 2, "lognormal": 2}
+        if expected.get(kind) != len(params):
+            raise ValueError(f"Invalid latency spec: {spec!r}")
+        self.kind = kind
+        self.params = params
+
+    def sample(self, rng):
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return rng.uniform(*self.params)
+        median, sigma = self.params
+        return rng.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+
+
+class FakeDocumentClient:
+    """
+    In-process fake of AIServiceDocumentClient.
+    Parameters:
+        latency (str): Latency spec of each call, see LatencyModel.
+        error_rate (float): Fraction of calls failing with a 503 ServiceError.
+        throttle_rate (float): Fraction of calls failing with a 429 ServiceError.
+        seed (int | None): Seed of the latency and error random generator.
+        timeout (float | None): Read timeout like the SDK's: a call slower
+                                than this raises requests ReadTimeout.
+        documents (blob store | None): Where documents sent by reference are
+                                       read from, blob_store.store by default.
+    """
+
+    def __init__(self, latency="fixed:0", error_rate=0.0, throttle_rate=0.0, seed=None, timeout=None, documents=None):
+        self.latency = LatencyModel(latency)
+        self.documents = documents
+        self.timeout = timeout
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.samples = load_samples()
+
+    def analyze_document(self, analyze_document_details, **kwargs):
+        document = analyze_document_details.document
+        if document.source == "OBJECT_STORAGE":
+            pdf_bytes = self.read_object(document.object_name)
+        else:
+            pdf_bytes = base64.b64decode(document.data)
+        result = self.analyze(pdf_bytes)
+        return oci.response.Response(200, {"opc-request-id": "fake"}, result, None)
+
+    def read_object(self, name):
+        """Reads a document sent by reference, or raises a 404 ServiceError."""
+        store = blob_store.store if self.documents is None else self.documents
+        try:
+            if store is None:
+                raise FileNotFoundError(name)
+            return store.get(name)
+        except FileNotFoundError:
+            raise oci.exceptions.ServiceError(404, "ObjectNotFound", {}, f"Object {name} not found")
+
+    def analyze(self, pdf_bytes):
+        """
+        Sleeps for the sampled latency, then returns the AnalyzeDocumentResult
+        for a PDF or raises the injected ServiceError.
+        """
+        with self.lock:
+            self.calls += 1
+            delay = self.latency.sample(self.rng)
+            roll = self.rng.random()
+        if self.timeout is not None and delay > self.timeout:
+            time.sleep(self.timeout)
+            raise requests.exceptions.ReadTimeout(f"Fake OCI read timed out after {self.timeout}s")
+        time.sleep(delay)
+        if roll < self.error_rate:
+            raise oci.exceptions.ServiceError(503, "ServiceUnavailable", {}, "Injected fake OCI outage")
+        if roll < self.error_rate + self.throttle_rate:
+            raise oci.exceptions.ServiceError(429, "TooManyRequests", {}, "Injected fake OCI throttling")
+        sample = self.samples.get(hashlib.sha256(pdf_bytes).hexdigest())
+        return build_result(sample or synthetic_invoice(pdf_bytes))
+
+
+"""
+    Loads the recorded sample responses, keyed by the SHA-256 of each sample PDF.
+"""
+def load_samples():
+    if not os.path.exists(SAMPLE_RESPONSES):
+        return {}
+    with open(SAMPLE_RESPONSES, encoding="utf-8") as f:
+        recorded = json.load(f)
+    samples = {}
+    for filename, invoice in recorded.items():
+        path = os.path.join(SAMPLES_DIR, filename)
+        if os.path.exists(path):
+            with open(path, "rb") as pdf:
+                samples[hashlib.sha256(pdf.read()).hexdigest()] = invoice
+    return samples
+
+
+"""
+    Builds a plausible invoice for a PDF that is not one of the samples.
+    The values only depend on the PDF content.
+"""
+def synthetic_invoice(pdf_bytes):
+    digest = hashlib.sha256(pdf_bytes).hexdigest()
+    rng = random.Random(digest)
+    items = []
+    for _ in range(rng.randint(1, 4)):
+        quantity = rng.randint(1, 9)
+        unit_price = round(rng.uniform(2, 300), 2)
+        product = rng.choice(SYNTHETIC_PRODUCTS)
+        items.append({
+            "Description": product,
+            "Name": product,
+            "Quantity": str(quantity),
+            "UnitPrice": f"${unit_price:,.2f}",
+            "Amount": f"${quantity * unit_price:,.2f}",
+        })
+    subtotal = sum(float(i["Amount"][1:].replace(",", "")) for i in items)
+    shipping = round(rng.uniform(1, 40), 2)
+    day = time.gmtime(1293840000 + rng.randrange(4 * 365) * 86400)
+    return {
+        "fields": {
+            "VendorName": rng.choice(SYNTHETIC_VENDORS),
+            "InvoiceId": str(int(digest[:12], 16)),
+            "InvoiceDate": time.strftime("%b %d %Y", day),
+            "BillingAddressRecipient": f"Customer {digest[:6]}",
+            "SubTotal": f"${subtotal:,.2f}",
+            "ShippingCost": f"${shipping:,.2f}",
+            "InvoiceTotal": f"${subtotal + shipping:,.2f}",
+            "AmountDue": f"${subtotal + shipping:,.2f}",
+        },
+        "items": items,
+    }
+
+
+"""
+    Converts an invoice ({"fields": {...}, "items": [...]}) to the
+    AnalyzeDocumentResult OCI returns for key-value extraction.
+"""
+def build_result(invoice, confidence=0.98):
+    def string_value(text):
+        return models.ValueString(text=text, value=text, confidence=confidence, word_indexes=[])
+
+    document_fields = [
+        models.DocumentField(
+            field_type="KEY_VALUE",
+            field_label=models.FieldLabel(name=name, confidence=confidence),
+            field_value=string_value(text)
+        )
+        for name, text in invoice["fields"].items()
+    ]
+    line_items = [
+        models.DocumentField(
+            field_type="LINE_ITEM",
+            field_value=models.ValueArray(items=[
+                models.DocumentField(
+                    field_type="LINE_ITEM_FIELD",
+                    field_label=models.FieldLabel(name=name, confidence=confidence),
+                    field_value=string_value(text)
+                )
+                for name, text in item.items()
+            ])
+        )
+        for item in invoice["items"]
+    ]
+    document_fields.append(models.DocumentField(
+        field_type="LINE_ITEM_GROUP",
+        field_label=models.FieldLabel(name="Items"),
+        field_value=models.ValueArray(items=line_items)
+    ))
+    return models.AnalyzeDocumentResult(
+        document_metadata=models.DocumentMetadata(page_count=1, mime_type="application/pdf"),
+        pages=[models.Page(page_number=1, document_fields=document_fields)],
+        detected_document_types=[models.DetectedDocumentType(document_type="INVOICE", confidence=1.0)],
+        key_value_extraction_model_version="fake"
+    )
+
+
+"""
+    Builds a small well-formed PDF (header, page tree, cross-reference
+    table, trailer) for tests and benchmarks. The marker is written in a
+    comment on the second line, so different markers give different files.
+"""
+def minimal_pdf(marker="", pages=1):
+    kids = " ".join(f"{3 + n} 0 R" for n in range(pages))
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode("ascii"),
+    ] + [b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] >>"] * pages
+    pdf = bytearray(b"%PDF-1.4\n%" + marker.encode("utf-8") + b"\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref_offset = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        pdf += b"%010d 00000 n \n" % offset
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    return bytes(pdf)
+
+
+"""
+    Serializes an OCI model to the JSON the service sends on the wire.
+"""
+def to_wire(obj):
+    if isinstance(obj, list):
+        return [to_wire(value) for value in obj]
+    if hasattr(obj, "swagger_types"):
+        return {
+            obj.attribute_map[name]: to_wire(getattr(obj, name))
+            for name in obj.swagger_types
+            if getattr(obj, name) is not None
+        }
+    return obj
+
+
+class _NoopSigner:
+    """Request signer for the fake server, which does not check signatures."""
+
+    def __call__(self, request):
+        return request
+
+
+"""
+    Returns a real AIServiceDocumentClient talking to a fake server started
+    with `python fake_oci.py`. SDK retries and circuit breaking are disabled
+    so injected errors reach the caller.
+    Parameters:
+        endpoint (str): URL of the fake server.
+        timeout (tuple | None): SDK (connect, read) timeouts in seconds.
+"""
+def http_client(endpoint, timeout=None):
+    # The SDK validates the config even when a signer is given
+    config = {
+        "user": "ocid1.user.oc1..fake",
+        "tenancy": "ocid1.tenancy.oc1..fake",
+        "fingerprint": ":".join(["00"] * 16),
+        "key_file": "unused",
+        "region": "us-ashburn-1",
+    }
+    return oci.ai_document.AIServiceDocumentClient(
+        config,
+        signer=_NoopSigner(),
+        service_endpoint=endpoint,
+        retry_strategy=oci.retry.NoneRetryStrategy(),
+        circuit_breaker_strategy=oci.circuit_breaker.NoCircuitBreakerStrategy(),
+        **({"timeout": timeout} if timeout else {})
+    )
+
+
+"""
+    Builds the fake client selected by the FAKE_OCI setting: "local" for the
+    in-process fake (configured by FAKE_OCI_LATENCY, FAKE_OCI_ERROR_RATE and
+    FAKE_OCI_THROTTLE_RATE), or the URL of a fake server.
+    Parameters:
+        setting (str): "local" or the fake server URL.
+        timeout (tuple | None): (connect, read) timeouts in seconds.
+"""
+def client_from_setting(setting, timeout=None):
+    if setting == "local":
+        return FakeDocumentClient(
+            latency=os.getenv("FAKE_OCI_LATENCY", "fixed:0"),
+            error_rate=float(os.getenv("FAKE_OCI_ERROR_RATE", "0")),
+            throttle_rate=float(os.getenv("FAKE_OCI_THROTTLE_RATE", "0")),
+            timeout=timeout[1] if timeout else None
+        )
+    return http_client(setting, timeout)
+
+
+"""
+    Builds an HTTP server that answers POST .../actions/analyzeDocument like
+    OCI Document AI, using a FakeDocumentClient for the results.
+"""
+def make_server(fake, host="127.0.0.1", port=9090):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if not self.path.endswith("/actions/analyzeDocument"):
+                return self.send_json(404, {"code": "NotFound", "message": "Unknown path"})
+            try:
+                document = json.loads(body)["document"]
+                if document.get("source") == "OBJECT_STORAGE":
+                    object_name, pdf_bytes = document["objectName"], None
+                else:
+                    pdf_bytes = base64.b64decode(document["data"])
+            except (ValueError, KeyError, TypeError, AttributeError):
+                return self.send_json(400, {"code": "InvalidParameter", "message": "Expected an inline or object storage document"})
+            try:
+                if pdf_bytes is None:
+                    pdf_bytes = fake.read_object(object_name)
+                result = fake.analyze(pdf_bytes)
+            except oci.exceptions.ServiceError as e:
+                return self.send_json(e.status, {"code": e.code, "message": e.message})
+            self.send_json(200, to_wire(result))
+
+        def do_HEAD(self):
+            # Connection warm-up of the OCI client pool
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def send_json(self, status, payload):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("opc-request-id", "fake")
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fake OCI Document AI server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9090)
+    parser.add_argument("--latency", default="fixed:0", help="fixed:S, uniform:MIN,MAX or lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered with 503")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of calls answered with 429")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+
+    fake = FakeDocumentClient(args.latency, args.error_rate, args.throttle_rate, args.seed)
+    server = make_server(fake, args.host, args.port)
+    print(f"Fake OCI Document AI listening on http://{args.host}:{server.server_port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__": # pragma: no cover
+    main()
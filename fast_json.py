@@ -0,0 +1,115 @@
+"""
+    JSON responses of the read endpoints without FastAPI's per-value
+    jsonable_encoder pass: the invoice dictionaries built by db_util only
+    hold str, int, float and None, so they are rendered directly, by orjson
+    when it is installed and by the stdlib json encoder otherwise. Bodies
+    over COMPRESS_MIN_BYTES are compressed with brotli (when installed) or
+    gzip, as negotiated with the request's Accept-Encoding.
+"""
+import gzip
+import json
+import os
+
+from fastapi.responses import JSONResponse
+
+import metrics
+
+try:
+    import orjson
+except ImportError: # pragma: no cover - optional dependency
+    orjson = None
+try:
+    import brotli
+except ImportError: # pragma: no cover - optional dependency
+    brotli = None
+
+# Set FAST_JSON_ENABLED=0 to render with the stdlib encoder even when orjson is installed
+FAST_JSON_ENABLED = os.getenv("FAST_JSON_ENABLED", "1") != "0"
+# Smaller bodies are sent uncompressed; 0 disables compression
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+# Fast levels: the bodies are compressed on every request, not cached
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+compressed_responses = metrics.Counter(
+    "compressed_responses_total",
+    "Read endpoint responses sent compressed, by Content-Encoding.",
+    ("encoding",)
+)
+response_body_bytes = metrics.Counter(
+    "response_body_bytes_total",
+    "Bytes of read endpoint response bodies, before (json) and after (wire) compression.",
+    ("stage",)
+)
+
+
+"""
+    Serializes content to compact UTF-8 JSON, like FastAPI's JSONResponse.
+    orjson is used when installed and FAST_JSON_ENABLED is set.
+"""
+def dumps(content):
+    if orjson is not None and FAST_JSON_ENABLED:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+"""
+    Chooses the Content-Encoding of a response from the request's
+    Accept-Encoding header: brotli if available and accepted, then gzip,
+    honouring q-values ("gzip;q=0" refuses gzip) and "*".
+    Returns:
+        str | None: "br", "gzip", or None to send the body as is.
+"""
+def choose_encoding(accept_encoding):
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    wildcard = accepted.get("*", 0.0)
+    available = ("br", "gzip") if brotli is not None else ("gzip",)
+    # Highest q-value wins, ties go to the better compression
+    best = max(available, key=lambda coding: accepted.get(coding, wildcard))
+    return best if accepted.get(best, wildcard) > 0 else None
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse rendered with dumps(). Returned directly from an endpoint,
+    it skips jsonable_encoder, so the content must already be plain JSON
+    types. Pass the request's Accept-Encoding to compress the body.
+    """
+
+    def __init__(self, content, status_code=200, headers=None, accept_encoding=None):
+        self.accept_encoding = accept_encoding
+        self.content_encoding = None
+        super().__init__(content, status_code=status_code, headers=headers)
+        if self.content_encoding is not None:
+            self.headers["Content-Encoding"] = self.content_encoding
+        # The body may differ by Accept-Encoding, whether it is compressed or not
+        self.headers["Vary"] = "Accept-Encoding"
+
+    def render(self, content):
+        body = dumps(content)
+        response_body_bytes.labels("json").inc(len(body))
+        encoding = choose_encoding(self.accept_encoding) if 0 < COMPRESS_MIN_BYTES <= len(body) else None
+        if encoding is not None:
+            body = compress(body, encoding)
+            self.content_encoding = encoding
+            compressed_responses.labels(encoding).inc()
+        response_body_bytes.labels("wire").inc(len(body))
+        return body
@@ -0,0 +1,233 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import db_util
+import metrics
+
+# Set INVOICE_CACHE_ENABLED=0 to read every invoice from the database
+INVOICE_CACHE_ENABLED = os.getenv("INVOICE_CACHE_ENABLED", "1") != "0"
+# Upper bound on cached invoices per process, least recently used first out
+INVOICE_CACHE_MAX_ENTRIES = int(os.getenv("INVOICE_CACHE_MAX_ENTRIES", "10000"))
+# Cached invoices are read again from the database after this many seconds
+INVOICE_CACHE_TTL_SECONDS = float(os.getenv("INVOICE_CACHE_TTL_SECONDS", "300"))
+# With several worker processes, set INVOICE_CACHE_SHARED=1: writes are
+# logged in the invoice_invalidations table and every process drops the
+# rewritten invoices from its cache within INVOICE_CACHE_SYNC_SECONDS
+INVOICE_CACHE_SHARED = os.getenv("INVOICE_CACHE_SHARED", "0") == "1"
+INVOICE_CACHE_SYNC_SECONDS = float(os.getenv("INVOICE_CACHE_SYNC_SECONDS", "1"))
+# Logged invalidations are kept longer than any entry can live
+INVALIDATION_RETENTION_SECONDS = max(3600.0, 2 * INVOICE_CACHE_TTL_SECONDS)
+
+cache_hits = metrics.Counter(
+    "invoice_cache_hits_total",
+    "GET /invoice/{invoice_id} reads answered from the in-process invoice cache."
+)
+cache_misses = metrics.Counter(
+    "invoice_cache_misses_total",
+    "GET /invoice/{invoice_id} reads that went to the database."
+)
+cache_evictions = metrics.Counter(
+    "invoice_cache_evictions_total",
+    "Invoices dropped from the cache, by reason: lru, expired or invalidated.",
+    ("reason",)
+)
+cache_entries = metrics.Gauge(
+    "invoice_cache_entries",
+    "Invoices currently held in the in-process invoice cache."
+)
+
+
+class InvoiceCache:
+    """
+    Thread-safe LRU cache of invoices with a time to live. Every
+    invalidation bumps a generation number; a value read from the
+    database is only stored if no invalidation happened since the read
+    started, so a concurrent write can never be overwritten by stale data.
+    """
+
+    def __init__(self, max_entries=INVOICE_CACHE_MAX_ENTRIES, ttl=INVOICE_CACHE_TTL_SECONDS, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Returns the cached value or None, dropping it if it expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= self.clock():
+                del self._entries[key]
+                cache_evictions.labels("expired").inc()
+                cache_entries.dec()
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value, generation):
+        """Stores a value read at the given generation, unless it was invalidated since."""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            if key not in self._entries:
+                cache_entries.inc()
+            self._entries[key] = (value, self.clock() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                cache_evictions.labels("lru").inc()
+                cache_entries.dec()
+
+    def invalidate(self, keys):
+        with self._lock:
+            self.generation += 1
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    cache_evictions.labels("invalidated").inc()
+                    cache_entries.dec()
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            cache_entries.dec(len(self._entries))
+            self._entries.clear()
+
+
+class InvalidationLog:
+    """
+    Reads the invoice_invalidations table written by the other processes
+    and applies it to this process's cache, at most every sync_seconds.
+    """
+
+    def __init__(self, cache, sync_seconds=INVOICE_CACHE_SYNC_SECONDS, clock=time.monotonic):
+        self.cache = cache
+        self.sync_seconds = sync_seconds
+        self.clock = clock
+        self.last_seq = None
+        self.next_sync = 0.0
+        self._lock = threading.Lock()
+
+    def sync(self, force=False):
+        now = self.clock()
+        if not force and now < self.next_sync:
+            return
+        # One thread reads the log, the others keep serving from the cache
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            with db_util.get_db() as conn:
+                if self.last_seq is None:
+                    # Nothing cached yet, start from the end of the log
+                    self.last_seq = conn.execute("SELECT COALESCE(MAX(Seq), 0) FROM invoice_invalidations").fetchone()[0]
+                    rows = []
+                else:
+                    rows = conn.execute(
+                        "SELECT Seq, InvoiceId FROM invoice_invalidations WHERE Seq > ? ORDER BY Seq",
+                        (self.last_seq,)
+                    ).fetchall()
+            if rows:
+                invoice_ids = {invoice_id for _, invoice_id in rows}
+                # A write that did not say which invoices it changed
+                if None in invoice_ids:
+                    self.cache.clear()
+                else:
+                    self.cache.invalidate(invoice_ids)
+                self.last_seq = rows[-1][0]
+            self.next_sync = now + self.sync_seconds
+        finally:
+            self._lock.release()
+
+
+cache = InvoiceCache()
+invalidation_log = InvalidationLog(cache)
+
+
+"""
+    Read-through lookup of an invoice with its items: served from the cache
+    when possible, otherwise read with db_util.getInvoiceById and cached.
+    The returned dictionary is shared with later callers; do not modify it.
+    Returns:
+        dict | None: The invoice, or None if it does not exist.
+"""
+def get_invoice(invoice_id):
+    record = get_versioned_invoice(invoice_id)
+    return record[0] if record else None
+
+
+"""
+    Same as get_invoice, along with the content version the invoice was
+    read with (see db_util.get_versioned_invoice).
+    Returns:
+        tuple | None: (invoice, (Version, ModifiedAt)), or None.
+"""
+def get_versioned_invoice(invoice_id):
+    if not INVOICE_CACHE_ENABLED:
+        return db_util.get_versioned_invoice(invoice_id)
+    if INVOICE_CACHE_SHARED:
+        invalidation_log.sync()
+    record = cache.get(invoice_id)
+    if record is not None:
+        cache_hits.inc()
+        return record
+    cache_misses.inc()
+    generation = cache.generation
+    record = db_util.get_versioned_invoice(invoice_id)
+    # Unknown ids are not cached, so random lookups cannot fill the cache
+    if record is not None:
+        cache.put(invoice_id, record, generation)
+    return record
+
+
+"""
+    Returns the content version of an invoice, (Version, ModifiedAt), or
+    None if it does not exist: the version of the cached invoice, otherwise
+    one primary key lookup. Neither the items nor the cache counters are
+    touched, so revalidating an unchanged invoice stays cheap.
+"""
+def get_invoice_version(invoice_id):
+    if INVOICE_CACHE_ENABLED:
+        if INVOICE_CACHE_SHARED:
+            invalidation_log.sync()
+        record = cache.get(invoice_id)
+        if record is not None:
+            return record[1]
+    return db_util.get_invoice_version(invoice_id)
+
+
+"""
+    Logs rewritten invoices for the other processes, in the transaction of
+    the write. Called by db_util for every saved invoice and by the MVC
+    sessions (see mvc_model.db); an InvoiceId of None stands for every
+    invoice. Does nothing unless INVOICE_CACHE_SHARED is set.
+"""
+def log_invalidations(cursor, invoice_ids):
+    if not INVOICE_CACHE_SHARED or not invoice_ids:
+        return
+    now = time.time()
+    cursor.executemany(
+        "INSERT INTO invoice_invalidations (InvoiceId, CreatedAt) VALUES (?, ?)",
+        [(invoice_id, now) for invoice_id in invoice_ids]
+    )
+    cursor.execute(
+        "DELETE FROM invoice_invalidations WHERE CreatedAt < ?",
+        (now - INVALIDATION_RETENTION_SECONDS,)
+    )
+
+
+"""
+    Drops rewritten invoices from this process's cache. Called by db_util
+    and the MVC sessions once the write is committed.
+"""
+def invalidate(invoice_ids):
+    cache.invalidate(invoice_ids)
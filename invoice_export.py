@@ -0,0 +1,48 @@
+import argparse
+import json
+import sys
+
+import db_util
+
+"""
+    Streams invoices with their items as NDJSON (one JSON object per line).
+    Used by GET /invoices/export and by the command line entry point below.
+    Parameters:
+        vendor_name (str | None): Only invoices of this vendor.
+        date_from (str | None): Only invoices dated on or after this ISO 8601 date.
+        date_to (str | None): Only invoices dated before this ISO 8601 date.
+    Yields:
+        str: NDJSON text, one chunk per database batch.
+"""
+def iter_ndjson(vendor_name=None, date_from=None, date_to=None, batch_size=1000):
+    encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    for batch in db_util.iter_invoice_batches(vendor_name, date_from, date_to, batch_size):
+        yield "".join(encode(invoice) + "\n" for invoice in batch)
+
+
+"""
+    Command line export for the nightly warehouse load.
+    Usage:
+        python invoice_export.py --db invoices.db --vendor SuperStore --from 2012-01-01 --to 2013-01-01 -o invoices.ndjson
+"""
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export invoices and their items as NDJSON")
+    parser.add_argument("--db", default=db_util.DB_PATH, help="SQLite database file")
+    parser.add_argument("--vendor", help="only invoices of this vendor")
+    parser.add_argument("--from", dest="date_from", help="only invoices dated on or after this ISO 8601 date")
+    parser.add_argument("--to", dest="date_to", help="only invoices dated before this ISO 8601 date")
+    parser.add_argument("-o", "--output", help="output file, defaults to stdout")
+    args = parser.parse_args(argv)
+
+    db_util.DB_PATH = args.db
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for chunk in iter_ndjson(args.vendor, args.date_from, args.date_to):
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == "__main__": # pragma: no cover
+    main()
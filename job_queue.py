@@ -0,0 +1,272 @@
+import json
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+import uuid
+
+from fastapi import HTTPException
+
+import blob_store
+import db_util
+
+# Seconds a claimed job stays reserved for its worker. A job whose worker
+# died is picked up again by another worker once its lease expires.
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+# How many times a job is attempted when OCI is unavailable (503) or overloaded (429)
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# A job put back in the queue waits a random delay between half and all of
+# min(JOB_RETRY_MAX_SECONDS, JOB_RETRY_BASE_SECONDS * 2**(attempts - 1)),
+# or the Retry-After of the error if that is longer, before it is claimed again
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "2"))
+JOB_RETRY_MAX_SECONDS = float(os.getenv("JOB_RETRY_MAX_SECONDS", "60"))
+# Seconds an idle worker waits before polling the queue again
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+"""
+    Adds a PDF to the extraction queue.
+    If the same PDF is already queued or running, the existing job is
+    returned instead of creating a duplicate.
+    Parameters:
+        filename (str): The uploaded file name.
+        pdf_bytes (bytes | StoredDocument): The PDF content, or the PDF
+                                            already put in the blob store,
+                                            which the queue deletes when
+                                            the job ends (or now, for a
+                                            duplicate).
+        pdf_hash (str): Content hash of the PDF, used to detect duplicates.
+    Returns:
+        str: The job id.
+"""
+def submit(filename, pdf_bytes, pdf_hash):
+    now = time.time()
+    with db_util.get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute(
+            "SELECT JobId FROM jobs WHERE PdfHash = ? AND Status IN (?, ?)",
+            (pdf_hash, QUEUED, RUNNING)
+        )
+        row = cursor.fetchone()
+        if not row:
+            job_id = uuid.uuid4().hex
+            # A stored PDF is found again from its object name
+            document_name = None
+            if isinstance(pdf_bytes, blob_store.StoredDocument):
+                document_name, pdf_bytes = pdf_bytes.name, None
+            cursor.execute("""
+                INSERT INTO jobs
+                (JobId, Status, Filename, PdfHash, Document, DocumentName, Attempts, AvailableAt, CreatedAt, UpdatedAt)
+                VALUES (?, ?, ?, ?, ?, ?, 0, ?, ?, ?)
+            """, (job_id, QUEUED, filename, pdf_hash, pdf_bytes, document_name, now, now, now))
+            return job_id
+    # The job already queued for this PDF has its own copy
+    blob_store.delete_document(pdf_bytes)
+    return row[0]
+
+
+"""
+    Retrieves the status of a job.
+    Returns:
+        dict | None: The job status, with "result" once done and "error" /
+                     "statusCode" if it failed, or None if the job does not exist.
+"""
+def get(job_id):
+    with db_util.get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT JobId, Status, Filename, Result, Error, StatusCode, Attempts, CreatedAt, UpdatedAt
+            FROM jobs
+            WHERE JobId = ?
+        """, (job_id,))
+        row = cursor.fetchone()
+    if not row:
+        return None
+    job = {
+        "jobId": row[0],
+        "status": row[1],
+        "filename": row[2],
+        "attempts": row[6],
+        "createdAt": row[7],
+        "updatedAt": row[8],
+    }
+    if row[1] == DONE:
+        job["result"] = json.loads(row[3])
+    if row[1] == FAILED:
+        job["statusCode"] = row[5]
+        job["error"] = json.loads(row[4])
+    return job
+
+
+"""
+    Atomically claims the oldest queued job whose retry delay is over (or a
+    running job whose lease expired) for a worker. Safe to call from
+    several processes at once.
+    Returns:
+        tuple | None: (job_id, pdf_bytes, attempts) or None if the queue is empty;
+                      pdf_bytes is a blob_store.StoredDocument for a stored PDF.
+"""
+def claim(worker_id):
+    now = time.time()
+    with db_util.get_db() as conn:
+        cursor = conn.cursor()
+        # Take the write lock before reading so two workers never claim the same job
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("""
+            SELECT JobId, Document, PdfHash, Attempts, DocumentName
+            FROM jobs
+            WHERE (Status = ? AND AvailableAt <= ?) OR (Status = ? AND LeaseExpiresAt < ?)
+            ORDER BY CreatedAt
+            LIMIT 1
+        """, (QUEUED, now, RUNNING, now))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        cursor.execute("""
+            UPDATE jobs
+            SET Status = ?, WorkerId = ?, Attempts = Attempts + 1,
+                LeaseExpiresAt = ?, UpdatedAt = ?
+            WHERE JobId = ?
+        """, (RUNNING, worker_id, now + JOB_LEASE_SECONDS, now, row[0]))
+    document = row[1] if row[1] is not None else blob_store.StoredDocument(row[2], row[4])
+    return row[0], document, row[3] + 1
+
+
+"""
+    Marks a job as done and stores its result. The PDF is dropped since it
+    is no longer needed.
+"""
+def complete(job_id, result):
+    with db_util.get_db() as conn:
+        conn.execute("""
+            UPDATE jobs
+            SET Status = ?, Result = ?, Document = NULL, UpdatedAt = ?
+            WHERE JobId = ?
+        """, (DONE, json.dumps(result), time.time(), job_id))
+
+
+"""
+    Seconds a job waits before its next attempt: an exponential backoff
+    with jitter, but at least the Retry-After the failure asked for.
+    Parameters:
+        attempts (int): Attempts made so far.
+        retry_after (str | float | None): Retry-After of the failure, in seconds.
+"""
+def retry_delay(attempts, retry_after=None):
+    backoff = min(JOB_RETRY_MAX_SECONDS, JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+    delay = random.uniform(backoff / 2, backoff)
+    try:
+        delay = max(delay, min(JOB_RETRY_MAX_SECONDS, float(retry_after)))
+    except (TypeError, ValueError):
+        pass
+    return delay
+
+
+"""
+    Records a failed attempt. Jobs that failed because OCI was unavailable
+    or overloaded go back to the queue until JOB_MAX_ATTEMPTS is reached,
+    and are not claimed again before retry_delay() has passed.
+    Parameters:
+        retry_after (str | float | None): Retry-After of the failure, in seconds.
+    Returns:
+        bool: True if the job failed for good, False if it will be retried.
+"""
+def fail(job_id, attempts, status_code, error, retry_after=None):
+    retry = status_code in (429, 503) and attempts < JOB_MAX_ATTEMPTS
+    now = time.time()
+    with db_util.get_db() as conn:
+        if retry:
+            conn.execute(
+                "UPDATE jobs SET Status = ?, WorkerId = NULL, AvailableAt = ?, UpdatedAt = ? WHERE JobId = ?",
+                (QUEUED, now + retry_delay(attempts, retry_after), now, job_id)
+            )
+        else:
+            conn.execute("""
+                UPDATE jobs
+                SET Status = ?, StatusCode = ?, Error = ?, Document = NULL, UpdatedAt = ?
+                WHERE JobId = ?
+            """, (FAILED, status_code, json.dumps(error), now, job_id))
+    return not retry
+
+
+"""
+    Claims and processes a single job. The job's PDF, if it is in the blob
+    store, is deleted once the job is done or has failed for good.
+    Parameters:
+        worker_id (str): Identifies the worker holding the lease.
+        process (callable): Takes the PDF bytes and returns the extraction
+                            result, raising HTTPException on failure.
+    Returns:
+        bool: True if a job was processed, False if the queue was empty.
+"""
+def process_next(worker_id, process):
+    claimed = claim(worker_id)
+    if not claimed:
+        return False
+    job_id, pdf_bytes, attempts = claimed
+    try:
+        result = process(pdf_bytes)
+    except HTTPException as e:
+        finished = fail(job_id, attempts, e.status_code, e.detail, (e.headers or {}).get("Retry-After"))
+    except Exception:
+        traceback.print_exc()
+        finished = fail(job_id, attempts, 500, "Failed to process the document")
+    else:
+        complete(job_id, result)
+        finished = True
+    if finished:
+        blob_store.delete_document(pdf_bytes)
+    return True
+
+
+"""
+    Worker loop: processes jobs until stop_event is set, sleeping
+    JOB_POLL_INTERVAL seconds whenever the queue is empty.
+"""
+def run_worker(process, stop_event, worker_id=None):
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{threading.get_ident()}"
+    while not stop_event.is_set():
+        try:
+            if process_next(worker_id, process):
+                continue
+        except Exception:
+            traceback.print_exc()
+        stop_event.wait(JOB_POLL_INTERVAL)
+
+
+"""
+    Starts background worker threads in the current process.
+    Returns:
+        tuple: (stop_event, threads), pass it to stop_workers().
+"""
+def start_workers(count, process):
+    stop_event = threading.Event()
+    threads = []
+    for n in range(count):
+        thread = threading.Thread(
+            target=run_worker,
+            args=(process, stop_event),
+            name=f"job-worker-{n}",
+            daemon=True
+        )
+        thread.start()
+        threads.append(thread)
+    return stop_event, threads
+
+
+"""
+    Signals worker threads started by start_workers() to stop and waits for them.
+"""
+def stop_workers(workers, timeout=None):
+    stop_event, threads = workers
+    stop_event.set()
+    for thread in threads:
+        thread.join(timeout)
@@ -0,0 +1,435 @@
+import bisect
+import contextlib
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# When set, every worker process writes its metrics to this directory and
+# /metrics merges them (uvicorn --workers N): counters and histograms are
+# summed, gauges merged by their multiprocess_mode. Clear the directory on
+# deploy, like prometheus_client's PROMETHEUS_MULTIPROC_DIR.
+MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR", "")
+# Seconds between two snapshots of a worker process in multi-process mode
+FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+
+# Latency buckets in seconds, from a fast DB read to a slow OCI call
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# How the values of a gauge in several worker processes are merged, over
+# the live processes only: summed, their maximum, or one sample per process
+# with a pid label
+GAUGE_MODES = ("livesum", "max", "liveall")
+
+# All metrics created in this process, rendered by render_metrics()
+REGISTRY = []
+
+
+class _Timer(contextlib.ContextDecorator):
+    """Observes the seconds spent in a with block or decorated function."""
+
+    def __init__(self, observe):
+        self._observe = observe
+
+    def _recreate_cm(self):
+        # A fresh timer per call, so a decorated function is thread safe
+        return _Timer(self._observe)
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._observe(time.perf_counter() - self._start)
+        return False
+
+
+class _CounterValue:
+
+    def __init__(self, metric):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def snapshot(self):
+        return self.value
+
+
+class _GaugeValue(_CounterValue):
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set(self, value):
+        with self._lock:
+            self.value = value
+
+    @contextlib.contextmanager
+    def track_inprogress(self):
+        self.inc()
+        try:
+            yield
+        finally:
+            self.dec()
+
+
+class _HistogramValue:
+
+    def __init__(self, metric):
+        self._bounds = metric.buckets
+        # One slot per bucket plus the +Inf bucket, not cumulative
+        self.counts = [0] * (len(metric.buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self._bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self):
+        return _Timer(self.observe)
+
+    def snapshot(self):
+        with self._lock:
+            return [list(self.counts), self.sum]
+
+
+class _Metric:
+    """
+    A metric family: one value per combination of label values.
+    Unlabelled metrics delegate their methods to the single unlabelled value.
+    """
+    type = ""
+    _value_class = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            # Expose unlabelled metrics as 0 before their first update
+            self.labels()
+        REGISTRY.append(self)
+
+    def labels(self, *labelvalues):
+        key = tuple(str(v) for v in labelvalues)
+        value = self._values.get(key)
+        if value is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                value = self._values.setdefault(key, self._value_class(self))
+        return value
+
+    def snapshot(self):
+        return {
+            "type": self.type,
+            "documentation": self.documentation,
+            "labelnames": list(self.labelnames),
+            "samples": [[list(key), value.snapshot()] for key, value in list(self._values.items())],
+        }
+
+
+class Counter(_Metric):
+    """
+    A monotonically increasing counter in the Prometheus text format.
+    """
+    type = "counter"
+    _value_class = _CounterValue
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    @property
+    def value(self):
+        return self.labels().value
+
+
+class Gauge(_Metric):
+    """
+    A value that goes up and down, such as the number of requests in flight.
+    multiprocess_mode (one of GAUGE_MODES) says how the values of several
+    worker processes are merged; a state rather than an amount should not
+    be summed.
+    """
+    type = "gauge"
+    _value_class = _GaugeValue
+
+    def __init__(self, name, documentation, labelnames=(), multiprocess_mode="livesum"):
+        if multiprocess_mode not in GAUGE_MODES:
+            raise ValueError(f"{name}: multiprocess_mode must be one of {GAUGE_MODES}")
+        self.multiprocess_mode = multiprocess_mode
+        super().__init__(name, documentation, labelnames)
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def track_inprogress(self):
+        return self.labels().track_inprogress()
+
+    @property
+    def value(self):
+        return self.labels().value
+
+    def snapshot(self):
+        snapshot = super().snapshot()
+        snapshot["multiprocess_mode"] = self.multiprocess_mode
+        return snapshot
+
+
+class Histogram(_Metric):
+    """
+    Counts observations (usually durations in seconds) in cumulative buckets.
+    """
+    type = "histogram"
+    _value_class = _HistogramValue
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def snapshot(self):
+        snapshot = super().snapshot()
+        snapshot["buckets"] = list(self.buckets)
+        return snapshot
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting HTTP requests by endpoint and status code and
+    tracking the requests in flight. Endpoints are labelled with the name of
+    the handler function, which keeps the label set bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_flight.dec()
+            endpoint = scope.get("endpoint")
+            name = endpoint.__name__ if endpoint else "unmatched"
+            http_requests_total.labels(scope["method"], name, status[0]).inc()
+            http_request_duration.labels(name).observe(time.perf_counter() - start)
+
+
+http_requests_total = Counter(
+    "http_requests_total",
+    "HTTP requests by method, endpoint and status code.",
+    ("method", "endpoint", "status")
+)
+http_requests_in_flight = Gauge(
+    "http_requests_in_flight",
+    "HTTP requests currently being served."
+)
+http_request_duration = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by endpoint.",
+    ("endpoint",)
+)
+
+
+"""
+    Returns the current values of every metric of this process.
+"""
+def snapshot():
+    return {metric.name: metric.snapshot() for metric in REGISTRY}
+
+
+"""
+    Writes this process's snapshot to MULTIPROC_DIR atomically.
+    Parameters:
+        final (bool): Set when the process exits; gauges are reset since
+                      nothing is in flight in a stopped process.
+"""
+def write_snapshot(final=False):
+    data = snapshot()
+    if final:
+        for family in data.values():
+            if family["type"] == "gauge":
+                family["samples"] = []
+    fd, tmp_path = tempfile.mkstemp(dir=MULTIPROC_DIR, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, os.path.join(MULTIPROC_DIR, f"metrics-{os.getpid()}.json"))
+
+
+"""
+    Merges the snapshots of several processes. Counters and histogram
+    buckets are added per label set, including those of stopped processes.
+    Gauges are taken from the live processes only, since a worker that was
+    killed never reset them, and merged by their multiprocess_mode.
+    Parameters:
+        snapshots (dict): The snapshot of each process, by PID.
+"""
+def merge_snapshots(snapshots):
+    merged = {}
+    for pid, data in snapshots.items():
+        alive = _process_alive(pid)
+        for name, family in data.items():
+            mode = family.get("multiprocess_mode", "livesum")
+            target = merged.setdefault(name, dict(family, samples={}))
+            if family["type"] == "gauge" and mode == "liveall":
+                target["labelnames"] = family["labelnames"] + ["pid"]
+            if family["type"] == "gauge" and not alive:
+                continue
+            for key, value in family["samples"]:
+                key = tuple(key)
+                if family["type"] == "gauge" and mode == "liveall":
+                    key += (str(pid),)
+                current = target["samples"].get(key)
+                if current is None:
+                    target["samples"][key] = value
+                elif family["type"] == "histogram":
+                    counts = [a + b for a, b in zip(current[0], value[0])]
+                    target["samples"][key] = [counts, current[1] + value[1]]
+                elif family["type"] == "gauge" and mode == "max":
+                    target["samples"][key] = max(current, value)
+                else:
+                    target["samples"][key] = current + value
+    for family in merged.values():
+        family["samples"] = list(family["samples"].items())
+    return merged
+
+
+def _process_alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Alive, run by another user
+        return True
+    return True
+
+
+"""
+    Collects the metrics to expose: this process only, or every worker
+    process in MULTIPROC_DIR.
+"""
+def collect():
+    if not MULTIPROC_DIR:
+        return snapshot()
+    write_snapshot()
+    snapshots = {}
+    for path in glob.glob(os.path.join(MULTIPROC_DIR, "metrics-*.json")):
+        try:
+            pid = int(os.path.basename(path)[len("metrics-"):-len(".json")])
+            with open(path) as f:
+                snapshots[pid] = json.load(f)
+        except (OSError, ValueError):
+            # A worker replaced its file while we were listing the directory
+            continue
+    return merge_snapshots(snapshots)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _render_family(name, family):
+    lines = [f"# HELP {name} {family['documentation']}", f"# TYPE {name} {family['type']}"]
+    labelnames = family["labelnames"]
+    for key, value in family["samples"]:
+        if family["type"] != "histogram":
+            lines.append(f"{name}{_format_labels(labelnames, key)} {_format_value(value)}")
+            continue
+        counts, total = value
+        cumulative = 0
+        for bound, count in zip(family["buckets"] + ["+Inf"], counts):
+            cumulative += count
+            le = bound if bound == "+Inf" else _format_value(float(bound))
+            lines.append(f"{name}_bucket{_format_labels(labelnames, key, [('le', le)])} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labelnames, key)} {_format_value(float(total))}")
+        lines.append(f"{name}_count{_format_labels(labelnames, key)} {cumulative}")
+    return lines
+
+
+"""
+    Renders every registered metric in the Prometheus text exposition format.
+"""
+def render_metrics():
+    lines = []
+    for name, family in collect().items():
+        lines.extend(_render_family(name, family))
+    return "\n".join(lines) + "\n"
+
+
+"""
+    Starts the background thread that snapshots this process's metrics to
+    MULTIPROC_DIR every FLUSH_INTERVAL seconds. Does nothing in
+    single-process mode.
+    Returns:
+        threading.Event | None: Pass it to stop_flusher() on shutdown.
+"""
+def start_flusher():
+    if not MULTIPROC_DIR:
+        return None
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+    stop_event = threading.Event()
+
+    def flush():
+        while not stop_event.wait(FLUSH_INTERVAL):
+            write_snapshot()
+
+    threading.Thread(target=flush, name="metrics-flusher", daemon=True).start()
+    return stop_event
+
+
+"""
+    Stops the flusher and writes the final snapshot of this process.
+"""
+def stop_flusher(stop_event):
+    if stop_event is None:
+        return
+    stop_event.set()
+    write_snapshot(final=True)
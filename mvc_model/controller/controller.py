@@ -1,41 +1,51 @@
 
 
-import base64
 import time
 
 import oci
-from models.invoice import create_invoice, get_invoice_by_id, get_invoice_by_vendor_name
-from models.item import create_item, get_items_by_invoice_id
-from mvc_model.models.confidence import create_confidence
+import blob_store
+import extraction_cache
+import oci_limiter
+import oci_parser
+import oci_resilience
+import pdf_validation
+from mvc_model.models.reads import (
+    get_invoice_by_id_with_items,
+    get_invoices_by_vendor_name_with_items,
+    get_invoice_dict_with_items,
+    get_invoice_dicts_by_vendor_name,
+)
+from mvc_model.models.extraction import save_extraction
+from mvc_model.db import unit_of_work
 from mvc_model.myAppView import get_doc_client
 
-def get_invoice_with_items(db,invoice_id):
-    invoice = get_invoice_by_id(db,invoice_id)
+# Pass as_dict=True when the result is only serialized: the invoices and
+# items come back as plain dictionaries, with no ORM instances to build.
+
+def get_invoice_with_items(db,invoice_id, as_dict=False):
+    if as_dict:
+        return get_invoice_dict_with_items(db, invoice_id)
+    # The invoice and its items in one query
+    invoice = get_invoice_by_id_with_items(db,invoice_id)
     if invoice : 
-        items = get_items_by_invoice_id (db,invoice_id)
         invoice_with_items = {
             "invoice" : invoice,
-            "items" : items
+            "items" : invoice.items
         } 
         return invoice_with_items
     return None
 
     
-def getInvoiceByVendorNameCon(db,vendor_name):
-    myinvoices = []
-    invoices = get_invoice_by_vendor_name(db,vendor_name)
-    if invoices : 
-        for invoice in invoices:
-            invoice_id = invoice.InvoiceId
-            items = get_items_by_invoice_id(db,invoice_id)
-            invoice_with_items = {
-                "invoice" : invoice,
-                "items" : items
-            } 
-            myinvoices.append(invoice_with_items)
+def getInvoiceByVendorNameCon(db,vendor_name, as_dict=False):
+    if as_dict:
+        myinvoices = get_invoice_dicts_by_vendor_name(db, vendor_name)
+    else:
+        # Items are loaded with the invoices, not with one query per invoice
+        invoices = get_invoices_by_vendor_name_with_items(db,vendor_name)
+        myinvoices = [{"invoice" : invoice, "items" : invoice.items} for invoice in invoices]
             
-    return {"VendorName": vendor_name if invoices else "Unknown Vendor",
-            "TotalInvoices": len(invoices),
+    return {"VendorName": vendor_name if myinvoices else "Unknown Vendor",
+            "TotalInvoices": len(myinvoices),
             "invoices":myinvoices}
    
 
@@ -45,6 +55,12 @@ class InvalidPDFError(Exception):
 
 
 class ServiceUnavailableError(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TooManyRequestsError(ServiceUnavailableError):
     pass
 
 
@@ -52,82 +68,63 @@ class LowConfidenceError(Exception):
     pass
 
 
-def extract_invoice_controller(db, pdf_bytes: bytes) -> dict:
-    # 1) Encode PDF to base64
-    encoded_pdf = base64.b64encode(pdf_bytes).decode("utf-8")
-
+def extract_invoice_controller(db, pdf_bytes: bytes, force_extract: bool = False) -> dict:
+    # Reject malformed, encrypted and oversized PDFs before calling OCI
+    try:
+        pdf_validation.validate_pdf(pdf_bytes)
+    except pdf_validation.InvalidPDF as e:
+        raise InvalidPDFError(f"Invalid document: {e}. Please upload a valid PDF invoice.")
+
+    # 0) Repeat uploads are answered from the extraction cache. The result is
+    #    saved again: the cache lives in db_util's database, which need not be
+    #    the MVC one, and the invoice may have been deleted since. Saving an
+    #    unchanged invoice writes nothing.
+    cache_key = extraction_cache.pdf_hash(pdf_bytes)
+    cached = None if force_extract else extraction_cache.get(cache_key)
+    if cached:
+        cached["predictionTime"] = 0.0
+        _save_result(db, cached)
+        return cached
+
+    # 1) Encode PDF to base64, or store a large PDF and send a reference to
+    #    it, deleted once the call is over
     # 2) Build OCI request
-    document = oci.ai_document.models.InlineDocumentDetails(data=encoded_pdf)
-    request = oci.ai_document.models.AnalyzeDocumentDetails(
-        document=document,
-        features=[
-            oci.ai_document.models.DocumentFeature(feature_type="KEY_VALUE_EXTRACTION"),
-            oci.ai_document.models.DocumentClassificationFeature(max_results=5),
-        ],
-    )
-
-    # 3) Call OCI service + measure time
+    # 3) Call OCI service + measure time, sharing the app's concurrency
+    #    limit, retries and circuit breaker
     try:
-        start_time = time.time()
-        client = get_doc_client()
-        response = client.analyze_document(request)
-        prediction_time = time.time() - start_time
+        with blob_store.stored_for_call(pdf_bytes) as stored:
+            if blob_store.by_reference(stored):
+                document = blob_store.reference_details(stored)
+            else:
+                document = blob_store.inline_details(stored)
+            request = oci.ai_document.models.AnalyzeDocumentDetails(
+                document=document,
+                features=[
+                    oci.ai_document.models.DocumentFeature(feature_type="KEY_VALUE_EXTRACTION"),
+                    oci.ai_document.models.DocumentClassificationFeature(max_results=5),
+                ],
+            )
+            with oci_limiter.limiter.slot():
+                start_time = time.time()
+                client = get_doc_client()
+                response = oci_resilience.call(client.analyze_document, request)
+                prediction_time = time.time() - start_time
+    except oci_limiter.Overloaded as e:
+        error = TooManyRequestsError if e.status_code == 429 else ServiceUnavailableError
+        raise error("The service is currently unavailable. Please try again later.", e.retry_after)
+    except oci_resilience.CircuitOpenError as e:
+        raise ServiceUnavailableError("The service is currently unavailable. Please try again later.", e.retry_after)
     except Exception:
         raise ServiceUnavailableError("The service is currently unavailable. Please try again later.")
 
     # 4) Parse OCI response
-    data = {}
-    data_confidence = {}
-    all_items = []
-
-    for page in response.data.pages:
-        if not page.document_fields:
-            continue
-
-        for myfield in page.document_fields:
-            field_key = myfield.field_label.name if myfield.field_label and myfield.field_label.name else ""
-            field_value = myfield.field_value.text if myfield.field_value and myfield.field_value.text else ""
-
-            if field_key == "InvoiceDate":
-                field_value = format_date_to_iso(field_value)
-
-            if field_key in ("InvoiceTotal", "SubTotal", "ShippingCost", "Amount", "UnitPrice", "AmountDue"):
-                field_value = clean_amount(field_key, field_value)
-
-            field_conf = (
-                myfield.field_label.confidence
-                if myfield.field_label and myfield.field_label.confidence is not None
-                else 0.0
-            )
-
-            # Items special handling
-            if field_key == "Items":
-                all_items = []
-                for i in myfield.field_value.items:
-                    item = {}
-                    for j in i.field_value.items:
-                        item_key = j.field_label.name if j.field_label else ""
-                        item_value = j.field_value.text if j.field_value and j.field_value.text else ""
-
-                        if item_key in ("Quantity", "UnitPrice", "Amount"):
-                            item_value = clean_amount(item_key, item_value)
-
-                        item[item_key] = item_value
-
-                    all_items.append(item)
-
-                field_value = all_items
-
-            data[field_key] = field_value
-            data_confidence[field_key] = field_conf
+    data, data_confidence = oci_parser.parse_fields(response)
 
     # 5) Validate doc type confidence threshold
-    doc_confidence = 0.0
-    if response.data.detected_document_types:
-        for validCon in response.data.detected_document_types:
-            doc_confidence = validCon.confidence
-            if doc_confidence < 0.9:
-                raise LowConfidenceError("Invalid document. Please upload a valid PDF invoice with high confidence.")
+    try:
+        doc_confidence = oci_parser.document_confidence(response)
+    except oci_parser.LowConfidence:
+        raise LowConfidenceError("Invalid document. Please upload a valid PDF invoice with high confidence.")
 
     # 6) Build result
     result = {
@@ -137,107 +134,31 @@ def extract_invoice_controller(db, pdf_bytes: bytes) -> dict:
         "predictionTime": prediction_time,
     }
 
-    # 7) Save to DB using models (CRUD)
-    #    - Create invoice
-    invoice_obj = create_invoice(db, data)
-
-    #    - Create items (if exist)
-    for item_dict in data.get("Items", []):
-        item_dict["InvoiceId"] = invoice_obj.InvoiceId
-        create_item(db, item_dict)
-
-    #    - Create confidence row
-    create_confidence(
-        db,
-        {
-            "InvoiceId": invoice_obj.InvoiceId,
-            "VendorName": data_confidence.get("VendorName", 0.0),
-            "InvoiceDate": data_confidence.get("InvoiceDate", 0.0),
-            "BillingAddressRecipient": data_confidence.get("BillingAddressRecipient", 0.0),
-            "ShippingAddress": data_confidence.get("ShippingAddress", 0.0),
-            "SubTotal": data_confidence.get("SubTotal", 0.0),
-            "ShippingCost": data_confidence.get("ShippingCost", 0.0),
-            "InvoiceTotal": data_confidence.get("InvoiceTotal", 0.0),
-        },
-    )
-
-    return result
-
-
+    # 7) Save to DB in one transaction owned by the controller
+    _save_result(db, result)
 
-###################################################Cleaner Functions################################## 
-"""
-    Converts a date string to ISO 8601 format with UTC timezone.
-    Returns empty string if conversion fails.
-"""
-from datetime import date, datetime, timezone
+    #    - Remember the parsed result for repeat uploads
+    extraction_cache.put(cache_key, result)
 
-def format_date_to_iso(date_text):
-    if date_text is None:
-        return ""
-
-    # If already a datetime/date object
-    if isinstance(date_text, datetime):
-        dt = date_text
-        if dt.tzinfo is None:
-            dt = dt.replace(tzinfo=timezone.utc)
-        return dt.astimezone(timezone.utc).isoformat()
-    if isinstance(date_text, date) and not isinstance(date_text, datetime):
-        dt = datetime(date_text.year, date_text.month, date_text.day, tzinfo=timezone.utc)
-        return dt.isoformat()
+    return result
 
-    s = str(date_text).strip()
-    if not s:
-        return ""
 
-    # Already ISO (with timezone or Z)
-    try:
-        if "T" in s:
-            dt = datetime.fromisoformat(s.replace("Z", "+00:00"))
-            if dt.tzinfo is None:
-                dt = dt.replace(tzinfo=timezone.utc)
-            return dt.astimezone(timezone.utc).isoformat()
-    except ValueError:
-        pass
-
-    # Try multiple common formats
-    fmts = [
-        "%B %d %Y",   # March 6, 2012
-        "%b %d %Y",   # Mar 6, 2012
-        "%m/%d/%Y",    # 03/06/2012
-        "%m/%d/%y",    # 03/06/12
-        "%m-%d-%Y",    # 03-06-2012
-        "%Y-%m-%d",    # 2012-03-06
-        "%d/%m/%Y",    # 06/03/2012 (if OCR outputs this)
-        "%d-%b-%Y",    # 06-Mar-2012
-        "%d %b %Y",    # 06 Mar 2012
-    ]
-
-    for fmt in fmts:
-        try:
-            dt = datetime.strptime(s, fmt)
-            return dt.replace(tzinfo=timezone.utc).isoformat()
-        except ValueError:
-            continue
-
-    # If nothing matched, keep old behavior
-    return ""
-
-"""
-    Removes currency symbols and formatting from amount strings.
-    Returns float or empty string if invalid.
-"""  
-def clean_amount(key,value): 
-
-    if not value:
-        return ""
-    try:
-        if key == "Quantity":
-            return int(
-            value.replace("$", "").replace(",", "").strip()
-        )
-        return float(
-            value.replace("$", "").replace(",", "").strip()
+def _save_result(db, result):
+    # Invoice, confidence row (upserts) and all items (bulk insert), one commit
+    data, data_confidence = result["data"], result["dataConfidence"]
+    with unit_of_work(db):
+        save_extraction(
+            db,
+            data,
+            data.get("Items", []),
+            {
+                "VendorName": data_confidence.get("VendorName", 0.0),
+                "InvoiceDate": data_confidence.get("InvoiceDate", 0.0),
+                "BillingAddressRecipient": data_confidence.get("BillingAddressRecipient", 0.0),
+                "ShippingAddress": data_confidence.get("ShippingAddress", 0.0),
+                "SubTotal": data_confidence.get("SubTotal", 0.0),
+                "ShippingCost": data_confidence.get("ShippingCost", 0.0),
+                "InvoiceTotal": data_confidence.get("InvoiceTotal", 0.0),
+            },
+            commit=False,
         )
-    except ValueError:
-        return ""
\ No newline at end of file
@@ -0,0 +1,227 @@
+import os
+from contextlib import contextmanager
+from itertools import chain
+
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import db_util
+import invoice_cache
+
+# Database of the MVC layer, the same SQLite file as db_util by default
+MVC_DATABASE_URL = os.getenv("MVC_DATABASE_URL", f"sqlite:///{db_util.DB_PATH}")
+# Connections kept open, and extra ones opened under load and closed after use
+MVC_DB_POOL_SIZE = int(os.getenv("MVC_DB_POOL_SIZE", "8"))
+MVC_DB_MAX_OVERFLOW = int(os.getenv("MVC_DB_MAX_OVERFLOW", "8"))
+# Seconds a request waits for a free connection before failing
+MVC_DB_POOL_TIMEOUT = float(os.getenv("MVC_DB_POOL_TIMEOUT", "10"))
+# Connections older than this many seconds are replaced on checkout
+MVC_DB_POOL_RECYCLE = int(os.getenv("MVC_DB_POOL_RECYCLE", "1800"))
+
+
+def create_db_engine(url: str = MVC_DATABASE_URL):
+    """
+    Creates the engine of the MVC layer with a bounded connection pool.
+    SQLite connections get the pragmas of db_util.DB_SETTINGS (WAL, busy
+    timeout, page cache) and may be used from any thread, since a request's
+    session can move between the threads of the server's pool. An in-memory
+    SQLite database shares its one connection.
+    """
+    if not url.startswith("sqlite"):
+        return create_engine(
+            url,
+            pool_size=MVC_DB_POOL_SIZE,
+            max_overflow=MVC_DB_MAX_OVERFLOW,
+            pool_timeout=MVC_DB_POOL_TIMEOUT,
+            pool_recycle=MVC_DB_POOL_RECYCLE,
+            # Network databases drop idle connections
+            pool_pre_ping=True,
+        )
+    if url in ("sqlite://", "sqlite:///:memory:"):
+        engine = create_engine(url, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    else:
+        # A local file cannot drop a connection, so no pre-ping round trip
+        engine = create_engine(
+            url,
+            connect_args={"check_same_thread": False, "timeout": db_util.DB_SETTINGS["busy_timeout_ms"] / 1000},
+            pool_size=MVC_DB_POOL_SIZE,
+            max_overflow=MVC_DB_MAX_OVERFLOW,
+            pool_timeout=MVC_DB_POOL_TIMEOUT,
+            pool_recycle=MVC_DB_POOL_RECYCLE,
+        )
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+    return engine
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    settings = db_util.DB_SETTINGS
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout = {int(settings['busy_timeout_ms'])}")
+    cursor.execute(f"PRAGMA journal_mode = {settings['journal_mode'].upper()}")
+    cursor.execute(f"PRAGMA synchronous = {settings['synchronous'].upper()}")
+    cursor.execute(f"PRAGMA cache_size = {int(settings['cache_size'])}")
+    # Whether the database has db_util's versioned schema, for
+    # _bump_invoice_versions
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(invoices)")]
+    connection_record.info["versioned_invoices"] = "Version" in columns
+    cursor.close()
+
+
+engine = create_db_engine()
+# expire_on_commit=False: objects stay readable after the commit without
+# one SELECT each to reload them
+SessionLocal = sessionmaker(bind=engine, expire_on_commit=False)
+
+
+def get_db():
+    """
+    FastAPI dependency giving each request its own session, closed (and
+    its connection returned to the pool) when the request is done:
+
+        def view(db: Session = Depends(get_db)): ...
+
+    Work left uncommitted when the request fails is rolled back.
+    """
+    db = SessionLocal()
+    try:
+        yield db
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+@contextmanager
+def unit_of_work(db: Session):
+    """
+    Commits the work done in the block once, or rolls it all back if the
+    block raises. CRUD helpers called inside it with commit=False join
+    the transaction instead of committing on their own.
+    """
+    try:
+        yield db
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+
+
+# Tables whose rows make up the invoices cached by invoice_cache
+_INVOICE_TABLES = ("invoices", "items")
+
+
+@event.listens_for(Session, "after_flush")
+def _track_flushed_invoices(session, flush_context):
+    """Remembers the invoices whose rows or items a flush wrote."""
+    written = session.info.setdefault("written_invoice_ids", set())
+    items_written = session.info.setdefault("item_invoice_ids", set())
+    for instance in chain(session.new, session.dirty, session.deleted):
+        table = getattr(instance, "__tablename__", None)
+        if table in _INVOICE_TABLES:
+            # The old InvoiceId too, for an item moved to another invoice
+            invoice_ids = inspect(instance).attrs.InvoiceId.history.sum()
+            written.update(invoice_ids)
+            if table == "items":
+                items_written.update(invoice_ids)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_invoice_statements(orm_execute_state):
+    """
+    Remembers the invoices written by INSERT, UPDATE and DELETE statements,
+    from their InvoiceId parameters. A statement without one may have
+    written any invoice, which is remembered as None.
+    """
+    state = orm_execute_state
+    if not (state.is_insert or state.is_update or state.is_delete):
+        return
+    # The caller reports what the statement changed with track_invoice_writes
+    if state.execution_options.get("untracked_invoice_write"):
+        return
+    if state.statement.table.name not in _INVOICE_TABLES:
+        return
+    rows = state.parameters if isinstance(state.parameters, list) else [state.parameters or {}]
+    invoice_ids = {row.get("InvoiceId") for row in rows}
+    state.session.info.setdefault("written_invoice_ids", set()).update(invoice_ids)
+    if state.statement.table.name == "items":
+        state.session.info.setdefault("item_invoice_ids", set()).update(invoice_ids)
+
+
+def track_invoice_writes(session: Session, invoice_ids, row_changed: bool = False):
+    """
+    Remembers invoices written by a statement run with the
+    untracked_invoice_write execution option, e.g. an upsert that only
+    writes what changed, so the invoice cache drops them on commit. With
+    row_changed, their invoices rows changed and the triggers already
+    bumped their versions, which writes of their items then leave alone.
+    """
+    session.info.setdefault("written_invoice_ids", set()).update(invoice_ids)
+    if row_changed:
+        session.info.setdefault("versioned_invoice_ids", set()).update(invoice_ids)
+
+
+@event.listens_for(Session, "before_commit")
+def _bump_invoice_versions(session):
+    """
+    Bumps the content version of the invoices whose items were written, once
+    per commit, in a database with db_util's versioned schema. Invoice rows
+    are versioned by db_util's triggers.
+    """
+    if session.get_bind().dialect.name != "sqlite":
+        return
+    # The last flush of the commit happens after this hook
+    session.flush()
+    invoice_ids = session.info.get("item_invoice_ids", set()) - session.info.get("versioned_invoice_ids", set())
+    if not invoice_ids:
+        return
+    connection = session.connection()
+    if not connection.info.get("versioned_invoices"):
+        return
+    cursor = connection.connection.cursor()
+    try:
+        db_util.bump_invoice_versions(cursor, None if None in invoice_ids else sorted(invoice_ids))
+    finally:
+        cursor.close()
+
+
+@event.listens_for(Session, "before_commit")
+def _log_invoice_writes(session):
+    """With INVOICE_CACHE_SHARED, logs the written invoices for the other processes, in the transaction."""
+    if not invoice_cache.INVOICE_CACHE_SHARED or session.get_bind().dialect.name != "sqlite":
+        return
+    # The last flush of the commit happens after this hook
+    session.flush()
+    written = session.info.get("written_invoice_ids")
+    if written:
+        cursor = session.connection().connection.cursor()
+        try:
+            invoice_cache.log_invalidations(cursor, sorted(written, key=str))
+        finally:
+            cursor.close()
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_invoice_cache(session):
+    """
+    Drops the written invoices from the app's invoice cache once they are
+    committed, as db_util does; all of them if a statement did not say
+    which invoices it wrote.
+    """
+    session.info.pop("item_invoice_ids", None)
+    session.info.pop("versioned_invoice_ids", None)
+    written = session.info.pop("written_invoice_ids", None)
+    if not written:
+        return
+    if None in written:
+        invoice_cache.cache.clear()
+    else:
+        invoice_cache.invalidate(written)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_invoice_writes(session):
+    session.info.pop("written_invoice_ids", None)
+    session.info.pop("item_invoice_ids", None)
+    session.info.pop("versioned_invoice_ids", None)
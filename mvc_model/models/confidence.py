@@ -1,10 +1,10 @@
 # models.py
 from typing import List, Optional
-from pytest import Session
+from sqlalchemy.orm import Session
 from sqlalchemy import Column, String, Integer, Float, ForeignKey
 from sqlalchemy.orm import relationship
 # All models inherit from this base class
-from base import Base
+from mvc_model.models.base import Base
 class Confidence(Base):
     __tablename__ = 'confidences'
     
@@ -20,7 +20,7 @@ class Confidence(Base):
     invoice = relationship("Invoice", back_populates="confidences")
 
     #---------------------------------------CRUD------------------------------------#
-def create_confidence(db: Session, confidence_data: dict) -> Confidence:
+def create_confidence(db: Session, confidence_data: dict, commit: bool = True) -> Confidence:
     confidence = Confidence(
         InvoiceId=confidence_data.get("InvoiceId"),
         VendorName=confidence_data.get("VendorName"),
@@ -32,20 +32,22 @@ def create_confidence(db: Session, confidence_data: dict) -> Confidence:
         InvoiceTotal=confidence_data.get("InvoiceTotal"),
     )
     db.add(confidence)
-    db.commit()
-    db.refresh(confidence)
+    # With commit=False the caller commits (see mvc_model.db.unit_of_work)
+    if commit:
+        db.commit()
     return confidence
 
 
 def get_confidence_by_invoice_id(db: Session, invoice_id: str) -> Optional[Confidence]:
-    return db.query(Confidence).filter(Confidence.InvoiceId == invoice_id).first()
+    # Served from the session's identity map when already loaded
+    return db.get(Confidence, invoice_id)
 
 
 def get_confidences(db: Session, skip: int = 0, limit: int = 100) -> List[Confidence]:
     return db.query(Confidence).offset(skip).limit(limit).all()
 
 
-def update_confidence(db: Session, invoice_id: str, update_data: dict) -> Optional[Confidence]:
+def update_confidence(db: Session, invoice_id: str, update_data: dict, commit: bool = True) -> Optional[Confidence]:
     confidence = get_confidence_by_invoice_id(db, invoice_id)
     if not confidence:
         return None
@@ -65,16 +67,17 @@ def update_confidence(db: Session, invoice_id: str, update_data: dict) -> Option
     if "InvoiceTotal" in update_data:
         confidence.InvoiceTotal = update_data["InvoiceTotal"]
 
-    db.commit()
-    db.refresh(confidence)
+    if commit:
+        db.commit()
     return confidence
 
 
-def delete_confidence(db: Session, invoice_id: str) -> bool:
+def delete_confidence(db: Session, invoice_id: str, commit: bool = True) -> bool:
     confidence = get_confidence_by_invoice_id(db, invoice_id)
     if not confidence:
         return False
 
     db.delete(confidence)
-    db.commit()
+    if commit:
+        db.commit()
     return True
\ No newline at end of file
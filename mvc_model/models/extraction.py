@@ -0,0 +1,89 @@
+from typing import List
+from sqlalchemy import bindparam, delete, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from mvc_model.models.invoice import Invoice
+from mvc_model.models.item import Item, create_items
+from mvc_model.models.confidence import Confidence
+from mvc_model.db import track_invoice_writes
+
+# Stored values of an item, compared to tell whether a save changes them
+_ITEM_FIELDS = ("Description", "Name", "Quantity", "UnitPrice", "Amount")
+
+#---------------------------------------BULK WRITE------------------------------------#
+def save_extraction(db: Session, invoice_data: dict, items_data: List[dict], confidence_data: dict,
+                    commit: bool = True) -> Invoice:
+    """
+    Persists an extracted invoice, its confidences and all of its items
+    with a single commit. Like db_util.save_inv_extraction, saving an
+    InvoiceId again replaces it: the invoice and its confidences are
+    upserted and, if they differ, its old items deleted before one bulk
+    INSERT of the new ones. Only what changed is written, so saving the
+    same extraction again keeps the invoice's version and its entry in the
+    invoice cache. With commit=False the caller commits, e.g. in
+    mvc_model.db.unit_of_work.
+    """
+    invoice_id = invoice_data.get("InvoiceId")
+    invoice = _upsert(db, Invoice, {
+        "InvoiceId": invoice_id,
+        "VendorName": invoice_data.get("VendorName"),
+        "InvoiceDate": invoice_data.get("InvoiceDate"),
+        "BillingAddressRecipient": invoice_data.get("BillingAddressRecipient"),
+        "ShippingAddress": invoice_data.get("ShippingAddress"),
+        "SubTotal": invoice_data.get("SubTotal"),
+        "ShippingCost": invoice_data.get("ShippingCost"),
+        "InvoiceTotal": invoice_data.get("InvoiceTotal"),
+    }, execution_options={"untracked_invoice_write": True})
+    if invoice is None:
+        invoice = db.get(Invoice, invoice_id)
+    else:
+        track_invoice_writes(db, [invoice_id], row_changed=True)
+    _upsert(db, Confidence, {
+        "InvoiceId": invoice_id,
+        "VendorName": confidence_data.get("VendorName"),
+        "InvoiceDate": confidence_data.get("InvoiceDate"),
+        "BillingAddressRecipient": confidence_data.get("BillingAddressRecipient"),
+        "ShippingAddress": confidence_data.get("ShippingAddress"),
+        "SubTotal": confidence_data.get("SubTotal"),
+        "ShippingCost": confidence_data.get("ShippingCost"),
+        "InvoiceTotal": confidence_data.get("InvoiceTotal"),
+    })
+
+    new_items = [tuple(item_data.get(field) for field in _ITEM_FIELDS) for item_data in items_data]
+    old_items = db.execute(
+        select(*(getattr(Item, field) for field in _ITEM_FIELDS))
+        .where(Item.InvoiceId == invoice_id)
+        .order_by(Item.id)
+    ).all()
+    if [tuple(row) for row in old_items] != new_items:
+        # InvoiceId passed as a parameter, so the session knows which invoice
+        # to drop from the invoice cache (see mvc_model.db)
+        db.execute(delete(Item).where(Item.InvoiceId == bindparam("InvoiceId")), {"InvoiceId": invoice_id})
+        create_items(db, invoice_id, items_data, commit=False)
+        # A loaded items collection no longer matches the table
+        db.expire(invoice, ["items"])
+    if commit:
+        db.commit()
+    return invoice
+
+
+def _upsert(db: Session, model, row: dict, execution_options: dict = None):
+    """
+    INSERT ... ON CONFLICT (primary key) DO UPDATE of one row, in SQLite or
+    PostgreSQL, updating the stored row only if one of its values differs.
+    Returns the instance, refreshed if already in the session, or None if
+    the stored row was left as it was.
+    """
+    insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    stmt = insert(model)
+    key = [column.name for column in model.__table__.primary_key]
+    stmt = stmt.on_conflict_do_update(
+        index_elements=key,
+        set_={name: stmt.excluded[name] for name in row if name not in key},
+        where=or_(*(
+            model.__table__.c[name].is_distinct_from(stmt.excluded[name]) for name in row if name not in key
+        )),
+    )
+    return db.scalars(
+        stmt.returning(model), [row], execution_options={"populate_existing": True, **(execution_options or {})}
+    ).one_or_none()
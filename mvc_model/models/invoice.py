@@ -1,11 +1,11 @@
 # models.py
 from typing import List, Optional
-from pytest import Session
-from sqlalchemy import Column, String, Integer, Float, ForeignKey
+from sqlalchemy.orm import Session
+from sqlalchemy import Column, String, Integer, Float, ForeignKey, Index
 from sqlalchemy.orm import relationship
 
 # All models inherit from this base class
-from base import Base
+from mvc_model.models.base import Base
 
 
 class Invoice(Base):
@@ -15,6 +15,8 @@ class Invoice(Base):
     This replaces: CREATE TABLE invoices (...)
     """
     __tablename__ = 'invoices'
+    # Same index as db_util.init_db, for vendor lookups
+    __table_args__ = (Index("idx_invoices_vendor_date_id", "VendorName", "InvoiceDate", "InvoiceId"),)
     
     InvoiceId = Column(String, primary_key=True)
     VendorName = Column(String)
@@ -27,10 +29,10 @@ class Invoice(Base):
     
     # Relationships
     confidences = relationship("Confidence", back_populates="invoice")
-    items = relationship("Item", back_populates="invoice")
+    items = relationship("Item", back_populates="invoice", order_by="Item.id")
 
 #---------------------------------CRUD-----------------------------------#
-def create_invoice(db: Session, invoice_data: dict) -> Invoice:
+def create_invoice(db: Session, invoice_data: dict, commit: bool = True) -> Invoice:
     invoice= Invoice(
         InvoiceId=invoice_data.get("InvoiceId"),
         VendorName=invoice_data.get("VendorName"),
@@ -42,13 +44,15 @@ def create_invoice(db: Session, invoice_data: dict) -> Invoice:
         InvoiceTotal=invoice_data.get("InvoiceTotal"))
     
     db.add(invoice)
-    db.commit()
-    db.refresh(invoice)
+    # With commit=False the caller commits (see mvc_model.db.unit_of_work)
+    if commit:
+        db.commit()
     return invoice
 
 
 def get_invoice_by_id(db: Session, invoice_id: str) -> Optional[Invoice]:
-    invoice=db.query(Invoice).filter(Invoice.InvoiceId==invoice_id).first()
+    # Served from the session's identity map when already loaded
+    invoice=db.get(Invoice, invoice_id)
     return invoice
 
 def get_invoice_by_vendor_name(db: Session, vendor_name: str) -> List[Invoice]:
@@ -60,7 +64,7 @@ def get_invoices(db: Session) -> List[Invoice]:
     return invoices
 
 
-def update_invoice(db: Session, invoice_id: str, update_data: dict) -> Optional[Invoice]:
+def update_invoice(db: Session, invoice_id: str, update_data: dict, commit: bool = True) -> Optional[Invoice]:
     invoice = get_invoice_by_id(db, invoice_id)
     if not invoice:
         return None
@@ -80,16 +84,17 @@ def update_invoice(db: Session, invoice_id: str, update_data: dict) -> Optional[
     if "InvoiceTotal" in update_data:
         invoice.InvoiceTotal = update_data["InvoiceTotal"]
 
-    db.commit()
-    db.refresh(invoice)
+    if commit:
+        db.commit()
     return invoice
 
 
-def delete_invoice(db: Session, invoice_id: str) -> bool:
+def delete_invoice(db: Session, invoice_id: str, commit: bool = True) -> bool:
     invoice = get_invoice_by_id(db, invoice_id)
     if  invoice:
         db.delete(invoice)
-        db.commit()
+        if commit:
+            db.commit()
         return True
     return False
         
\ No newline at end of file
@@ -1,14 +1,16 @@
 # models.py
 from typing import List, Optional
-from pytest import Session
-from sqlalchemy import Column, String, Integer, Float, ForeignKey
+from sqlalchemy.orm import Session
+from sqlalchemy import Column, String, Integer, Float, ForeignKey, Index, insert
 from sqlalchemy.orm import relationship
 # All models inherit from this base class
-from base import Base
-from models.invoice import get_invoice_by_id
+from mvc_model.models.base import Base
+from mvc_model.models.invoice import get_invoice_by_id
 
 class Item(Base):
     __tablename__ = 'items'
+    # Same index as db_util.init_db, for the items of an invoice
+    __table_args__ = (Index("idx_items_invoice_id", "InvoiceId"),)
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     InvoiceId = Column(String, ForeignKey('invoices.InvoiceId'))
@@ -20,7 +22,7 @@ class Item(Base):
     
     invoice = relationship("Invoice", back_populates="items")
 
-def create_item(db: Session, item_data: dict) -> Item:
+def create_item(db: Session, item_data: dict, commit: bool = True) -> Item:
     invoice = get_invoice_by_id(db,item_data.get("InvoiceId"))
     if invoice :
         item = Item(
@@ -32,12 +34,34 @@ def create_item(db: Session, item_data: dict) -> Item:
             Amount =  item_data.get("Amount")
         )
         db.add(item)
-        db.commit()
+        # With commit=False the caller commits (see mvc_model.db.unit_of_work)
+        if commit:
+            db.commit()
         return item
     return None
 
 
 
+def create_items(db: Session, invoice_id: str, items_data: List[dict], commit: bool = True) -> int:
+    # One bulk INSERT (executemany) for all the items of an invoice
+    rows = [
+        {
+            "InvoiceId": invoice_id,
+            "Description": item_data.get("Description"),
+            "Name": item_data.get("Name"),
+            "Quantity": item_data.get("Quantity"),
+            "UnitPrice": item_data.get("UnitPrice"),
+            "Amount": item_data.get("Amount"),
+        }
+        for item_data in items_data
+    ]
+    if rows:
+        db.execute(insert(Item), rows)
+    if commit:
+        db.commit()
+    return len(rows)
+
+
 def get_item_by_id(db: Session, item_id: int) -> Optional[Item]:
     item = db.query(Item).filter(Item.InvoiceId==item_id).first()
     return item
@@ -53,7 +77,7 @@ def get_items(db: Session) -> List[Item]:
      return items
 
 
-def update_item(db: Session, item_id: int, update_data: dict) -> Optional[Item]:
+def update_item(db: Session, item_id: int, update_data: dict, commit: bool = True) -> Optional[Item]:
     item = get_item_by_id(db, item_id)
     if not item:
         return None
@@ -71,16 +95,17 @@ def update_item(db: Session, item_id: int, update_data: dict) -> Optional[Item]:
     if "Amount" in update_data:
         item.Amount = update_data["Amount"]
 
-    db.commit()
-    db.refresh(item)
+    if commit:
+        db.commit()
     return item
 
 
 
-def delete_item(db: Session, item_id: int) -> bool:
+def delete_item(db: Session, item_id: int, commit: bool = True) -> bool:
     item = get_item_by_id(db,item_id)
     if item : 
         db.delete(item)
-        db.commit()
+        if commit:
+            db.commit()
         return True
     return False
\ No newline at end of file
@@ -0,0 +1,71 @@
+from typing import List, Optional
+from sqlalchemy import select
+from sqlalchemy.orm import Session, joinedload, selectinload
+from mvc_model.models.invoice import Invoice
+from mvc_model.models.item import Item
+
+#---------------------------------------BULK READ------------------------------------#
+def get_invoice_by_id_with_items(db: Session, invoice_id: str) -> Optional[Invoice]:
+    """
+    Loads an invoice and its items in one query (LEFT OUTER JOIN).
+    """
+    return db.scalars(
+        select(Invoice)
+        .where(Invoice.InvoiceId == invoice_id)
+        .options(joinedload(Invoice.items))
+    ).unique().first()
+
+
+def get_invoices_by_vendor_name_with_items(db: Session, vendor_name: str) -> List[Invoice]:
+    """
+    Loads a vendor's invoices with their items: one query for the invoices
+    and one per 500 invoices for the items (selectin loading), instead of
+    one query per invoice.
+    """
+    return db.scalars(
+        select(Invoice)
+        .where(Invoice.VendorName == vendor_name)
+        .options(selectinload(Invoice.items))
+    ).all()
+
+
+def get_invoice_dict_with_items(db: Session, invoice_id: str) -> Optional[dict]:
+    """
+    Same as get_invoice_by_id_with_items as plain dictionaries,
+    {"invoice": {...}, "items": [{...}, ...]}, for callers that only
+    serialize the result: no ORM instances are built or tracked.
+    """
+    invoice = _rows_as_dicts(db.execute(
+        select(*Invoice.__table__.columns).where(Invoice.InvoiceId == invoice_id)
+    ))
+    if not invoice:
+        return None
+    items = _rows_as_dicts(db.execute(
+        select(*Item.__table__.columns).where(Item.InvoiceId == invoice_id).order_by(Item.id)
+    ))
+    return {"invoice": invoice[0], "items": items}
+
+
+def get_invoice_dicts_by_vendor_name(db: Session, vendor_name: str) -> List[dict]:
+    """
+    Same as get_invoices_by_vendor_name_with_items as plain dictionaries,
+    one {"invoice": {...}, "items": [...]} per invoice, in two queries
+    whatever the number of invoices.
+    """
+    invoices = _rows_as_dicts(db.execute(
+        select(*Invoice.__table__.columns).where(Invoice.VendorName == vendor_name)
+    ))
+    if not invoices:
+        return []
+    vendor_invoice_ids = select(Invoice.InvoiceId).where(Invoice.VendorName == vendor_name)
+    items_by_invoice = {}
+    for item in _rows_as_dicts(db.execute(
+        select(*Item.__table__.columns).where(Item.InvoiceId.in_(vendor_invoice_ids)).order_by(Item.id)
+    )):
+        items_by_invoice.setdefault(item["InvoiceId"], []).append(item)
+    return [{"invoice": invoice, "items": items_by_invoice.get(invoice["InvoiceId"], [])} for invoice in invoices]
+
+
+def _rows_as_dicts(result) -> List[dict]:
+    keys = list(result.keys())
+    return [dict(zip(keys, row)) for row in result]
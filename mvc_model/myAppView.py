@@ -0,0 +1,11 @@
+import oci_client_pool
+
+# Set to a client to use it instead of the shared pool
+doc_client = None
+
+def get_doc_client():
+    if doc_client is not None:
+        return doc_client
+    if not oci_client_pool.pool.ready:
+        oci_client_pool.pool.start()
+    return oci_client_pool.pool
@@ -0,0 +1,138 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import oci
+
+import oci_limiter
+import oci_resilience
+
+# Set FAKE_OCI=local for an in-process fake of OCI Document AI, or to the
+# URL of a fake server started with `python fake_oci.py` (local testing only)
+FAKE_OCI = os.getenv("FAKE_OCI", "")
+# One client per thread that can call OCI at once: every call holds a slot
+# of the concurrency limiter, whose limit is capped by the OCI executor
+OCI_CLIENT_POOL_SIZE = int(os.getenv("OCI_CLIENT_POOL_SIZE", str(oci_limiter.limiter.max_limit)))
+# Open each client's HTTPS connection to OCI at startup
+OCI_CLIENT_POOL_WARM = os.getenv("OCI_CLIENT_POOL_WARM", "1") != "0"
+
+
+"""
+    Builds one OCI Document AI client: the fake selected by FAKE_OCI, or the
+    real client from ~/.oci/config. The SDK's retries and circuit breaker
+    are disabled; oci_resilience does both.
+"""
+def create_client():
+    timeout = (oci_resilience.OCI_CONNECT_TIMEOUT, oci_resilience.OCI_READ_TIMEOUT)
+    if FAKE_OCI:
+        import fake_oci
+        return fake_oci.client_from_setting(FAKE_OCI, timeout)
+    return oci.ai_document.AIServiceDocumentClient(
+        oci.config.from_file(),
+        timeout=timeout,
+        retry_strategy=oci.retry.NoneRetryStrategy(),
+        circuit_breaker_strategy=oci.circuit_breaker.NoCircuitBreakerStrategy()
+    )
+
+
+"""
+    Opens the HTTPS connection of a client to its endpoint so the first
+    AnalyzeDocument call reuses it. Fake in-process clients have none.
+    Returns:
+        bool: True if a connection was opened.
+"""
+def warm_connection(client):
+    base_client = getattr(client, "base_client", None)
+    if base_client is None:
+        return False
+    # Any answer (even 404) leaves a kept-alive connection in the session's pool
+    base_client.session.head(base_client.endpoint, timeout=oci_resilience.OCI_CONNECT_TIMEOUT)
+    return True
+
+
+class ClientPool:
+    """
+    Fixed-size pool of OCI Document AI clients, built at startup. Exposes
+    analyze_document like a client: each call borrows an idle client (the
+    most recently used one, whose connection is still open) and gives it
+    back, so no client is used by two threads at once.
+    """
+
+    def __init__(self, factory=create_client, size=OCI_CLIENT_POOL_SIZE, warm=OCI_CLIENT_POOL_WARM):
+        self.factory = factory
+        self.size = max(1, size)
+        self.warm = warm
+        self.ready = False
+        self.error = None
+        self.warmed = 0
+        self.startup_seconds = None
+        self._clients = []
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+
+    def _build(self, _):
+        client = self.factory()
+        if self.warm:
+            try:
+                return client, warm_connection(client)
+            except Exception:
+                # The connection is opened by the first call instead
+                return client, False
+        return client, False
+
+    def start(self):
+        """Builds and warms every client in parallel. Safe to call from several threads."""
+        with self._lock:
+            if self.ready:
+                return
+            start = time.perf_counter()
+            try:
+                with ThreadPoolExecutor(max_workers=min(self.size, 16)) as executor:
+                    built = list(executor.map(self._build, range(self.size)))
+            except Exception as e:
+                self.error = f"{type(e).__name__}: {e}"
+                raise
+            self._clients = [client for client, _ in built]
+            for client in self._clients:
+                self._idle.put(client)
+            self.warmed = sum(warmed for _, warmed in built)
+            self.startup_seconds = time.perf_counter() - start
+            self.error = None
+            self.ready = True
+
+    def close(self):
+        with self._lock:
+            self.ready = False
+            for client in self._clients:
+                base_client = getattr(client, "base_client", None)
+                if base_client is not None:
+                    base_client.session.close()
+            self._clients = []
+            self._idle = queue.LifoQueue()
+
+    def analyze_document(self, analyze_document_details, **kwargs):
+        if not self.ready:
+            self.start()
+        idle = self._idle
+        client = idle.get()
+        try:
+            return client.analyze_document(analyze_document_details, **kwargs)
+        finally:
+            idle.put(client)
+
+    def health(self):
+        return {
+            "ready": self.ready,
+            "size": self.size if self.ready else 0,
+            "idle": self._idle.qsize(),
+            "warmConnections": self.warmed,
+            "startupSeconds": self.startup_seconds,
+            "error": self.error,
+        }
+
+
+# Shared by app.py, the job workers and the MVC controllers; started by the
+# app's lifespan, or by the first call when there is none (scripts, tests)
+pool = ClientPool()
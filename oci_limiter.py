@@ -0,0 +1,201 @@
+import asyncio
+import contextlib
+import math
+import os
+import threading
+from collections import deque
+
+import metrics
+
+# Extractions allowed to call OCI at the same time. The limit starts at
+# OCI_LIMIT_INITIAL, grows by about one per round of successful calls while
+# it is fully used, and is multiplied by OCI_LIMIT_BACKOFF when OCI throttles
+# (429) or times out (AIMD, like TCP congestion control).
+OCI_LIMIT_INITIAL = int(os.getenv("OCI_LIMIT_INITIAL", "8"))
+OCI_LIMIT_MIN = int(os.getenv("OCI_LIMIT_MIN", "1"))
+OCI_LIMIT_MAX = int(os.getenv("OCI_LIMIT_MAX", "32"))
+# Threads of app.py's OCI executor. The limit never grows past them: a slot
+# without a free thread would wait in the executor's unbounded queue instead
+# of this limiter's bounded one.
+OCI_MAX_WORKERS = int(os.getenv("OCI_MAX_WORKERS", str(OCI_LIMIT_MAX)))
+OCI_LIMIT_BACKOFF = float(os.getenv("OCI_LIMIT_BACKOFF", "0.7"))
+# Extractions waiting for a slot; more are rejected at once with 429
+OCI_QUEUE_SIZE = int(os.getenv("OCI_QUEUE_SIZE", "64"))
+# Seconds an extraction waits for a slot before it is rejected with 503
+OCI_QUEUE_TIMEOUT = float(os.getenv("OCI_QUEUE_TIMEOUT", "30"))
+
+concurrency_limit = metrics.Gauge(
+    "oci_concurrency_limit",
+    "Current adaptive limit of concurrent OCI extractions."
+)
+queue_depth = metrics.Gauge(
+    "oci_limiter_queue_depth",
+    "Extractions waiting for an OCI concurrency slot."
+)
+rejections = metrics.Counter(
+    "oci_limiter_rejections_total",
+    "Extractions shed by the OCI concurrency limiter: queue_full (429) or queue_timeout (503).",
+    ("reason",)
+)
+
+
+class Overloaded(Exception):
+    """Raised when the limiter sheds an extraction instead of queueing it."""
+
+    def __init__(self, status_code, retry_after):
+        super().__init__(f"OCI concurrency limit reached ({status_code}), retry in {retry_after}s")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    """A caller queued for a slot; notify wakes it up once granted."""
+
+    def __init__(self, notify):
+        self.notify = notify
+        self.granted = False
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limiter with a bounded FIFO queue, shared by threads
+    (slot()) and coroutines (slot_async()). Slots are handed to waiters in
+    arrival order when a slot is released or the limit grows.
+    """
+
+    def __init__(self, initial=OCI_LIMIT_INITIAL, min_limit=OCI_LIMIT_MIN, max_limit=OCI_LIMIT_MAX,
+                 backoff=OCI_LIMIT_BACKOFF, queue_size=OCI_QUEUE_SIZE, queue_timeout=OCI_QUEUE_TIMEOUT):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.backoff = backoff
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.in_flight = 0
+        # Moving average of the OCI call latency, used to estimate Retry-After
+        self.latency = 1.0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+        self._last_decrease = None
+        self._releases = 0
+        self._update_gauges()
+
+    def _update_gauges(self):
+        concurrency_limit.set(int(self.limit))
+        queue_depth.set(len(self._waiters))
+
+    def retry_after(self):
+        """Seconds until a new extraction would likely get a slot."""
+        return max(1, math.ceil(self.latency * (len(self._waiters) + 1) / int(self.limit)))
+
+    def _enter(self, notify):
+        with self._lock:
+            if self.in_flight < int(self.limit) and not self._waiters:
+                self.in_flight += 1
+                return None
+            if len(self._waiters) >= self.queue_size:
+                rejections.labels("queue_full").inc()
+                raise Overloaded(429, self.retry_after())
+            waiter = _Waiter(notify)
+            self._waiters.append(waiter)
+            self._update_gauges()
+            return waiter
+
+    def _leave(self, waiter):
+        # The wait is over: either the slot was granted or the caller gives up
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+            self._update_gauges()
+            return False
+
+    def _wake(self):
+        # Called with the lock held
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            waiter.granted = True
+            self.in_flight += 1
+            waiter.notify()
+        self._update_gauges()
+
+    def _timed_out(self):
+        rejections.labels("queue_timeout").inc()
+        return Overloaded(503, self.retry_after())
+
+    def acquire(self):
+        """Takes a slot, blocking the calling thread while the queue drains."""
+        event = threading.Event()
+        waiter = self._enter(event.set)
+        if waiter is None:
+            return
+        event.wait(self.queue_timeout)
+        if not self._leave(waiter):
+            raise self._timed_out()
+
+    async def acquire_async(self):
+        """Takes a slot without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def notify():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+
+        waiter = self._enter(notify)
+        if waiter is None:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(granted), self.queue_timeout)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # The request went away; give back a slot granted in the meantime
+            if self._leave(waiter):
+                self.release()
+            raise
+        if not self._leave(waiter):
+            raise self._timed_out()
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+            self._releases += 1
+            self._wake()
+
+    @contextlib.contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    @contextlib.asynccontextmanager
+    async def slot_async(self):
+        await self.acquire_async()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def on_success(self, latency):
+        """Additive increase: about +1 per round of calls while the limit is fully used."""
+        with self._lock:
+            self.latency = 0.8 * self.latency + 0.2 * latency
+            if self.in_flight >= int(self.limit) and self.limit < self.max_limit:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+                self._wake()
+
+    def on_overload(self):
+        """Multiplicative decrease when OCI throttles or times out."""
+        with self._lock:
+            # Calls that were already in flight when the limit was cut report
+            # the same overload, so decrease at most once per round of calls
+            if self._last_decrease is not None and self._releases - self._last_decrease < int(self.limit):
+                return
+            self._last_decrease = self._releases
+            self.limit = max(self.min_limit, self.limit * self.backoff)
+            self._update_gauges()
+
+
+limiter = AdaptiveLimiter(max_limit=min(OCI_LIMIT_MAX, OCI_MAX_WORKERS))
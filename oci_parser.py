@@ -0,0 +1,190 @@
+"""
+    Converts OCI Document AI AnalyzeDocument responses into the extraction
+    result shared by app.py and the MVC controller: the extracted fields,
+    their confidences and the document classification confidence.
+
+    Each field label maps to its converter in a table built once, and the
+    Items line items are parsed in the same pass over the pages.
+"""
+from datetime import date, datetime, timezone
+
+# Documents whose detected type has a lower confidence are rejected
+MIN_DOCUMENT_CONFIDENCE = 0.9
+
+# Formats tried in order by format_date_to_iso
+DATE_FORMATS = [
+    "%B %d %Y",   # March 6, 2012
+    "%b %d %Y",   # Mar 6, 2012
+    "%m/%d/%Y",    # 03/06/2012
+    "%m/%d/%y",    # 03/06/12
+    "%m-%d-%Y",    # 03-06-2012
+    "%Y-%m-%d",    # 2012-03-06
+    "%d/%m/%Y",    # 06/03/2012 (if OCR outputs this)
+    "%d-%b-%Y",    # 06-Mar-2012
+    "%d %b %Y",    # 06 Mar 2012
+]
+
+
+class LowConfidence(ValueError):
+    """Raised by document_confidence; callers turn it into their own 400 error."""
+
+
+"""
+    Converts a date string to ISO 8601 format with UTC timezone.
+    Returns empty string if conversion fails.
+"""
+def format_date_to_iso(date_text):
+    if date_text is None:
+        return ""
+
+    # If already a datetime/date object
+    if isinstance(date_text, datetime):
+        dt = date_text
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return dt.astimezone(timezone.utc).isoformat()
+    if isinstance(date_text, date):
+        dt = datetime(date_text.year, date_text.month, date_text.day, tzinfo=timezone.utc)
+        return dt.isoformat()
+
+    s = str(date_text).strip()
+    if not s:
+        return ""
+
+    # Already ISO (with timezone or Z)
+    try:
+        if "T" in s:
+            dt = datetime.fromisoformat(s.replace("Z", "+00:00"))
+            if dt.tzinfo is None:
+                dt = dt.replace(tzinfo=timezone.utc)
+            return dt.astimezone(timezone.utc).isoformat()
+    except ValueError:
+        pass
+
+    for fmt in DATE_FORMATS:
+        try:
+            dt = datetime.strptime(s, fmt)
+            return dt.replace(tzinfo=timezone.utc).isoformat()
+        except ValueError:
+            continue
+
+    # If nothing matched, keep old behavior
+    return ""
+
+
+"""
+    Removes currency symbols and formatting from an amount string.
+    Returns float or empty string if invalid.
+"""
+def parse_amount(value):
+    if not value:
+        return ""
+    try:
+        return float(value.replace("$", "").replace(",", "").strip())
+    except ValueError:
+        return ""
+
+
+"""
+    Same as parse_amount for a quantity. Returns int or empty string if invalid.
+"""
+def parse_quantity(value):
+    if not value:
+        return ""
+    try:
+        return int(value.replace("$", "").replace(",", "").strip())
+    except ValueError:
+        return ""
+
+
+"""
+    Removes currency symbols and formatting from amount strings.
+    Returns float (int for "Quantity") or empty string if invalid.
+"""
+def clean_amount(key, value):
+    if key == "Quantity":
+        return parse_quantity(value)
+    return parse_amount(value)
+
+
+# Converter of the text of each document field; other fields keep their text
+FIELD_CONVERTERS = {
+    "InvoiceDate": format_date_to_iso,
+    "InvoiceTotal": parse_amount,
+    "SubTotal": parse_amount,
+    "ShippingCost": parse_amount,
+    "Amount": parse_amount,
+    "UnitPrice": parse_amount,
+    "AmountDue": parse_amount,
+}
+# Converter of the text of each line item field
+ITEM_CONVERTERS = {
+    "Quantity": parse_quantity,
+    "UnitPrice": parse_amount,
+    "Amount": parse_amount,
+}
+
+
+"""
+    Collects the extracted fields and their confidences from all pages.
+    A field found on several pages keeps its last value; "Items" holds the
+    list of line items of the last Items field.
+    Returns:
+        tuple: (data, data_confidence) dictionaries keyed by field name.
+"""
+def parse_fields(response):
+    data = {}
+    data_confidence = {}
+    converter_of = FIELD_CONVERTERS.get
+    for page in response.data.pages:
+        fields = page.document_fields
+        if not fields:
+            continue
+        for field in fields:
+            label = field.field_label
+            value = field.field_value
+            key = (label.name if label else None) or ""
+            if key == "Items":
+                data[key] = parse_items(value.items)
+            else:
+                text = (value.text if value else None) or ""
+                converter = converter_of(key)
+                data[key] = converter(text) if converter else text
+            confidence = label.confidence if label else None
+            data_confidence[key] = confidence if confidence is not None else 0.0
+    return data, data_confidence
+
+
+"""
+    Converts the line items of an Items field into dictionaries keyed by
+    item field name.
+"""
+def parse_items(lines):
+    converter_of = ITEM_CONVERTERS.get
+    items = []
+    for line in lines:
+        item = {}
+        for field in line.field_value.items:
+            label = field.field_label
+            value = field.field_value
+            key = label.name if label else ""
+            text = (value.text if value else None) or ""
+            converter = converter_of(key)
+            item[key] = converter(text) if converter else text
+        items.append(item)
+    return items
+
+
+"""
+    Returns the document classification confidence of the response: the
+    confidence of the last detected document type, 0.0 if there is none.
+    Raises:
+        LowConfidence: If a detected type is below MIN_DOCUMENT_CONFIDENCE.
+"""
+def document_confidence(response):
+    confidence = 0.0
+    for document_type in response.data.detected_document_types or ():
+        confidence = document_type.confidence
+        if confidence < MIN_DOCUMENT_CONFIDENCE:
+            raise LowConfidence(confidence)
+    return confidence
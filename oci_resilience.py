@@ -0,0 +1,205 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import oci
+from oci._vendor import requests
+
+import metrics
+import oci_limiter
+
+# Socket timeouts of the OCI client in seconds. A call that exceeds them
+# raises a timeout error, which is retried like a 5xx.
+OCI_CONNECT_TIMEOUT = float(os.getenv("OCI_CONNECT_TIMEOUT", "10"))
+OCI_READ_TIMEOUT = float(os.getenv("OCI_READ_TIMEOUT", "60"))
+# Attempts per document, including the first call
+OCI_MAX_ATTEMPTS = int(os.getenv("OCI_MAX_ATTEMPTS", "3"))
+# Backoff before retry n is a random delay in [0, min(OCI_BACKOFF_MAX, OCI_BACKOFF_BASE * 2**n)]
+OCI_BACKOFF_BASE = float(os.getenv("OCI_BACKOFF_BASE", "0.5"))
+OCI_BACKOFF_MAX = float(os.getenv("OCI_BACKOFF_MAX", "8"))
+# The breaker opens when at least BREAKER_MIN_CALLS of the last
+# BREAKER_WINDOW calls were made and BREAKER_FAILURE_RATE of them failed
+BREAKER_FAILURE_RATE = float(os.getenv("OCI_BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_MIN_CALLS = int(os.getenv("OCI_BREAKER_MIN_CALLS", "10"))
+BREAKER_WINDOW = int(os.getenv("OCI_BREAKER_WINDOW", "20"))
+# Seconds the breaker stays open before letting a probe call through
+BREAKER_OPEN_SECONDS = float(os.getenv("OCI_BREAKER_OPEN_SECONDS", "30"))
+# Serve a cached extraction when OCI is unavailable, even for Cache-Control: no-cache
+SERVE_STALE = os.getenv("OCI_SERVE_STALE", "1") != "0"
+
+# Status codes worth retrying; 429 is throttling, the rest are server side
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+TIMEOUT_ERRORS = (requests.exceptions.Timeout, requests.exceptions.ConnectionError)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+STATE_VALUES = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+circuit_state = metrics.Gauge(
+    "oci_circuit_state",
+    "State of the OCI circuit breaker: 0 closed, 1 open, 2 half open.",
+    # Each worker has its own breaker, and states do not add up
+    multiprocess_mode="liveall"
+)
+circuit_rejections = metrics.Counter(
+    "oci_circuit_rejections_total",
+    "OCI calls refused without trying because the circuit breaker was open."
+)
+call_errors = metrics.Counter(
+    "oci_call_errors_total",
+    "Failed OCI calls by kind: timeout, throttled, server_error or other.",
+    ("kind",)
+)
+retries = metrics.Counter(
+    "oci_retries_total",
+    "OCI calls retried after a retryable error."
+)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling OCI while the circuit breaker is open."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"OCI circuit breaker is open, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Error-rate circuit breaker over a sliding window of recent calls.
+    Closed: calls go through and their outcome is recorded. Open: calls fail
+    fast with CircuitOpenError for open_seconds. Half open: a single probe
+    call goes through; its outcome closes or reopens the breaker.
+    """
+
+    def __init__(self, failure_rate=BREAKER_FAILURE_RATE, min_calls=BREAKER_MIN_CALLS,
+                 window=BREAKER_WINDOW, open_seconds=BREAKER_OPEN_SECONDS, clock=time.monotonic):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.clock = clock
+        self._outcomes = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._opened_at = 0.0
+        self._probing = False
+        self._set_state(CLOSED)
+
+    def _set_state(self, state):
+        self.state = state
+        circuit_state.set(STATE_VALUES[state])
+
+    def before_call(self):
+        """Raises CircuitOpenError if the call must not be attempted."""
+        with self._lock:
+            if self.state == OPEN:
+                remaining = self._opened_at + self.open_seconds - self.clock()
+                if remaining > 0:
+                    circuit_rejections.inc()
+                    raise CircuitOpenError(remaining)
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._probing:
+                    circuit_rejections.inc()
+                    raise CircuitOpenError(self.open_seconds)
+                self._probing = True
+
+    def record(self, failed):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+                self._outcomes.clear()
+                if failed:
+                    self._open()
+                else:
+                    self._set_state(CLOSED)
+                return
+            self._outcomes.append(failed)
+            failures = sum(self._outcomes)
+            if (self.state == CLOSED and len(self._outcomes) >= self.min_calls
+                    and failures >= self.failure_rate * len(self._outcomes)):
+                self._open()
+
+    def _open(self):
+        self._opened_at = self.clock()
+        self._outcomes.clear()
+        self._set_state(OPEN)
+
+    def reset(self):
+        with self._lock:
+            self._outcomes.clear()
+            self._probing = False
+            self._set_state(CLOSED)
+
+
+breaker = CircuitBreaker()
+
+
+"""
+    Classifies an OCI call error for metrics and retry decisions.
+    Returns:
+        str: "timeout", "throttled", "server_error" or "other".
+"""
+def error_kind(error):
+    if isinstance(error, TIMEOUT_ERRORS):
+        return "timeout"
+    if isinstance(error, oci.exceptions.ServiceError):
+        if error.status == 429:
+            return "throttled"
+        if error.status in RETRYABLE_STATUS:
+            return "server_error"
+    return "other"
+
+
+"""
+    Seconds to wait before the next attempt: full jitter exponential backoff,
+    but at least the Retry-After the service asked for.
+"""
+def backoff_delay(attempt, error=None):
+    delay = random.uniform(0, min(OCI_BACKOFF_MAX, OCI_BACKOFF_BASE * 2 ** attempt))
+    headers = getattr(error, "headers", None) or {}
+    retry_after = headers.get("retry-after") or headers.get("Retry-After")
+    try:
+        delay = max(delay, min(OCI_BACKOFF_MAX, float(retry_after)))
+    except (TypeError, ValueError):
+        pass
+    return delay
+
+
+"""
+    Calls OCI through the circuit breaker, retrying timeouts, throttling and
+    5xx errors up to OCI_MAX_ATTEMPTS times with jittered backoff.
+    Other errors are raised right away. Outcomes feed the adaptive
+    concurrency limit (oci_limiter): throttling and timeouts shrink it.
+    Parameters:
+        func (callable): The OCI call, e.g. client.analyze_document.
+        args: Arguments of the call.
+    Raises:
+        CircuitOpenError: If the breaker is open.
+        Exception: The error of the last attempt.
+"""
+def call(func, *args):
+    attempt = 0
+    while True:
+        breaker.before_call()
+        start = time.monotonic()
+        try:
+            result = func(*args)
+        except Exception as e:
+            kind = error_kind(e)
+            call_errors.labels(kind).inc()
+            if kind in ("timeout", "throttled"):
+                oci_limiter.limiter.on_overload()
+            # Throttling and client errors say nothing about OCI's health
+            breaker.record(failed=kind in ("timeout", "server_error"))
+            attempt += 1
+            if kind == "other" or attempt >= OCI_MAX_ATTEMPTS:
+                raise
+            retries.inc()
+            time.sleep(backoff_delay(attempt, e))
+            continue
+        breaker.record(failed=False)
+        oci_limiter.limiter.on_success(time.monotonic() - start)
+        return result
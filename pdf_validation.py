@@ -0,0 +1,114 @@
+import os
+import re
+
+import metrics
+
+# Larger uploads are rejected with 413 before anything else is done
+PDF_MAX_BYTES = int(os.getenv("PDF_MAX_BYTES", str(20 * 1024 * 1024)))
+# PDFs with more pages are rejected; invoices are a few pages long
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "50"))
+
+# Readers accept the header anywhere in the first 1024 bytes and the %%EOF
+# marker anywhere in the last 1024 bytes
+_HEADER = re.compile(rb"%PDF-(\d\.\d)")
+_STARTXREF = re.compile(rb"startxref\s+(\d+)")
+# startxref points at a cross-reference table or a cross-reference stream object
+_XREF_AT = re.compile(rb"\s*(?:xref|\d+\s+\d+\s+obj)")
+_PAGES = re.compile(rb"/Type\s*/Pages\b")
+_PAGE = re.compile(rb"/Type\s*/Page\b(?!s)")
+_COUNT = re.compile(rb"/Count\s+(\d+)")
+
+rejections = metrics.Counter(
+    "pdf_validation_rejections_total",
+    "Uploads rejected by the local PDF checks before calling OCI, by reason.",
+    ("reason",)
+)
+
+
+class InvalidPDF(ValueError):
+    """Raised by validate_pdf; reason is a short code, the message is for the client."""
+
+    def __init__(self, reason, message):
+        super().__init__(message)
+        self.reason = reason
+        self.status_code = 413 if reason == "too_large" else 400
+
+
+"""
+    Counts the pages of a PDF without parsing it: the /Count of the root
+    page tree node (the largest one), or the number of page objects.
+    Returns:
+        int | None: The page count, None if the page tree is compressed
+                    into object streams and cannot be read without inflating.
+"""
+def count_pages(pdf_bytes):
+    counts = []
+    for match in _PAGES.finditer(pdf_bytes):
+        # Look for /Count in the same object only
+        start = pdf_bytes.rfind(b"obj", 0, match.start())
+        end = pdf_bytes.find(b"endobj", match.end())
+        count = _COUNT.search(pdf_bytes, max(start, 0), end if end != -1 else len(pdf_bytes))
+        if count:
+            counts.append(int(count.group(1)))
+    if counts:
+        return max(counts)
+    pages = sum(1 for _ in _PAGE.finditer(pdf_bytes))
+    if pages == 0 and pdf_bytes.find(b"/ObjStm") != -1:
+        return None
+    return pages
+
+
+"""
+    Cheap structural checks of an uploaded PDF, done before paying for an
+    OCI call: size, %PDF- header, %%EOF marker, startxref pointing at a
+    cross-reference section, no encryption, and the page count.
+    Parameters:
+        pdf_bytes (bytes-like): The uploaded file, bytes or a memory map.
+        max_bytes (int): Size limit, PDF_MAX_BYTES by default.
+        max_pages (int): Page limit, PDF_MAX_PAGES by default.
+    Returns:
+        dict: version, pages (None if unknown) and bytes of the PDF.
+    Raises:
+        InvalidPDF: With reason empty, too_large, not_pdf, truncated,
+                    broken_xref, encrypted, no_pages or too_many_pages.
+"""
+def validate_pdf(pdf_bytes, max_bytes=None, max_pages=None):
+    max_bytes = PDF_MAX_BYTES if max_bytes is None else max_bytes
+    max_pages = PDF_MAX_PAGES if max_pages is None else max_pages
+    try:
+        return _validate(pdf_bytes, max_bytes, max_pages)
+    except InvalidPDF as e:
+        rejections.labels(e.reason).inc()
+        raise
+
+
+def _validate(pdf_bytes, max_bytes, max_pages):
+    size = len(pdf_bytes)
+    if size == 0:
+        raise InvalidPDF("empty", "the file is empty")
+    if size > max_bytes:
+        raise InvalidPDF("too_large", f"the file is larger than {max_bytes} bytes")
+
+    header = _HEADER.search(pdf_bytes, 0, 1024)
+    if not header:
+        raise InvalidPDF("not_pdf", "the file is not a PDF")
+    tail = max(0, size - 1024)
+    if pdf_bytes.find(b"%%EOF", tail) == -1:
+        raise InvalidPDF("truncated", "the PDF is truncated")
+
+    position = pdf_bytes.rfind(b"startxref", tail)
+    startxref = _STARTXREF.match(pdf_bytes, position) if position != -1 else None
+    xref_offset = int(startxref.group(1)) if startxref else size
+    if xref_offset >= size or not _XREF_AT.match(pdf_bytes, xref_offset):
+        raise InvalidPDF("broken_xref", "the PDF cross-reference table is missing or broken")
+    # The trailer (or the cross-reference stream dictionary) of the last
+    # revision names the encryption dictionary
+    if pdf_bytes.find(b"/Encrypt", xref_offset) != -1:
+        raise InvalidPDF("encrypted", "the PDF is encrypted")
+
+    pages = count_pages(pdf_bytes)
+    if pages == 0:
+        raise InvalidPDF("no_pages", "the PDF has no pages")
+    if pages is not None and pages > max_pages:
+        raise InvalidPDF("too_many_pages", f"the PDF has {pages} pages, the maximum is {max_pages}")
+    return {"version": header.group(1).decode("ascii"), "pages": pages, "bytes": size}
@@ -0,0 +1,257 @@
+"""
+    Replays a JSONL traffic capture against the service.
+
+    Each line of the capture is one request:
+        {"ts": 1697040000.25, "method": "POST", "path": "/extract",
+         "file": "invoices_sample/invoice_Aaron_Bergman_36259.pdf",
+         "headers": {"Cache-Control": "no-cache"}}
+        {"ts": "2023-10-11T16:00:01.5+00:00", "method": "GET",
+         "path": "/invoices/vendor/SuperStore", "query": {"limit": 50}}
+    "ts" is epoch seconds or an ISO 8601 timestamp. Payloads are referenced,
+    not inlined: "file" uploads one document in the "file" field, "files"
+    uploads several in the "files" field (POST /extract/batch) and "json"
+    sends a JSON body. Relative payload paths are resolved against
+    --payload-dir, by default the directory of the capture. A payload that
+    cannot be read counts as a failed request.
+
+    Before the replay, each uploaded PDF is extracted once so that the
+    reads of its invoice find it, however fast the replay runs; this also
+    fills the extraction cache. --no-warm-up skips it.
+
+    Requests start at their captured offsets scaled by --speed (1 = original
+    speed, 10 = ten times faster) or back to back with --max, with at most
+    --concurrency in flight. The report groups requests by route and shows
+    req/s, errors, p50/p95/p99 latency and how late requests started
+    compared to the schedule.
+
+    By default the app runs in-process on a temporary database with the fake
+    OCI client; --url replays against a running service instead.
+    Usage:
+        python replay.py capture.jsonl --speed 1
+        python replay.py capture.jsonl --max --concurrency 64 --url http://localhost:8080
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+
+import httpx
+
+UPLOAD_TYPES = {".pdf": "application/pdf", ".zip": "application/zip"}
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+"""
+    Reads a capture file and returns its entries ordered by timestamp, with
+    "ts" converted to epoch seconds.
+    Raises:
+        ValueError: If a line is not valid JSON or lacks ts, method or path.
+"""
+def load_capture(path):
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+                ts = entry["ts"]
+                entry["ts"] = datetime.fromisoformat(ts).timestamp() if isinstance(ts, str) else float(ts)
+                entry["method"] = entry["method"].upper()
+                if not entry["path"].startswith("/"):
+                    raise ValueError("path must start with /")
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                raise ValueError(f"{path}:{line_number}: invalid capture entry ({e})")
+            entries.append(entry)
+    entries.sort(key=lambda entry: entry["ts"])
+    return entries
+
+
+class RouteNames:
+    """
+    Maps a request path to the route it hits, e.g. /invoice/36259 to
+    /invoice/{invoice_id}, so the report groups requests per endpoint.
+    """
+
+    def __init__(self, routes=()):
+        self.routes = routes
+        self.names = {}
+
+    def __call__(self, method, path):
+        key = (method, path)
+        if key not in self.names:
+            name = path
+            for route in self.routes:
+                path_regex = getattr(route, "path_regex", None)
+                if path_regex and path_regex.match(path) and method in (getattr(route, "methods", None) or ()):
+                    name = route.path
+                    break
+            self.names[key] = f"{method} {name}"
+        return self.names[key]
+
+
+class Replayer:
+    """
+    Sends the entries of a capture with the original timing scaled by speed
+    (speed=None sends them back to back), keeping at most concurrency
+    requests in flight.
+    """
+
+    def __init__(self, client, speed=1.0, concurrency=16, payload_dir=".", route_names=None):
+        self.client = client
+        self.speed = speed
+        self.concurrency = concurrency
+        self.payload_dir = payload_dir
+        self.route_names = route_names or RouteNames()
+        self.payloads = {}
+        self.latencies = {}
+        self.lags = {}
+        self.errors = {}
+
+    def payload(self, reference):
+        path = os.path.join(self.payload_dir, reference)
+        if path not in self.payloads:
+            with open(path, "rb") as f:
+                self.payloads[path] = f.read()
+        return self.payloads[path]
+
+    def upload(self, reference):
+        content_type = UPLOAD_TYPES.get(os.path.splitext(reference)[1].lower(), "application/octet-stream")
+        return os.path.basename(reference), self.payload(reference), content_type
+
+    def request_kwargs(self, entry):
+        kwargs = {"params": entry.get("query"), "headers": entry.get("headers")}
+        if "file" in entry:
+            kwargs["files"] = {"file": self.upload(entry["file"])}
+        elif "files" in entry:
+            kwargs["files"] = [("files", self.upload(reference)) for reference in entry["files"]]
+        elif "json" in entry:
+            kwargs["json"] = entry["json"]
+        return kwargs
+
+    async def warm_up(self, entries):
+        # Make sure the uploaded invoices exist for the reads of the capture
+        references = {entry["file"] for entry in entries if "file" in entry}
+        references.update(reference for entry in entries for reference in entry.get("files", ()))
+        for reference in sorted(references):
+            if not reference.lower().endswith(".pdf"):
+                continue
+            try:
+                await self.client.request("POST", "/extract", files={"file": self.upload(reference)})
+            except (httpx.HTTPError, OSError):
+                # Reported by the replay itself
+                pass
+
+    async def send(self, entry, name, lag, semaphore):
+        try:
+            start = time.perf_counter()
+            try:
+                response = await self.client.request(entry["method"], entry["path"], **self.request_kwargs(entry))
+                failed = response.status_code >= 400
+            except (httpx.HTTPError, OSError):
+                # A missing or unreadable payload fails this request only
+                failed = True
+            self.latencies.setdefault(name, []).append(time.perf_counter() - start)
+            self.lags.setdefault(name, []).append(lag)
+            self.errors[name] = self.errors.get(name, 0) + failed
+        finally:
+            semaphore.release()
+
+    async def run(self, entries):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = []
+        start = time.perf_counter()
+        first_ts = entries[0]["ts"] if entries else 0
+        for entry in entries:
+            due = start + (entry["ts"] - first_ts) / self.speed if self.speed else start
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await semaphore.acquire()
+            lag = max(0.0, time.perf_counter() - due)
+            name = self.route_names(entry["method"], entry["path"])
+            tasks.append(asyncio.create_task(self.send(entry, name, lag, semaphore)))
+        await asyncio.gather(*tasks)
+        return time.perf_counter() - start
+
+    def report(self, elapsed):
+        lines = [f"{'endpoint':<36} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 ms':>8} "
+                 f"{'p95 ms':>8} {'p99 ms':>8} {'lag p99 ms':>10}"]
+        total = 0
+        for name in sorted(self.latencies):
+            latencies = self.latencies[name]
+            total += len(latencies)
+            lines.append(
+                f"{name:<36} {len(latencies):>8} {self.errors[name]:>6} {len(latencies) / elapsed:>8.1f} "
+                f"{percentile(latencies, 50) * 1000:>8.1f} {percentile(latencies, 95) * 1000:>8.1f} "
+                f"{percentile(latencies, 99) * 1000:>8.1f} {percentile(self.lags[name], 99) * 1000:>10.1f}"
+            )
+        lines.append(f"total {total} requests in {elapsed:.2f}s, {total / elapsed if elapsed else 0:.1f} req/s")
+        return "\n".join(lines)
+
+
+async def replay(args, entries):
+    if args.url:
+        from app import app
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+    else:
+        import app as app_module
+        import fake_oci
+        app = app_module.app
+        app_module.doc_client = fake_oci.FakeDocumentClient(args.latency, args.error_rate)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://replay", timeout=args.timeout)
+    async with client:
+        replayer = Replayer(
+            client,
+            speed=None if args.max else args.speed,
+            concurrency=args.concurrency,
+            payload_dir=args.payload_dir,
+            route_names=RouteNames(app.routes)
+        )
+        if args.warm_up:
+            await replayer.warm_up(entries)
+        elapsed = await replayer.run(entries)
+    print(replayer.report(elapsed))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a JSONL traffic capture against the service")
+    parser.add_argument("capture", help="JSONL capture file")
+    parser.add_argument("--url", help="base URL of a running service; the app runs in-process if omitted")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed factor, 1 is the original timing")
+    parser.add_argument("--max", action="store_true", help="ignore timestamps and send as fast as possible")
+    parser.add_argument("--concurrency", type=int, default=16, help="maximum requests in flight")
+    parser.add_argument("--payload-dir", help="base directory of the payload files, the capture's by default")
+    parser.add_argument("--no-warm-up", dest="warm_up", action="store_false",
+                        help="do not extract the uploaded PDFs before the replay")
+    parser.add_argument("--latency", default="lognormal:0.5,0.3", help="in-process fake OCI latency spec")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="in-process fake OCI 503 rate")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args(argv)
+    if args.speed <= 0:
+        parser.error("--speed must be positive, use --max for maximum throughput")
+    if args.payload_dir is None:
+        args.payload_dir = os.path.dirname(args.capture)
+
+    entries = load_capture(args.capture)
+    if args.url:
+        asyncio.run(replay(args, entries))
+        return
+    import db_util
+    with tempfile.TemporaryDirectory() as tmp:
+        db_util.DB_PATH = os.path.join(tmp, "replay.db")
+        db_util.init_db()
+        asyncio.run(replay(args, entries))
+        db_util.close_connection()
+
+
+if __name__ == "__main__": # pragma: no cover
+    main()
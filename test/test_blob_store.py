@@ -0,0 +1,304 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+import oci
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import blob_store
+import db_util
+import fake_oci
+import job_queue
+from db_util import init_db, clean_db
+from app import app, build_analyze_request, process_document
+from mvc_model.controller.controller import extract_invoice_controller
+from mvc_model.models.base import Base
+
+SMALL = fake_oci.minimal_pdf("Small")
+# Over the OCI_INLINE_MAX_BYTES the tests use
+LARGE = fake_oci.minimal_pdf("x" * 8192)
+INLINE_MAX_BYTES = 4096
+
+
+"""
+    Size of the JSON body the OCI SDK sends for an AnalyzeDocument request.
+"""
+def request_body_bytes(request):
+    return len(json.dumps(fake_oci.to_wire(request)))
+
+
+class RecordingClient(fake_oci.FakeDocumentClient):
+    """Fake client remembering the document of each request."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.documents_sent = []
+
+    def analyze_document(self, analyze_document_details, **kwargs):
+        self.documents_sent.append(analyze_document_details.document)
+        return super().analyze_document(analyze_document_details, **kwargs)
+
+
+class TestLocalBlobStore(unittest.TestCase):
+    """Filesystem backend of the blob store"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.store = blob_store.LocalBlobStore(tmp.name, namespace="ns", bucket="docs")
+
+    def test_put_get_delete(self):
+        name = blob_store.object_name("abc")
+        self.assertFalse(self.store.exists(name))
+        self.store.put(name, LARGE)
+        self.assertTrue(self.store.exists(name))
+        self.assertEqual(self.store.get(name), LARGE)
+        # Content-addressed: a second put of the same name keeps the object
+        self.store.put(name, b"ignored")
+        self.assertEqual(self.store.get(name), LARGE)
+        self.store.delete(name)
+        self.store.delete(name)
+        self.assertFalse(self.store.exists(name))
+        self.assertEqual(os.listdir(os.path.dirname(self.store.path(name))), [])
+
+    def test_create_store(self):
+        self.assertIsNone(blob_store.create_store(""))
+        self.assertIsInstance(blob_store.create_store("local"), blob_store.LocalBlobStore)
+        self.assertIsInstance(blob_store.create_store("oci"), blob_store.ObjectStorageBlobStore)
+        with self.assertRaises(ValueError):
+            blob_store.create_store("s3")
+
+    def test_mode_is_chosen_by_size(self):
+        with patch("blob_store.OCI_INLINE_MAX_BYTES", INLINE_MAX_BYTES):
+            with patch("blob_store.store", None):
+                self.assertFalse(blob_store.by_reference(LARGE))
+            with patch("blob_store.store", self.store):
+                self.assertFalse(blob_store.by_reference(SMALL))
+                self.assertTrue(blob_store.by_reference(LARGE))
+                self.assertTrue(blob_store.by_reference(blob_store.StoredDocument("abc")))
+
+                with blob_store.stored_for_call(SMALL) as document:
+                    self.assertIs(document, SMALL)
+                    inline = build_analyze_request(document)
+                with blob_store.stored_for_call(LARGE) as document:
+                    referenced = build_analyze_request(document)
+                    self.assertEqual(self.store.get(referenced.document.object_name), LARGE)
+        self.assertEqual(inline.document.source, "INLINE")
+        self.assertEqual(referenced.document.source, "OBJECT_STORAGE")
+        self.assertEqual((referenced.document.namespace_name, referenced.document.bucket_name), ("ns", "docs"))
+        # Deleted once the call is over
+        self.assertFalse(self.store.exists(referenced.document.object_name))
+        # The request body no longer grows with the document
+        with patch("blob_store.store", None):
+            self.assertGreater(request_body_bytes(build_analyze_request(LARGE)), len(LARGE) * 4 // 3)
+        self.assertLess(request_body_bytes(referenced), 1024)
+
+
+class TestObjectStorageBlobStore(unittest.TestCase):
+    """OCI Object Storage backend, against a mocked SDK client"""
+
+    def setUp(self):
+        self.client = MagicMock()
+        self.store = blob_store.ObjectStorageBlobStore("ns", "bucket", client=self.client)
+
+    def not_found(self, *args):
+        raise oci.exceptions.ServiceError(404, "ObjectNotFound", {}, "not found")
+
+    def test_put_uploads_only_new_objects(self):
+        self.store.put("documents/a.pdf", LARGE)
+        self.client.put_object.assert_not_called()
+
+        self.client.head_object.side_effect = self.not_found
+        self.store.put("documents/a.pdf", LARGE)
+        self.client.put_object.assert_called_once_with("ns", "bucket", "documents/a.pdf", LARGE)
+
+    def test_get_and_delete(self):
+        self.client.get_object.return_value.data.content = LARGE
+        self.assertEqual(self.store.get("documents/a.pdf"), LARGE)
+        self.client.delete_object.side_effect = self.not_found
+        self.store.delete("documents/a.pdf")
+
+    @patch("oci.config.from_file", return_value={})
+    @patch("oci.object_storage.ObjectStorageClient")
+    def test_client_is_built_at_startup(self, client_class, from_file):
+        store = blob_store.ObjectStorageBlobStore("ns", "bucket")
+        with patch("blob_store.store", store), TestClient(app):
+            client_class.assert_called_once()
+        self.assertIs(store.client, client_class.return_value)
+        client_class.assert_called_once()
+
+    @patch("oci.config.from_file", side_effect=oci.exceptions.ConfigFileNotFound("no config"))
+    def test_startup_survives_a_missing_config(self, from_file):
+        store = blob_store.ObjectStorageBlobStore("ns", "bucket")
+        with patch("blob_store.store", store), TestClient(app) as client:
+            self.assertEqual(client.get("/metrics").status_code, 200)
+        with self.assertRaises(oci.exceptions.ConfigFileNotFound):
+            store.client
+
+    def test_other_errors_are_raised(self):
+        def unavailable(*args):
+            raise oci.exceptions.ServiceError(503, "ServiceUnavailable", {}, "down")
+
+        self.client.head_object.side_effect = unavailable
+        self.client.delete_object.side_effect = unavailable
+        with self.assertRaises(oci.exceptions.ServiceError):
+            self.store.exists("documents/a.pdf")
+        with self.assertRaises(oci.exceptions.ServiceError):
+            self.store.delete("documents/a.pdf")
+
+
+class TestDocumentsByReference(unittest.TestCase):
+    """Large uploads are stored and sent to OCI by reference"""
+
+    def setUp(self):
+        init_db()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.store = blob_store.LocalBlobStore(tmp.name)
+        self.fake = RecordingClient()
+        for patcher in (patch("blob_store.store", self.store),
+                        patch("blob_store.OCI_INLINE_MAX_BYTES", INLINE_MAX_BYTES),
+                        patch("app.get_doc_client", return_value=self.fake),
+                        patch("mvc_model.controller.controller.get_doc_client", return_value=self.fake)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        clean_db()
+
+    def post(self, path, pdf_bytes):
+        return self.client.post(path, files={"file": ("invoice.pdf", pdf_bytes, "application/pdf")})
+
+    def test_extract_sends_large_pdfs_by_reference(self):
+        with patch("blob_store.store", None):
+            inline = self.post("/extract", LARGE).json()
+        clean_db()
+        referenced = self.post("/extract", LARGE)
+        self.assertEqual(referenced.status_code, 200)
+        self.assertEqual([d.source for d in self.fake.documents_sent], ["INLINE", "OBJECT_STORAGE"])
+        self.assertEqual(referenced.json()["data"], inline["data"])
+
+        self.assertEqual(self.post("/extract", SMALL).status_code, 200)
+        self.assertEqual(self.fake.documents_sent[-1].source, "INLINE")
+        self.assertEqual(stored_objects(self.store), [])
+
+    def test_job_worker_reuses_the_stored_pdf(self):
+        job_id = self.post("/jobs", LARGE).json()["jobId"]
+        with db_util.get_db() as conn:
+            document = conn.execute("SELECT Document FROM jobs WHERE JobId = ?", (job_id,)).fetchone()[0]
+        self.assertIsNone(document)
+
+        name = job_document_name(job_id)
+        self.assertEqual(stored_objects(self.store), [name])
+
+        with patch.object(self.store, "put", side_effect=AssertionError("uploaded twice")):
+            self.assertTrue(job_queue.process_next("worker", process_document))
+        job = self.client.get(f"/jobs/{job_id}").json()
+        self.assertEqual(job["status"], job_queue.DONE)
+        self.assertEqual(self.fake.documents_sent[0].object_name, name)
+        self.assertEqual(stored_objects(self.store), [])
+
+    def test_duplicate_job_deletes_its_copy(self):
+        job_id = self.post("/jobs", LARGE).json()["jobId"]
+        self.assertEqual(self.post("/jobs", LARGE).json()["jobId"], job_id)
+        self.assertEqual(stored_objects(self.store), [job_document_name(job_id)])
+
+    def test_retried_job_keeps_its_pdf_until_it_fails(self):
+        job_id = self.post("/jobs", LARGE).json()["jobId"]
+        unavailable = HTTPException(status_code=503, detail={"error": "down"})
+        with patch("job_queue.JOB_MAX_ATTEMPTS", 2), patch("job_queue.retry_delay", return_value=0), \
+                patch("app.run_extraction", side_effect=unavailable):
+            job_queue.process_next("worker", process_document)
+            self.assertEqual(stored_objects(self.store), [job_document_name(job_id)])
+            job_queue.process_next("worker", process_document)
+        self.assertEqual(self.client.get(f"/jobs/{job_id}").json()["status"], job_queue.FAILED)
+        self.assertEqual(stored_objects(self.store), [])
+
+    def test_pdfs_of_older_jobs_are_found_from_their_hash(self):
+        job_id = self.post("/jobs", LARGE).json()["jobId"]
+        name = job_document_name(job_id)
+        self.store.put(blob_store.object_name(job_pdf_hash(job_id)), self.store.get(name))
+        self.store.delete(name)
+        with db_util.get_db() as conn:
+            conn.execute("UPDATE jobs SET DocumentName = NULL WHERE JobId = ?", (job_id,))
+
+        job_queue.process_next("worker", process_document)
+        self.assertEqual(self.client.get(f"/jobs/{job_id}").json()["status"], job_queue.DONE)
+        self.assertEqual(stored_objects(self.store), [])
+
+    def test_failed_deletes_are_left_to_the_lifecycle_policy(self):
+        with patch.object(self.store, "delete", side_effect=OSError("denied")), \
+                patch("traceback.print_exc") as print_exc:
+            self.assertEqual(self.post("/extract", LARGE).status_code, 200)
+        print_exc.assert_called_once()
+        self.assertEqual(len(stored_objects(self.store)), 1)
+
+    def test_missing_object_fails_the_extraction(self):
+        stored = blob_store.StoredDocument("0" * 64)
+        with self.assertRaises(HTTPException) as raised:
+            process_document(stored)
+        self.assertEqual(raised.exception.status_code, 503)
+
+    def test_controller_sends_large_pdfs_by_reference(self):
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        db = sessionmaker(bind=engine)()
+        self.addCleanup(engine.dispose)
+        self.addCleanup(db.close)
+        result = extract_invoice_controller(db, LARGE, force_extract=True)
+        self.assertIn("data", result)
+        self.assertEqual(self.fake.documents_sent[-1].source, "OBJECT_STORAGE")
+        self.assertEqual(stored_objects(self.store), [])
+
+    def test_fake_server_reads_referenced_documents(self):
+        server = fake_oci.make_server(fake_oci.FakeDocumentClient(documents=self.store), port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            client = fake_oci.http_client(f"http://127.0.0.1:{server.server_port}")
+            with blob_store.stored_for_call(LARGE) as document:
+                response = client.analyze_document(build_analyze_request(document))
+            self.assertEqual(response.status, 200)
+            with self.assertRaises(oci.exceptions.ServiceError) as raised:
+                client.analyze_document(build_analyze_request(blob_store.StoredDocument("0" * 64)))
+            self.assertEqual(raised.exception.status, 404)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+"""
+    PdfHash of a job, read from the jobs table.
+"""
+def job_pdf_hash(job_id):
+    with db_util.get_db() as conn:
+        return conn.execute("SELECT PdfHash FROM jobs WHERE JobId = ?", (job_id,)).fetchone()[0]
+
+
+"""
+    Object name of the PDF a job stored, read from the jobs table.
+"""
+def job_document_name(job_id):
+    with db_util.get_db() as conn:
+        return conn.execute("SELECT DocumentName FROM jobs WHERE JobId = ?", (job_id,)).fetchone()[0]
+
+
+"""
+    Names of the objects left in a local blob store.
+"""
+def stored_objects(store):
+    return sorted(
+        os.path.relpath(os.path.join(directory, name), store.root).replace(os.sep, "/")
+        for directory, _, names in os.walk(store.root)
+        for name in names
+    )
+
+
+if __name__ == "__main__":
+    unittest.main()
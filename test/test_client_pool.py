@@ -0,0 +1,144 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+import app as app_module
+import fake_oci
+import oci_client_pool
+from db_util import init_db, clean_db
+from app import app, build_analyze_request
+
+SAMPLE_PDF = "invoices_sample/invoice_Aaron_Bergman_36259.pdf"
+# Time to read ~/.oci/config and build one SDK client, as seen on a cold start
+CLIENT_BUILD_SECONDS = 0.2
+
+
+class SlowFactory:
+    """Builds fake clients as slowly as the SDK and records how many were built."""
+
+    def __init__(self, delay=CLIENT_BUILD_SECONDS):
+        self.delay = delay
+        self.built = 0
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        time.sleep(self.delay)
+        with self.lock:
+            self.built += 1
+        return fake_oci.FakeDocumentClient()
+
+
+class ExclusiveClient(fake_oci.FakeDocumentClient):
+    """Fails if two threads use the same client at once."""
+
+    def __init__(self):
+        super().__init__(latency="fixed:0.01")
+        self.busy = threading.Lock()
+
+    def analyze_document(self, analyze_document_details, **kwargs):
+        if not self.busy.acquire(blocking=False):
+            raise AssertionError("client used by two threads at once")
+        try:
+            return super().analyze_document(analyze_document_details, **kwargs)
+        finally:
+            self.busy.release()
+
+
+class TestClientPool(unittest.TestCase):
+    """Pre-warmed OCI client pool built by the app's lifespan"""
+
+    def setUp(self):
+        init_db()
+        with open(SAMPLE_PDF, "rb") as f:
+            self.files = {"file": ("a.pdf", f.read(), "application/pdf")}
+
+    def tearDown(self):
+        clean_db()
+
+    def timed_first_extract(self, client):
+        start = time.perf_counter()
+        response = client.post("/extract", files=self.files, headers={"Cache-Control": "no-cache"})
+        self.assertEqual(response.status_code, 200)
+        return time.perf_counter() - start
+
+    def test_cold_start_latency_of_first_extract(self):
+        # Without a lifespan the first request builds the clients itself
+        with patch("oci_client_pool.pool", oci_client_pool.ClientPool(SlowFactory(), size=2)):
+            cold = self.timed_first_extract(TestClient(app))
+
+        pool = oci_client_pool.ClientPool(SlowFactory(), size=2)
+        with patch("oci_client_pool.pool", pool), patch("app.JOB_WORKERS", 0):
+            with TestClient(app) as client:
+                health = client.get("/health")
+                warm = self.timed_first_extract(client)
+
+        print(f"\nfirst /extract: cold {cold * 1000:.0f} ms, pre-warmed {warm * 1000:.0f} ms")
+        self.assertGreaterEqual(cold, CLIENT_BUILD_SECONDS)
+        self.assertLess(warm, CLIENT_BUILD_SECONDS)
+        self.assertEqual(health.status_code, 200)
+        self.assertEqual(health.json()["ociClientPool"]["size"], 2)
+        # Clients are built in parallel
+        self.assertLess(health.json()["ociClientPool"]["startupSeconds"], 2 * CLIENT_BUILD_SECONDS)
+
+    def test_concurrent_first_calls_build_the_pool_once(self):
+        factory = SlowFactory(delay=0.05)
+        pool = oci_client_pool.ClientPool(factory, size=3)
+        with patch("oci_client_pool.pool", pool):
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                clients = list(executor.map(lambda _: app_module.get_doc_client(), range(8)))
+        self.assertEqual(factory.built, 3)
+        self.assertTrue(all(client is pool for client in clients))
+
+    def test_a_client_is_never_shared_between_threads(self):
+        pool = oci_client_pool.ClientPool(ExclusiveClient, size=2)
+        request = build_analyze_request(self.files["file"][1])
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            responses = list(executor.map(lambda _: pool.analyze_document(request), range(16)))
+        self.assertEqual(len(responses), 16)
+        self.assertEqual(pool.health()["idle"], 2)
+
+    def test_health_reports_a_failed_pool(self):
+        def missing_config():
+            raise FileNotFoundError("~/.oci/config")
+
+        pool = oci_client_pool.ClientPool(missing_config, size=2)
+        with patch("oci_client_pool.pool", pool), patch("app.JOB_WORKERS", 0):
+            with TestClient(app) as client:
+                response = client.get("/health")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()["status"], "unavailable")
+        self.assertIn("~/.oci/config", response.json()["ociClientPool"]["error"])
+
+    def test_warm_connections_are_reused(self):
+        server = fake_oci.make_server(fake_oci.FakeDocumentClient(), port=0)
+        connections = []
+        accept = server.get_request
+
+        def counting_accept():
+            connections.append(1)
+            return accept()
+
+        server.get_request = counting_accept
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        endpoint = f"http://127.0.0.1:{server.server_port}"
+        pool = oci_client_pool.ClientPool(lambda: fake_oci.http_client(endpoint), size=1)
+        try:
+            pool.start()
+            self.assertEqual(pool.health()["warmConnections"], 1)
+            request = build_analyze_request(self.files["file"][1])
+            for _ in range(3):
+                pool.analyze_document(request)
+        finally:
+            pool.close()
+            server.shutdown()
+            server.server_close()
+        # The connection opened at startup served every call
+        self.assertEqual(len(connections), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,407 @@
+import email.utils
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+from sqlalchemy import update
+from sqlalchemy.orm import sessionmaker
+
+import conditional
+import db_util
+import invoice_cache
+from db_util import init_db, clean_db
+from app import app
+from mvc_model import db as mvc_db
+from mvc_model.models import Item
+from mvc_model.models.extraction import save_extraction
+from mvc_model.models.invoice import update_invoice
+from mvc_model.models.item import create_item
+from test.test_invoice_cache import extraction
+from test.test_metrics import sample_value
+
+
+def vendor_extraction(invoice_id, vendor_name, total=1.0):
+    result = extraction(invoice_id, total)
+    result["data"]["VendorName"] = vendor_name
+    return result
+
+
+class TestContentVersions(unittest.TestCase):
+    """Versions maintained by the writes of db_util"""
+
+    def setUp(self):
+        init_db()
+
+    def tearDown(self):
+        clean_db()
+
+    def test_writes_bump_the_invoice_and_vendor_versions(self):
+        self.assertIsNone(db_util.get_invoice_version("VER-1"))
+        self.assertEqual(db_util.get_vendor_version("VerVendor"), (0, None))
+        db_util.save_inv_extraction(vendor_extraction("VER-1", "VerVendor"))
+        invoice_version = db_util.get_invoice_version("VER-1")[0]
+        vendor_version = db_util.get_vendor_version("VerVendor")[0]
+        self.assertGreaterEqual(invoice_version, 1)
+        db_util.save_inv_extractions([vendor_extraction("VER-1", "VerVendor", total=2.0), vendor_extraction("VER-2", "VerVendor")])
+        self.assertGreater(db_util.get_invoice_version("VER-1")[0], invoice_version)
+        self.assertGreaterEqual(db_util.get_invoice_version("VER-2")[0], 1)
+        self.assertGreater(db_util.get_vendor_version("VerVendor")[0], vendor_version)
+
+    def test_moving_an_invoice_bumps_both_vendors(self):
+        db_util.save_inv_extraction(vendor_extraction("VER-1", "OldVendor"))
+        old_vendor = db_util.get_vendor_version("OldVendor")[0]
+        db_util.save_inv_extraction(vendor_extraction("VER-1", "NewVendor"))
+        self.assertGreater(db_util.get_vendor_version("OldVendor")[0], old_vendor)
+        self.assertGreaterEqual(db_util.get_vendor_version("NewVendor")[0], 1)
+
+    def test_versions_are_bumped_by_any_writer(self):
+        db_util.save_inv_extraction(vendor_extraction("VER-1", "VerVendor"))
+        versions = db_util.get_invoice_version("VER-1"), db_util.get_vendor_version("VerVendor")
+        # Invoice rows are versioned by their triggers, items by their
+        # writer, once for all the items it wrote
+        for statements in (["UPDATE invoices SET InvoiceTotal = 5 WHERE InvoiceId = 'VER-1'"],
+                           ["UPDATE items SET Amount = 5 WHERE InvoiceId = 'VER-1'",
+                            "INSERT INTO items (InvoiceId, Name) VALUES ('VER-1', 'Extra')"]):
+            with db_util.get_db() as conn:
+                cursor = conn.cursor()
+                for statement in statements:
+                    cursor.execute(statement)
+                if statements[0].startswith("UPDATE items"):
+                    db_util.bump_invoice_versions(cursor, ["VER-1"])
+            current = db_util.get_invoice_version("VER-1"), db_util.get_vendor_version("VerVendor")
+            self.assertEqual(current[0][0], versions[0][0] + 1, statements)
+            self.assertEqual(current[1][0], versions[1][0] + 1, statements)
+            versions = current
+        # Deleting an invoice changes its vendor's listing
+        with db_util.get_db() as conn:
+            conn.execute("DELETE FROM items WHERE InvoiceId = 'VER-1'")
+            conn.execute("DELETE FROM invoices WHERE InvoiceId = 'VER-1'")
+        self.assertGreater(db_util.get_vendor_version("VerVendor")[0], versions[1][0])
+
+    def test_writes_that_change_nothing_bump_nothing(self):
+        db_util.save_inv_extraction(vendor_extraction("VER-1", "VerVendor"))
+        versions = db_util.get_invoice_version("VER-1"), db_util.get_vendor_version("VerVendor")
+        with db_util.get_db() as conn:
+            conn.execute("UPDATE invoices SET InvoiceTotal = InvoiceTotal, VendorName = 'VerVendor'")
+            conn.execute("UPDATE items SET Name = Name")
+        self.assertEqual((db_util.get_invoice_version("VER-1"), db_util.get_vendor_version("VerVendor")), versions)
+
+    def test_saving_the_same_extraction_again_bumps_nothing(self):
+        db_util.save_inv_extraction(vendor_extraction("VER-1", "VerVendor"))
+        versions = db_util.get_invoice_version("VER-1"), db_util.get_vendor_version("VerVendor")
+        invoice_cache.get_versioned_invoice("VER-1")
+        self.assertIn("VER-1", invoice_cache.cache._entries)
+        db_util.save_inv_extraction(vendor_extraction("VER-1", "VerVendor"))
+        self.assertEqual((db_util.get_invoice_version("VER-1"), db_util.get_vendor_version("VerVendor")), versions)
+        self.assertIn("VER-1", invoice_cache.cache._entries)
+        # New confidences alone are saved without changing the invoice
+        result = vendor_extraction("VER-1", "VerVendor")
+        result["dataConfidence"]["VendorName"] = 0.5
+        db_util.save_inv_extraction(result)
+        self.assertEqual(db_util.get_invoice_version("VER-1"), versions[0])
+        with db_util.get_db() as conn:
+            confidence = conn.execute("SELECT VendorName FROM confidences WHERE InvoiceId = 'VER-1'").fetchone()[0]
+        self.assertEqual(confidence, 0.5)
+
+    def test_saving_new_items_bumps_the_invoice(self):
+        db_util.save_inv_extraction(vendor_extraction("VER-1", "VerVendor"))
+        version = db_util.get_invoice_version("VER-1")
+        result = vendor_extraction("VER-1", "VerVendor")
+        result["data"]["Items"][0]["Quantity"] = 2
+        db_util.save_inv_extraction(result)
+        self.assertGreater(db_util.get_invoice_version("VER-1"), version)
+        self.assertEqual(db_util.getInvoiceById("VER-1")["Items"][0]["Quantity"], 2)
+
+    def test_many_items_bump_the_invoice_once(self):
+        db_util.save_inv_extraction(vendor_extraction("VER-1", "VerVendor"))
+        versions = db_util.get_invoice_version("VER-1")[0], db_util.get_vendor_version("VerVendor")[0]
+        result = vendor_extraction("VER-1", "VerVendor")
+        result["data"]["Items"] = [{"Name": f"Item {n}", "Amount": 1.0} for n in range(400)]
+        db_util.save_inv_extraction(result)
+        self.assertEqual((db_util.get_invoice_version("VER-1")[0], db_util.get_vendor_version("VerVendor")[0]),
+                         (versions[0] + 1, versions[1] + 1))
+        # No per-row triggers on items, including those of earlier versions
+        with db_util.get_db() as conn:
+            triggers = [row[0] for row in conn.execute("SELECT tbl_name FROM sqlite_master WHERE type = 'trigger'")]
+        self.assertEqual(set(triggers), {"invoices"})
+
+    def test_versioned_invoice_matches_getInvoiceById(self):
+        db_util.save_inv_extraction(vendor_extraction("VER-1", "VerVendor"))
+        invoice, version = db_util.get_versioned_invoice("VER-1")
+        self.assertEqual(invoice, db_util.getInvoiceById("VER-1"))
+        self.assertEqual(version, db_util.get_invoice_version("VER-1"))
+        self.assertNotIn("Version", invoice)
+
+    def test_init_db_adds_versions_to_existing_database(self):
+        original_path = db_util.DB_PATH
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "old.db")
+            # A database created before the versions existed
+            conn = sqlite3.connect(path)
+            conn.execute("CREATE TABLE invoices (InvoiceId TEXT PRIMARY KEY, VendorName TEXT, InvoiceDate TEXT)")
+            conn.execute("INSERT INTO invoices VALUES ('OLD-1', 'OldVendor', NULL)")
+            conn.commit()
+            conn.close()
+            try:
+                db_util.DB_PATH = path
+                init_db()
+                versions = db_util.get_invoice_version("OLD-1"), db_util.get_vendor_version("OldVendor")
+                # A second startup does not bump them again
+                init_db()
+                self.assertEqual((db_util.get_invoice_version("OLD-1"), db_util.get_vendor_version("OldVendor")), versions)
+                db_util.close_connection()
+            finally:
+                db_util.DB_PATH = original_path
+        self.assertEqual([version for version, _ in versions], [1, 1])
+        self.assertTrue(all(modified_at for _, modified_at in versions))
+
+
+class TestConditionalGetInvoice(unittest.TestCase):
+    """ETag / Last-Modified and 304 answers of GET /invoice/{invoice_id}"""
+
+    def setUp(self):
+        init_db()
+        self.client = TestClient(app)
+        db_util.save_inv_extraction(extraction("COND-1", 10.0))
+        self.first = self.client.get("/invoice/COND-1")
+
+    def tearDown(self):
+        clean_db()
+
+    def test_validators_are_sent(self):
+        headers = self.first.headers
+        version, modified_at = db_util.get_invoice_version("COND-1")
+        self.assertEqual(headers["ETag"], conditional.etag(version, modified_at))
+        self.assertEqual(headers["Cache-Control"], "no-cache")
+        self.assertEqual(headers["Last-Modified"], email.utils.formatdate(modified_at, usegmt=True))
+
+    def test_matching_etag_is_not_modified_without_reading_the_invoice(self):
+        invoice_cache.cache.clear()
+        with patch("db_util.get_versioned_invoice") as read:
+            response = self.client.get("/invoice/COND-1", headers={"If-None-Match": self.first.headers["ETag"]})
+        read.assert_not_called()
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response.headers["ETag"], self.first.headers["ETag"])
+
+    def test_revalidation_of_a_cached_invoice_does_not_query(self):
+        with patch("db_util.get_invoice_version") as lookup:
+            response = self.client.get("/invoice/COND-1", headers={"If-None-Match": self.first.headers["ETag"]})
+        lookup.assert_not_called()
+        self.assertEqual(response.status_code, 304)
+
+    def test_rewritten_invoice_gets_a_new_etag(self):
+        db_util.save_inv_extraction(extraction("COND-1", 20.0))
+        response = self.client.get("/invoice/COND-1", headers={"If-None-Match": self.first.headers["ETag"]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["InvoiceTotal"], 20.0)
+        self.assertNotEqual(response.headers["ETag"], self.first.headers["ETag"])
+        # The old ETag is no longer current, the new one is
+        again = self.client.get("/invoice/COND-1", headers={"If-None-Match": response.headers["ETag"]})
+        self.assertEqual(again.status_code, 304)
+
+    def test_if_none_match_lists_and_wildcard(self):
+        etag = self.first.headers["ETag"]
+        for value in (f'"other", {etag}', etag.removeprefix("W/"), "*"):
+            response = self.client.get("/invoice/COND-1", headers={"If-None-Match": value})
+            self.assertEqual(response.status_code, 304, value)
+        self.assertEqual(self.client.get("/invoice/COND-1", headers={"If-None-Match": '"other"'}).status_code, 200)
+
+    def test_if_modified_since(self):
+        last_modified = self.first.headers["Last-Modified"]
+        cases = {
+            last_modified: 304,
+            "Thu, 01 Jan 2099 00:00:00 GMT": 304,
+            "Sat, 01 Jan 2000 00:00:00 GMT": 200,
+            "Sat, 01 Jan 2000 00:00:00 -0000": 200,
+            "not a date": 200,
+        }
+        for value, status in cases.items():
+            response = self.client.get("/invoice/COND-1", headers={"If-Modified-Since": value})
+            self.assertEqual(response.status_code, status, value)
+
+    def test_if_none_match_takes_precedence(self):
+        response = self.client.get("/invoice/COND-1", headers={
+            "If-None-Match": '"other"',
+            "If-Modified-Since": self.first.headers["Last-Modified"],
+        })
+        self.assertEqual(response.status_code, 200)
+
+    def test_unknown_invoice_is_not_found(self):
+        response = self.client.get("/invoice/MISSING", headers={"If-None-Match": "*"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_not_modified_metric(self):
+        sample = 'http_not_modified_total{endpoint="getInvoice"}'
+        before = sample_value(self.client.get("/metrics").text, sample)
+        self.client.get("/invoice/COND-1", headers={"If-None-Match": self.first.headers["ETag"]})
+        self.assertEqual(sample_value(self.client.get("/metrics").text, sample), before + 1)
+
+
+class TestConditionalGetVendor(unittest.TestCase):
+    """ETag / Last-Modified and 304 answers of GET /invoices/vendor/{vendor_name}"""
+
+    def setUp(self):
+        init_db()
+        self.client = TestClient(app)
+        db_util.save_inv_extractions([vendor_extraction(f"VCOND-{n}", "CondVendor") for n in range(3)])
+        self.first = self.client.get("/invoices/vendor/CondVendor")
+
+    def tearDown(self):
+        clean_db()
+
+    def revalidate(self, vendor_name="CondVendor", etag=None):
+        return self.client.get(f"/invoices/vendor/{vendor_name}",
+                               headers={"If-None-Match": etag or self.first.headers["ETag"]})
+
+    def test_unchanged_vendor_costs_one_indexed_lookup(self):
+        with patch("db_util.get_vendor_version", wraps=db_util.get_vendor_version) as lookup, \
+                patch("db_util.get_invoices_by_vendor") as page, patch("db_util.count_invoices_by_vendor") as count:
+            response = self.revalidate()
+        self.assertEqual(response.status_code, 304)
+        lookup.assert_called_once_with("CondVendor")
+        page.assert_not_called()
+        count.assert_not_called()
+
+        statements = []
+        conn = db_util.get_connection()
+        conn.set_trace_callback(statements.append)
+        try:
+            db_util.get_vendor_version("CondVendor")
+        finally:
+            conn.set_trace_callback(None)
+        [query] = [s for s in statements if s.lstrip().upper().startswith("SELECT")]
+        with db_util.get_db() as conn:
+            plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + query)]
+        self.assertEqual(plan, ["SEARCH vendor_versions USING INDEX sqlite_autoindex_vendor_versions_1 (VendorName=?)"])
+
+    def test_write_of_another_vendor_keeps_the_etag(self):
+        db_util.save_inv_extraction(vendor_extraction("OTHER-1", "OtherVendor"))
+        self.assertEqual(self.revalidate().status_code, 304)
+
+    def test_write_of_one_invoice_changes_the_etag(self):
+        db_util.save_inv_extraction(vendor_extraction("VCOND-1", "CondVendor", total=99.0))
+        response = self.revalidate()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(99.0, [invoice["InvoiceTotal"] for invoice in response.json()["invoices"]])
+
+    def test_invoice_moved_away_changes_the_etag(self):
+        db_util.save_inv_extraction(vendor_extraction("VCOND-1", "OtherVendor"))
+        response = self.revalidate()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["TotalInvoices"], 2)
+
+    def test_pages_are_revalidated(self):
+        page = self.client.get("/invoices/vendor/CondVendor?limit=2&include_items=false")
+        self.assertEqual(page.headers["ETag"], self.first.headers["ETag"])
+        response = self.client.get("/invoices/vendor/CondVendor?limit=2&include_items=false",
+                                   headers={"If-None-Match": page.headers["ETag"]})
+        self.assertEqual(response.status_code, 304)
+
+    def test_unknown_vendor(self):
+        response = self.client.get("/invoices/vendor/Nobody")
+        self.assertEqual(response.headers["ETag"], 'W/"0"')
+        self.assertNotIn("Last-Modified", response.headers)
+        self.assertEqual(self.revalidate("Nobody", 'W/"0"').status_code, 304)
+        db_util.save_inv_extraction(vendor_extraction("NEW-1", "Nobody"))
+        self.assertEqual(self.revalidate("Nobody", 'W/"0"').status_code, 200)
+
+
+class TestMvcWrites(unittest.TestCase):
+    """Writes of the MVC layer to the app's database change the ETags and the invoice cache"""
+
+    def setUp(self):
+        init_db()
+        self.client = TestClient(app)
+        self.engine = mvc_db.create_db_engine(f"sqlite:///{db_util.DB_PATH}")
+        self.db = sessionmaker(bind=self.engine, expire_on_commit=False)()
+        db_util.save_inv_extraction(vendor_extraction("MVC-1", "MvcVendor", total=1.0))
+
+    def tearDown(self):
+        self.db.close()
+        self.engine.dispose()
+        clean_db()
+
+    def revalidate(self, path, response):
+        return self.client.get(path, headers={"If-None-Match": response.headers["ETag"]})
+
+    def test_mvc_insert_changes_the_vendor_etag(self):
+        first = self.client.get("/invoices/vendor/MvcVendor")
+        save_extraction(self.db, {"InvoiceId": "MVC-2", "VendorName": "MvcVendor"}, [{"Name": "Pen"}], {})
+        response = self.revalidate("/invoices/vendor/MvcVendor", first)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["TotalInvoices"], 2)
+        self.assertEqual(self.revalidate("/invoices/vendor/MvcVendor", response).status_code, 304)
+
+    def test_mvc_rewrite_changes_the_invoice_and_drops_it_from_the_cache(self):
+        first = self.client.get("/invoice/MVC-1")
+        self.assertIn("MVC-1", invoice_cache.cache._entries)
+        save_extraction(self.db, {"InvoiceId": "MVC-1", "VendorName": "MvcVendor", "InvoiceTotal": 2.0}, [], {})
+        self.assertNotIn("MVC-1", invoice_cache.cache._entries)
+        response = self.revalidate("/invoice/MVC-1", first)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()["InvoiceTotal"], response.json()["Items"]), (2.0, []))
+
+    def test_mvc_save_of_the_same_extraction_keeps_the_etag_and_the_cache(self):
+        invoice = {"InvoiceId": "MVC-1", "VendorName": "MvcVendor", "InvoiceTotal": 2.0}
+        items = [{"Name": "Pen", "Quantity": 1}]
+        save_extraction(self.db, invoice, items, {"VendorName": 0.9})
+        first = self.client.get("/invoice/MVC-1")
+        save_extraction(self.db, invoice, items, {"VendorName": 0.9})
+        self.assertIn("MVC-1", invoice_cache.cache._entries)
+        invoice_cache.cache.clear()
+        self.assertEqual(self.revalidate("/invoice/MVC-1", first).status_code, 304)
+        self.assertEqual(save_extraction(self.db, invoice, items, {}).InvoiceTotal, 2.0)
+
+    def test_mvc_save_bumps_the_invoice_once(self):
+        version = db_util.get_invoice_version("MVC-1")[0]
+        items = [{"Name": f"Item {n}"} for n in range(50)]
+        save_extraction(self.db, {"InvoiceId": "MVC-1", "VendorName": "MvcVendor", "InvoiceTotal": 1.0}, items, {})
+        self.assertEqual(db_util.get_invoice_version("MVC-1")[0], version + 1)
+
+    def test_crud_helpers_change_the_invoice(self):
+        response = self.client.get("/invoice/MVC-1")
+        for write in (lambda: update_invoice(self.db, "MVC-1", {"InvoiceTotal": 7.0}),
+                      lambda: create_item(self.db, {"InvoiceId": "MVC-1", "Name": "Extra"})):
+            write()
+            changed = self.revalidate("/invoice/MVC-1", response)
+            self.assertEqual(changed.status_code, 200)
+            response = changed
+        self.assertEqual(response.json()["InvoiceTotal"], 7.0)
+        self.assertEqual(response.json()["Items"][-1]["Name"], "Extra")
+
+    def test_statement_without_invoice_id_clears_the_cache(self):
+        self.client.get("/invoice/MVC-1")
+        self.db.execute(update(Item).values(Name="Renamed"))
+        self.db.commit()
+        self.assertEqual(len(invoice_cache.cache), 0)
+        self.assertEqual(self.client.get("/invoice/MVC-1").json()["Items"][0]["Name"], "Renamed")
+
+    def test_rolled_back_writes_are_forgotten(self):
+        update_invoice(self.db, "MVC-1", {"InvoiceTotal": 3.0}, commit=False)
+        self.db.flush()
+        self.db.rollback()
+        self.assertNotIn("written_invoice_ids", self.db.info)
+
+    def test_shared_cache_log(self):
+        with patch("invoice_cache.INVOICE_CACHE_SHARED", True):
+            save_extraction(self.db, {"InvoiceId": "MVC-1", "VendorName": "MvcVendor", "InvoiceTotal": 4.0}, [], {})
+            self.db.execute(update(Item).values(Name="Renamed"))
+            self.db.commit()
+        with db_util.get_db() as conn:
+            logged = [row[0] for row in conn.execute("SELECT InvoiceId FROM invoice_invalidations ORDER BY Seq")]
+        self.assertEqual(logged, ["MVC-1", None])
+        # None makes the other processes drop every invoice
+        cache = invoice_cache.InvoiceCache()
+        cache.put("OTHER", ({}, (1, 1.0)), cache.generation)
+        log = invoice_cache.InvalidationLog(cache)
+        log.last_seq = 0
+        log.sync(force=True)
+        self.assertEqual(len(cache), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
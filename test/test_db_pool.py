@@ -0,0 +1,89 @@
+import threading
+import unittest
+
+import db_util
+from db_util import init_db, clean_db, get_db, save_inv_extraction, getInvoiceById
+
+
+class TestConnectionPool(unittest.TestCase):
+    """Tests for the per-thread connection pool in db_util"""
+
+    def setUp(self):
+        init_db()
+
+    def tearDown(self):
+        clean_db()
+
+    def test_connection_reused_within_thread(self):
+        with get_db() as first:
+            pass
+        with get_db() as second:
+            pass
+        self.assertIs(first, second)
+
+    def test_each_thread_gets_its_own_connection(self):
+        connections = []
+
+        def worker():
+            with get_db() as conn:
+                connections.append(conn)
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+        with get_db() as conn:
+            self.assertIsNot(conn, connections[0])
+
+    def test_pragmas_applied(self):
+        with get_db() as conn:
+            self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+            # NORMAL == 1
+            self.assertEqual(conn.execute("PRAGMA synchronous").fetchone()[0], 1)
+            self.assertEqual(conn.execute("PRAGMA busy_timeout").fetchone()[0], db_util.DB_SETTINGS["busy_timeout_ms"])
+            self.assertEqual(conn.execute("PRAGMA cache_size").fetchone()[0], db_util.DB_SETTINGS["cache_size"])
+
+    def test_init_db_settings_reopen_connections(self):
+        with get_db() as before:
+            pass
+        original = db_util.DB_SETTINGS["cache_size"]
+        try:
+            init_db(cache_size=-1024)
+            with get_db() as after:
+                self.assertEqual(after.execute("PRAGMA cache_size").fetchone()[0], -1024)
+            self.assertIsNot(before, after)
+        finally:
+            db_util.configure(cache_size=original)
+
+    def test_invalid_settings_rejected(self):
+        with self.assertRaises(ValueError):
+            db_util.configure(journal_mode="NOPE")
+        with self.assertRaises(ValueError):
+            db_util.configure(synchronous="SOMETIMES")
+        with self.assertRaises(ValueError):
+            db_util.configure(page_size=4096)
+
+    def test_error_rolls_back_unit_of_work(self):
+        with self.assertRaises(RuntimeError):
+            with get_db() as conn:
+                conn.execute("INSERT INTO invoices (InvoiceId) VALUES ('ROLLBACK-1')")
+                raise RuntimeError("boom")
+        self.assertIsNone(getInvoiceById("ROLLBACK-1"))
+
+    def test_nested_blocks_commit_once(self):
+        with get_db() as conn:
+            save_inv_extraction({"data": {"InvoiceId": "NESTED-1", "Items": []}})
+            # The inner save did not commit the outer transaction
+            self.assertTrue(conn.in_transaction)
+        self.assertIsNotNone(getInvoiceById("NESTED-1"))
+
+    def test_close_connection(self):
+        with get_db() as first:
+            pass
+        db_util.close_connection()
+        with get_db() as second:
+            pass
+        self.assertIsNot(first, second)
+
+
+if __name__ == "__main__":
+    unittest.main()
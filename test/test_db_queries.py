@@ -0,0 +1,56 @@
+import unittest
+
+import db_util
+from db_util import init_db, clean_db, save_inv_extraction, get_invoices_by_vendor
+
+
+class TestGetInvoicesByVendorQueries(unittest.TestCase):
+    """get_invoices_by_vendor must use a constant number of queries"""
+
+    def setUp(self):
+        init_db()
+        for n in range(20):
+            save_inv_extraction({"data": {
+                "InvoiceId": f"Q-{n}",
+                "VendorName": "QueryVendor",
+                "InvoiceTotal": float(n),
+                "Items": [
+                    {"Description": f"Item {n}-{k}", "Name": f"Item {n}-{k}", "Quantity": k, "UnitPrice": 1.0, "Amount": float(k)}
+                    for k in range(n % 3)
+                ]
+            }})
+        save_inv_extraction({"data": {"InvoiceId": "OTHER", "VendorName": "Other", "Items": [{"Name": "x"}]}})
+
+    def tearDown(self):
+        clean_db()
+
+    def count_statements(self, func, *args):
+        statements = []
+        # db_util reuses this thread's pooled connection
+        conn = db_util.get_connection()
+        conn.set_trace_callback(statements.append)
+        try:
+            result = func(*args)
+        finally:
+            conn.set_trace_callback(None)
+        return result, [s for s in statements if s.lstrip().upper().startswith("SELECT")]
+
+    def test_items_grouped_per_invoice(self):
+        invoices = get_invoices_by_vendor("QueryVendor")
+        self.assertEqual(len(invoices), 20)
+        for invoice in invoices:
+            n = int(invoice["InvoiceId"].split("-")[1])
+            self.assertEqual(invoice, db_util.getInvoiceById(invoice["InvoiceId"]))
+            self.assertEqual([item["Quantity"] for item in invoice["Items"]], list(range(n % 3)))
+
+    def test_query_count_does_not_grow_with_invoices(self):
+        invoices, selects = self.count_statements(get_invoices_by_vendor, "QueryVendor")
+        self.assertEqual(len(invoices), 20)
+        self.assertLessEqual(len(selects), 2)
+
+    def test_unknown_vendor_returns_empty_list(self):
+        self.assertEqual(get_invoices_by_vendor("Nobody"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
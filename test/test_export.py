@@ -0,0 +1,72 @@
+import json
+import os
+import tempfile
+import unittest
+from fastapi.testclient import TestClient
+
+import db_util
+import invoice_export
+from db_util import init_db, clean_db, save_inv_extractions, getInvoiceById
+from app import app
+
+
+class TestInvoiceExport(unittest.TestCase):
+    """Streaming NDJSON export: GET /invoices/export and the invoice_export CLI"""
+
+    def setUp(self):
+        self.client = TestClient(app)
+        init_db()
+        results = []
+        for n in range(7):
+            results.append({"data": {
+                "InvoiceId": f"E-{n}",
+                "VendorName": "ExportStore" if n % 2 else "OtherStore",
+                "InvoiceDate": f"2012-0{n + 1}-15T00:00:00+00:00",
+                "Items": [
+                    {"Description": "Pen", "Name": f"Pen {n}-{i}", "Quantity": i, "UnitPrice": 1.0, "Amount": float(i)}
+                    for i in range(n % 3)
+                ]
+            }})
+        save_inv_extractions(results)
+
+    def tearDown(self):
+        clean_db()
+
+    def export(self, **params):
+        response = self.client.get("/invoices/export", params=params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("application/x-ndjson"))
+        return [json.loads(line) for line in response.text.splitlines()]
+
+    def test_all_invoices_are_exported_with_items(self):
+        invoices = self.export()
+        self.assertEqual([invoice["InvoiceId"] for invoice in invoices], [f"E-{n}" for n in range(7)])
+        for invoice in invoices:
+            self.assertEqual(invoice, getInvoiceById(invoice["InvoiceId"]))
+
+    def test_vendor_and_date_filters(self):
+        invoices = self.export(vendor_name="ExportStore", date_from="2012-02-15", date_to="2012-06-01")
+        self.assertEqual([invoice["InvoiceId"] for invoice in invoices], ["E-1", "E-3"])
+
+    def test_batches_keep_items_with_their_invoice(self):
+        batches = list(db_util.iter_invoice_batches(batch_size=2))
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 2, 1])
+        for batch in batches:
+            for invoice in batch:
+                self.assertEqual(invoice["Items"], getInvoiceById(invoice["InvoiceId"])["Items"])
+
+    def test_cli_writes_ndjson_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, "invoices.ndjson")
+            original_path = db_util.DB_PATH
+            try:
+                invoice_export.main(["--db", original_path, "--from", "2012-05-01", "-o", output])
+            finally:
+                db_util.DB_PATH = original_path
+            with open(output, encoding="utf-8") as f:
+                ids = [json.loads(line)["InvoiceId"] for line in f]
+        self.assertEqual(ids, ["E-4", "E-5", "E-6"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,198 @@
+import base64
+import io
+import threading
+import time
+import unittest
+import zipfile
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+import fake_oci
+from db_util import init_db, clean_db, getInvoiceById
+from app import app
+from test.test_extract_new import build_fake_oci_response
+
+
+class FakeBatchClient:
+    """
+    Fake OCI client that returns a different InvoiceId per PDF and records
+    the highest number of concurrent analyze_document calls.
+    """
+
+    def __init__(self, latency=0.0, fail_on=None):
+        self.latency = latency
+        self.fail_on = fail_on
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def analyze_document(self, request):
+        with self.lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.latency)
+            # The fake PDFs end with their invoice id, see make_pdf()
+            invoice_id = self._invoice_id(request)
+            if invoice_id == self.fail_on:
+                raise Exception("OCI down")
+            response = build_fake_oci_response(doc_type_confidence=0.95)
+            # document_fields[0] is the InvoiceId field
+            response.data.pages[0].document_fields[0].field_value.text = invoice_id
+            return response
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    @staticmethod
+    def _invoice_id(request):
+        pdf_bytes = base64.b64decode(request.document.data)
+        return pdf_bytes.split(b"\n")[1].rsplit(b" ", 1)[-1].decode()
+
+
+def make_pdf(invoice_id):
+    return fake_oci.minimal_pdf(f"Fake PDF content {invoice_id}")
+
+
+class TestExtractBatch(unittest.TestCase):
+    """Integration tests for POST /extract/batch"""
+
+    def setUp(self):
+        init_db()
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        clean_db()
+
+    def test_batch_of_pdfs_is_extracted_and_saved(self):
+        fake_client = FakeBatchClient()
+        files = [("files", (f"{i}.pdf", make_pdf(f"B-{i}"), "application/pdf")) for i in range(3)]
+        with patch("app.get_doc_client", return_value=fake_client):
+            response = self.client.post("/extract/batch", files=files)
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body["TotalFiles"], 3)
+        self.assertEqual(body["Succeeded"], 3)
+        self.assertEqual(body["Failed"], 0)
+        self.assertGreater(body["DocsPerSecond"], 0)
+        self.assertEqual([r["filename"] for r in body["results"]], ["0.pdf", "1.pdf", "2.pdf"])
+        for i in range(3):
+            self.assertIsNotNone(getInvoiceById(f"B-{i}"))
+
+    def test_per_file_errors_do_not_fail_the_batch(self):
+        fake_client = FakeBatchClient(fail_on="B-2")
+        files = [
+            ("files", ("1.pdf", make_pdf("B-1"), "application/pdf")),
+            ("files", ("2.pdf", make_pdf("B-2"), "application/pdf")),
+            ("files", ("notes.txt", b"not a pdf", "text/plain")),
+        ]
+        with patch("app.get_doc_client", return_value=fake_client):
+            response = self.client.post("/extract/batch", files=files)
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body["Succeeded"], 1)
+        self.assertEqual(body["Failed"], 2)
+        statuses = {r["filename"]: r["status"] for r in body["results"]}
+        self.assertEqual(statuses, {"1.pdf": 200, "2.pdf": 503, "notes.txt": 400})
+        self.assertIsNotNone(getInvoiceById("B-1"))
+        self.assertIsNone(getInvoiceById("B-2"))
+        # The text file never reaches OCI
+        self.assertEqual(fake_client.calls, 2)
+
+    def test_zip_archive_is_expanded(self):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("a.pdf", make_pdf("Z-1"))
+            zf.writestr("b.pdf", make_pdf("Z-2"))
+            zf.writestr("readme.txt", "skip me")
+        files = [("files", ("invoices.zip", archive.getvalue(), "application/zip"))]
+        with patch("app.get_doc_client", return_value=FakeBatchClient()):
+            response = self.client.post("/extract/batch", files=files)
+
+        body = response.json()
+        self.assertEqual(body["TotalFiles"], 3)
+        self.assertEqual(body["Succeeded"], 2)
+        self.assertIsNotNone(getInvoiceById("Z-1"))
+        self.assertIsNotNone(getInvoiceById("Z-2"))
+
+    def test_corrupt_zip_and_cached_documents(self):
+        fake_client = FakeBatchClient()
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("nested/", "")
+            zf.writestr("nested/a.pdf", make_pdf("H-1"))
+        with patch("app.get_doc_client", return_value=fake_client):
+            self.client.post("/extract/batch", files=[("files", ("a.zip", archive.getvalue(), "application/zip"))])
+            response = self.client.post("/extract/batch", files=[
+                ("files", ("a.pdf", make_pdf("H-1"), "application/pdf")),
+                ("files", ("broken.zip", b"PK not really a zip", "application/zip")),
+            ])
+
+        results = response.json()["results"]
+        self.assertEqual(results[0]["cache"], "HIT")
+        self.assertEqual(results[1]["status"], 400)
+        self.assertEqual(fake_client.calls, 1)
+
+    def zip_upload(self, members, name="invoices.zip"):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            for filename, content in members:
+                zf.writestr(filename, content)
+        return ("files", (name, archive.getvalue(), "application/zip"))
+
+    def test_zip_over_max_files_is_rejected_before_expanding(self):
+        files = [self.zip_upload([(f"{i}.pdf", make_pdf(f"ZM-{i}")) for i in range(3)])]
+        with patch("app.BATCH_MAX_FILES", 2), patch("app.read_zip_documents") as read:
+            response = self.client.post("/extract/batch", files=files)
+        self.assertEqual(response.status_code, 400)
+        read.assert_not_called()
+        # Plain files and archive members count together
+        files = [self.zip_upload([("a.pdf", make_pdf("ZM-A"))]), ("files", ("b.pdf", make_pdf("ZM-B"), "application/pdf"))]
+        with patch("app.BATCH_MAX_FILES", 1):
+            self.assertEqual(self.client.post("/extract/batch", files=files).status_code, 400)
+
+    def test_oversized_zip_member_is_not_decompressed(self):
+        # Compresses to a few hundred bytes
+        bomb = make_pdf("ZB-1").replace(b"%%EOF", b" " * 200000 + b"%%EOF")
+        files = [self.zip_upload([("bomb.pdf", bomb), ("ok.pdf", make_pdf("ZB-2"))])]
+        fake_client = FakeBatchClient()
+        with patch("pdf_validation.PDF_MAX_BYTES", 100000), patch("app.get_doc_client", return_value=fake_client), \
+                patch("zipfile.ZipFile.read", autospec=True, side_effect=zipfile.ZipFile.read) as read:
+            response = self.client.post("/extract/batch", files=files)
+        statuses = {r["filename"]: r["status"] for r in response.json()["results"]}
+        self.assertEqual(statuses, {"bomb.pdf": 413, "ok.pdf": 200})
+        self.assertEqual([call.args[1].filename for call in read.call_args_list], ["ok.pdf"])
+        self.assertEqual(fake_client.calls, 1)
+
+    def test_zip_expanding_past_batch_limit_is_rejected(self):
+        padded = make_pdf("ZE-1").replace(b"%%EOF", b" " * 200000 + b"%%EOF")
+        files = [self.zip_upload([("a.pdf", padded), ("b.pdf", padded)])]
+        with patch("uploads.BATCH_UPLOAD_MAX_BYTES", 300000), patch("app.read_zip_documents") as read:
+            response = self.client.post("/extract/batch", files=files)
+        self.assertEqual(response.status_code, 413)
+        read.assert_not_called()
+
+    def test_concurrency_limit_is_respected(self):
+        fake_client = FakeBatchClient(latency=0.05)
+        files = [("files", (f"{i}.pdf", make_pdf(f"C-{i}"), "application/pdf")) for i in range(8)]
+        with patch("app.get_doc_client", return_value=fake_client):
+            response = self.client.post("/extract/batch?concurrency=2", files=files)
+
+        self.assertEqual(response.json()["Succeeded"], 8)
+        self.assertLessEqual(fake_client.max_in_flight, 2)
+        self.assertGreater(fake_client.max_in_flight, 1)
+
+    def test_too_many_files_returns_400(self):
+        files = [("files", (f"{i}.pdf", make_pdf(f"M-{i}"), "application/pdf")) for i in range(3)]
+        with patch("app.BATCH_MAX_FILES", 2):
+            response = self.client.post("/extract/batch", files=files)
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
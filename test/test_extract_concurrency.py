@@ -0,0 +1,59 @@
+import asyncio
+import threading
+import unittest
+from unittest.mock import patch
+
+import httpx
+
+import fake_oci
+from db_util import init_db, clean_db, save_inv_extraction
+from app import app
+from test.test_extract_new import build_fake_oci_response
+
+
+class BlockingFakeClient:
+    """Fake OCI client whose analyze_document blocks until released."""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def analyze_document(self, request):
+        self.started.set()
+        self.release.wait(timeout=5)
+        return build_fake_oci_response(doc_type_confidence=0.95)
+
+
+class TestExtractDoesNotBlockReads(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        init_db()
+        save_inv_extraction({"data": {"InvoiceId": "777", "VendorName": "SuperStore", "Items": []}})
+        self.pdf_bytes = fake_oci.minimal_pdf("Fake PDF content")
+
+    def tearDown(self):
+        clean_db()
+
+    async def test_read_served_while_oci_call_in_flight(self):
+        fake_client = BlockingFakeClient()
+        transport = httpx.ASGITransport(app=app)
+        with patch("app.get_doc_client", return_value=fake_client):
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                files = {"file": ("test.pdf", self.pdf_bytes, "application/pdf")}
+                extract_task = asyncio.create_task(client.post("/extract", files=files))
+                # Wait until the OCI call is running in the executor
+                started = await asyncio.get_running_loop().run_in_executor(None, fake_client.started.wait, 5)
+                self.assertTrue(started)
+
+                # The read must complete while the extraction is still blocked
+                response = await asyncio.wait_for(client.get("/invoice/777"), timeout=2)
+                self.assertEqual(response.status_code, 200)
+                self.assertFalse(extract_task.done())
+
+                fake_client.release.set()
+                extract_response = await extract_task
+                self.assertEqual(extract_response.status_code, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,6 @@
 import unittest
 from unittest.mock import patch, MagicMock
+import fake_oci
 from db_util import init_db, clean_db
 from fastapi.testclient import TestClient
 from app import app
@@ -85,7 +86,7 @@ class TestNewExtract(unittest.TestCase):
         init_db()
         self.client = TestClient(app)
         # Fake PDF used in all tests
-        self.pdf_bytes = b"%PDF-1.4\n%Fake PDF content\n"
+        self.pdf_bytes = fake_oci.minimal_pdf("Fake PDF content")
         self.files = {"file": ("test.pdf", self.pdf_bytes, "application/pdf")}
     def tearDown(self):
         clean_db()
@@ -0,0 +1,136 @@
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+
+from fastapi.testclient import TestClient
+
+import extraction_cache
+import fake_oci
+from db_util import init_db, clean_db, get_db
+from app import app
+from test.test_extract_new import build_fake_oci_response
+
+
+class TestExtractionCacheEndpoint(unittest.TestCase):
+    """Integration tests for the PDF hash cache in front of POST /extract"""
+
+    def setUp(self):
+        init_db()
+        self.client = TestClient(app)
+        self.pdf_bytes = fake_oci.minimal_pdf("Cached PDF content")
+        self.files = {"file": ("test.pdf", self.pdf_bytes, "application/pdf")}
+
+    def tearDown(self):
+        clean_db()
+
+    @patch("app.get_doc_client")
+    def test_repeat_upload_served_from_cache(self, mock_get_client):
+        mock_client = MagicMock()
+        mock_get_client.return_value = mock_client
+        mock_client.analyze_document.return_value = build_fake_oci_response(doc_type_confidence=0.95)
+
+        first = self.client.post("/extract", files=self.files)
+        second = self.client.post("/extract", files=self.files)
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(first.headers["X-Extraction-Cache"], "MISS")
+        self.assertEqual(second.headers["X-Extraction-Cache"], "HIT")
+        self.assertEqual(mock_client.analyze_document.call_count, 1)
+        self.assertEqual(second.json()["data"], first.json()["data"])
+        self.assertEqual(second.json()["dataConfidence"], first.json()["dataConfidence"])
+
+    @patch("app.get_doc_client")
+    def test_repeat_upload_keeps_the_invoice_etag(self, mock_get_client):
+        mock_client = MagicMock()
+        mock_get_client.return_value = mock_client
+        mock_client.analyze_document.return_value = build_fake_oci_response(doc_type_confidence=0.95)
+
+        invoice_id = self.client.post("/extract", files=self.files).json()["data"]["InvoiceId"]
+        invoice = self.client.get(f"/invoice/{invoice_id}")
+        second = self.client.post("/extract", files=self.files)
+        response = self.client.get(f"/invoice/{invoice_id}", headers={"If-None-Match": invoice.headers["ETag"]})
+
+        self.assertEqual(second.headers["X-Extraction-Cache"], "HIT")
+        self.assertEqual(response.status_code, 304)
+
+    @patch("app.get_doc_client")
+    def test_no_cache_header_forces_extraction(self, mock_get_client):
+        mock_client = MagicMock()
+        mock_get_client.return_value = mock_client
+        mock_client.analyze_document.return_value = build_fake_oci_response(doc_type_confidence=0.95)
+
+        self.client.post("/extract", files=self.files)
+        response = self.client.post("/extract", files=self.files, headers={"Cache-Control": "no-cache"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["X-Extraction-Cache"], "MISS")
+        self.assertEqual(mock_client.analyze_document.call_count, 2)
+
+    @patch("app.get_doc_client")
+    def test_low_confidence_result_is_not_cached(self, mock_get_client):
+        mock_client = MagicMock()
+        mock_get_client.return_value = mock_client
+        mock_client.analyze_document.return_value = build_fake_oci_response(doc_type_confidence=0.5)
+
+        self.client.post("/extract", files=self.files)
+        response = self.client.post("/extract", files=self.files)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(mock_client.analyze_document.call_count, 2)
+
+    @patch("app.get_doc_client")
+    def test_metrics_expose_hits_and_misses(self, mock_get_client):
+        mock_client = MagicMock()
+        mock_get_client.return_value = mock_client
+        mock_client.analyze_document.return_value = build_fake_oci_response(doc_type_confidence=0.95)
+        hits_before = extraction_cache.cache_hits.value
+        misses_before = extraction_cache.cache_misses.value
+
+        self.client.post("/extract", files=self.files)
+        self.client.post("/extract", files=self.files)
+        response = self.client.get("/metrics")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(f"extraction_cache_hits_total {hits_before + 1}", response.text)
+        self.assertIn(f"extraction_cache_misses_total {misses_before + 1}", response.text)
+
+
+class TestExtractionCacheEviction(unittest.TestCase):
+    """Unit tests for the TTL and size eviction policy"""
+
+    def setUp(self):
+        init_db()
+        self.result = {"confidence": 0.99, "data": {"InvoiceId": "1"}, "dataConfidence": {"InvoiceId": 0.9}}
+
+    def tearDown(self):
+        clean_db()
+
+    def test_expired_entry_is_a_miss(self):
+        extraction_cache.put("expired", self.result)
+        with get_db() as conn:
+            conn.execute("UPDATE extraction_cache SET CreatedAt = ?", (time.time() - 10,))
+        with patch("extraction_cache.CACHE_TTL_SECONDS", 5):
+            self.assertIsNone(extraction_cache.get("expired"))
+        with get_db() as conn:
+            count = conn.execute("SELECT COUNT(*) FROM extraction_cache").fetchone()[0]
+        self.assertEqual(count, 0)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        with patch("extraction_cache.CACHE_MAX_ENTRIES", 2):
+            extraction_cache.put("a", self.result)
+            time.sleep(0.01)
+            extraction_cache.put("b", self.result)
+            time.sleep(0.01)
+            # Touch "a" so "b" becomes the least recently used entry
+            extraction_cache.get("a")
+            time.sleep(0.01)
+            extraction_cache.put("c", self.result)
+
+        self.assertIsNotNone(extraction_cache.get("a"))
+        self.assertIsNone(extraction_cache.get("b"))
+        self.assertIsNotNone(extraction_cache.get("c"))
+
+
+if __name__ == "__main__":
+    unittest.main()
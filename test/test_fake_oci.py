@@ -0,0 +1,93 @@
+import random
+import threading
+import unittest
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+import fake_oci
+import oci_client_pool
+import oci_resilience
+from db_util import init_db, clean_db, getInvoiceById
+from app import app, build_analyze_request, parse_extraction_response
+
+SAMPLE_PDF = "invoices_sample/invoice_Aaron_Bergman_36259.pdf"
+
+
+class TestFakeOCI(unittest.TestCase):
+    """The local OCI Document AI stand-in, in-process and over HTTP"""
+
+    def setUp(self):
+        init_db()
+        self.client = TestClient(app)
+        with open(SAMPLE_PDF, "rb") as f:
+            self.pdf_bytes = f.read()
+
+    def tearDown(self):
+        clean_db()
+
+    def test_sample_pdf_is_extracted_with_its_printed_fields(self):
+        with patch("app.get_doc_client", return_value=fake_oci.FakeDocumentClient()):
+            response = self.client.post("/extract", files={"file": ("a.pdf", self.pdf_bytes, "application/pdf")})
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()["data"]
+        self.assertEqual(data["InvoiceId"], "36259")
+        self.assertEqual(data["InvoiceDate"], "2012-03-06T00:00:00+00:00")
+        self.assertEqual(data["InvoiceTotal"], 58.11)
+        self.assertEqual(data["Items"], [{
+            "Description": "Newell 330 Art, Office Supplies, OFF-AR-5309",
+            "Name": "Newell 330 Art, Office Supplies, OFF-AR-5309",
+            "Quantity": 3,
+            "UnitPrice": 17.94,
+            "Amount": 53.82,
+        }])
+        self.assertIsNotNone(getInvoiceById("36259"))
+
+    def test_unknown_pdf_gets_a_stable_synthetic_invoice(self):
+        fake = fake_oci.FakeDocumentClient()
+        request = build_analyze_request(fake_oci.minimal_pdf("Some other invoice"))
+        first = parse_extraction_response(fake.analyze_document(request), 0)
+        second = parse_extraction_response(fake.analyze_document(request), 0)
+        self.assertEqual(first, second)
+        self.assertTrue(first["data"]["InvoiceId"])
+        self.assertGreater(len(first["data"]["Items"]), 0)
+
+    def test_http_server_matches_in_process_fake(self):
+        fake = fake_oci.FakeDocumentClient()
+        server = fake_oci.make_server(fake, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            client = fake_oci.http_client(f"http://127.0.0.1:{server.server_port}")
+            request = build_analyze_request(self.pdf_bytes)
+            over_http = parse_extraction_response(client.analyze_document(request), 0)
+        finally:
+            server.shutdown()
+            server.server_close()
+        in_process = parse_extraction_response(fake.analyze_document(request), 0)
+        self.assertEqual(over_http, in_process)
+
+    def test_injected_errors_surface_as_503(self):
+        fake = fake_oci.FakeDocumentClient(error_rate=1.0)
+        with patch("app.get_doc_client", return_value=fake), patch("oci_resilience.OCI_BACKOFF_BASE", 0.001):
+            response = self.client.post("/extract", files={"file": ("a.pdf", self.pdf_bytes, "application/pdf")})
+        oci_resilience.breaker.reset()
+        self.assertEqual(response.status_code, 503)
+        # The 503s are retried before giving up
+        self.assertEqual(fake.calls, oci_resilience.OCI_MAX_ATTEMPTS)
+
+    def test_fake_oci_setting_selects_the_in_process_fake(self):
+        with patch("oci_client_pool.FAKE_OCI", "local"):
+            self.assertIsInstance(oci_client_pool.create_client(), fake_oci.FakeDocumentClient)
+
+    def test_latency_specs(self):
+        rng = random.Random(1)
+        self.assertEqual(fake_oci.LatencyModel("0.25").sample(rng), 0.25)
+        self.assertTrue(0.1 <= fake_oci.LatencyModel("uniform:0.1,0.2").sample(rng) <= 0.2)
+        self.assertGreater(fake_oci.LatencyModel("lognormal:1,0.5").sample(rng), 0)
+        with self.assertRaises(ValueError):
+            fake_oci.LatencyModel("gamma:1")
+
+
+if __name__ == "__main__":
+    unittest.main()
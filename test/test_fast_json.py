@@ -0,0 +1,133 @@
+import gzip
+import json
+import types
+import unittest
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+import db_util
+import fast_json
+from db_util import init_db, clean_db
+from app import app
+from test.test_conditional_get import vendor_extraction
+from test.test_metrics import sample_value
+
+# Stand-in for the optional brotli package
+fake_brotli = types.SimpleNamespace(compress=lambda body, quality: b"br:" + body)
+
+
+class TestDumps(unittest.TestCase):
+    """Same JSON from orjson and from the stdlib fallback"""
+
+    content = {
+        "VendorName": "Café Ünïcode",
+        "TotalInvoices": 2,
+        "invoices": [{"InvoiceId": "1", "InvoiceTotal": 12.5, "SubTotal": None, "Items": []},
+                     {"InvoiceId": "2", "InvoiceTotal": 1e-7, "SubTotal": 3.0, "Items": [{"Quantity": 2}]}],
+        "nextCursor": None,
+    }
+
+    def test_orjson_and_stdlib_agree(self):
+        fast = fast_json.dumps(self.content)
+        with patch("fast_json.FAST_JSON_ENABLED", False):
+            stdlib = fast_json.dumps(self.content)
+        self.assertEqual(stdlib, fast_json.JSONResponse(self.content).body)
+        self.assertEqual(json.loads(fast), json.loads(stdlib))
+        self.assertEqual(json.loads(fast), self.content)
+
+    def test_stdlib_fallback_without_orjson(self):
+        with patch("fast_json.orjson", None):
+            self.assertEqual(fast_json.dumps(self.content), fast_json.JSONResponse(self.content).body)
+
+
+class TestChooseEncoding(unittest.TestCase):
+    """Accept-Encoding negotiation"""
+
+    def test_gzip_only(self):
+        cases = {
+            None: None,
+            "": None,
+            "identity": None,
+            "gzip": "gzip",
+            "deflate, gzip;q=0.5": "gzip",
+            "gzip;q=0": None,
+            "*": "gzip",
+            "*;q=0": None,
+            "br": None,
+            "gzip;q=bad": None,
+        }
+        for header, expected in cases.items():
+            self.assertEqual(fast_json.choose_encoding(header), expected, header)
+
+    def test_brotli_preferred_when_installed(self):
+        with patch("fast_json.brotli", fake_brotli):
+            self.assertEqual(fast_json.choose_encoding("gzip, deflate, br"), "br")
+            self.assertEqual(fast_json.choose_encoding("br;q=0.5, gzip"), "gzip")
+            self.assertEqual(fast_json.choose_encoding("br;q=0, *"), "gzip")
+            self.assertEqual(fast_json.choose_encoding("*"), "br")
+
+
+class TestFastJSONResponse(unittest.TestCase):
+
+    big = {"invoices": [{"InvoiceId": str(n), "VendorName": "SuperStore"} for n in range(100)]}
+
+    def test_small_bodies_are_not_compressed(self):
+        response = fast_json.FastJSONResponse({"InvoiceId": "1"}, accept_encoding="gzip")
+        self.assertNotIn("content-encoding", response.headers)
+        self.assertEqual(response.headers["vary"], "Accept-Encoding")
+
+    def test_large_bodies_are_compressed(self):
+        response = fast_json.FastJSONResponse(self.big, headers={"ETag": 'W/"1"'}, accept_encoding="gzip")
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertEqual(response.headers["etag"], 'W/"1"')
+        self.assertEqual(int(response.headers["content-length"]), len(response.body))
+        self.assertEqual(json.loads(gzip.decompress(response.body)), self.big)
+
+    def test_brotli(self):
+        with patch("fast_json.brotli", fake_brotli):
+            response = fast_json.FastJSONResponse(self.big, accept_encoding="br")
+        self.assertEqual(response.headers["content-encoding"], "br")
+        self.assertEqual(json.loads(response.body.removeprefix(b"br:")), self.big)
+
+    def test_compression_can_be_disabled(self):
+        with patch("fast_json.COMPRESS_MIN_BYTES", 0):
+            response = fast_json.FastJSONResponse(self.big, accept_encoding="gzip")
+        self.assertNotIn("content-encoding", response.headers)
+
+
+class TestReadEndpoints(unittest.TestCase):
+    """The invoice and vendor endpoints use FastJSONResponse"""
+
+    def setUp(self):
+        init_db()
+        self.client = TestClient(app)
+        db_util.save_inv_extractions([vendor_extraction(f"FJ-{n}", "JsonVendor") for n in range(50)])
+
+    def tearDown(self):
+        clean_db()
+
+    def test_vendor_listing_is_compressed(self):
+        identity = self.client.get("/invoices/vendor/JsonVendor", headers={"Accept-Encoding": "identity"})
+        self.assertNotIn("content-encoding", identity.headers)
+        before = sample_value(self.client.get("/metrics").text, 'compressed_responses_total{encoding="gzip"}')
+        response = self.client.get("/invoices/vendor/JsonVendor", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertLess(int(response.headers["content-length"]), len(identity.content) / 4)
+        self.assertEqual(response.json(), identity.json())
+        self.assertEqual(response.headers["etag"], identity.headers["etag"])
+        self.assertEqual(response.json()["TotalInvoices"], 50)
+        after = sample_value(self.client.get("/metrics").text, 'compressed_responses_total{encoding="gzip"}')
+        self.assertEqual(after, before + 1)
+
+    def test_jsonable_encoder_is_skipped(self):
+        with patch("fastapi.routing.jsonable_encoder") as encoder:
+            invoice = self.client.get("/invoice/FJ-1")
+            vendor = self.client.get("/invoices/vendor/JsonVendor?limit=5")
+        encoder.assert_not_called()
+        self.assertEqual(invoice.json(), db_util.getInvoiceById("FJ-1"))
+        self.assertEqual(len(vendor.json()["invoices"]), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+from db_util import init_db, clean_db, save_inv_extraction
+from fastapi.testclient import TestClient
+from app import app
+
+
+class TestGetInvoicesByVendorPages(unittest.TestCase):
+    """Keyset pagination of GET /invoices/vendor/{vendor_name}"""
+
+    def setUp(self):
+        self.client = TestClient(app)
+        init_db()
+        self.vendor_name = "PagedStore"
+        dates = [None, "2012-03-06T00:00:00+00:00", "2012-03-06T00:00:00+00:00", "2011-01-01T00:00:00+00:00", None, "2013-07-01T00:00:00+00:00"]
+        for n, invoice_date in enumerate(dates):
+            save_inv_extraction({"data": {
+                "InvoiceId": f"P-{n}",
+                "VendorName": self.vendor_name,
+                "InvoiceDate": invoice_date,
+                "Items": [{"Description": "Pen", "Name": "Blue Pen", "Quantity": n, "UnitPrice": 1.0, "Amount": float(n)}]
+            }})
+        # Expected order: undated invoices first, then by (InvoiceDate, InvoiceId)
+        self.expected_ids = ["P-0", "P-4", "P-3", "P-1", "P-2", "P-5"]
+
+    def tearDown(self):
+        clean_db()
+
+    def test_pages_cover_all_invoices_in_order(self):
+        seen = []
+        cursor = None
+        pages = 0
+        while True:
+            params = {"limit": 2}
+            if cursor:
+                params["cursor"] = cursor
+            response = self.client.get(f"/invoices/vendor/{self.vendor_name}", params=params)
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            self.assertEqual(body["TotalInvoices"], 6)
+            self.assertLessEqual(len(body["invoices"]), 2)
+            seen.extend(invoice["InvoiceId"] for invoice in body["invoices"])
+            pages += 1
+            cursor = body["nextCursor"]
+            if not cursor:
+                break
+        self.assertEqual(seen, self.expected_ids)
+        self.assertEqual(pages, 3)
+
+    def test_unpaginated_listing_is_ordered_without_cursor(self):
+        body = self.client.get(f"/invoices/vendor/{self.vendor_name}").json()
+        self.assertEqual([invoice["InvoiceId"] for invoice in body["invoices"]], self.expected_ids)
+        self.assertIsNone(body["nextCursor"])
+
+    def test_items_can_be_omitted(self):
+        body = self.client.get(f"/invoices/vendor/{self.vendor_name}", params={"limit": 3, "include_items": "false"}).json()
+        self.assertEqual(len(body["invoices"]), 3)
+        for invoice in body["invoices"]:
+            self.assertNotIn("Items", invoice)
+
+    def test_items_belong_to_their_invoice(self):
+        body = self.client.get(f"/invoices/vendor/{self.vendor_name}", params={"limit": 4}).json()
+        for invoice in body["invoices"]:
+            n = int(invoice["InvoiceId"].split("-")[1])
+            self.assertEqual([item["Quantity"] for item in invoice["Items"]], [n])
+
+    def test_invalid_cursor_returns_400(self):
+        response = self.client.get(f"/invoices/vendor/{self.vendor_name}", params={"limit": 2, "cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"detail": "Invalid cursor"})
+
+    def test_invalid_limit_returns_422(self):
+        response = self.client.get(f"/invoices/vendor/{self.vendor_name}", params={"limit": 0})
+        self.assertEqual(response.status_code, 422)
+
+
+if __name__ == "__main__":
+    unittest.main()
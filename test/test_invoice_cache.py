@@ -0,0 +1,209 @@
+import threading
+import unittest
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+import db_util
+import invoice_cache
+from db_util import init_db, clean_db
+from app import app
+from test.test_metrics import sample_value
+
+
+def extraction(invoice_id, total, items=1):
+    return {
+        "data": {
+            "InvoiceId": invoice_id,
+            "VendorName": "SuperStore",
+            "InvoiceDate": "2012-03-06T00:00:00+00:00",
+            "InvoiceTotal": total,
+            "Items": [{"Description": f"Item {n}", "Name": f"Item {n}", "Quantity": 1, "UnitPrice": 1.0, "Amount": 1.0}
+                      for n in range(items)],
+        },
+        "dataConfidence": {"VendorName": 0.9},
+    }
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestInvoiceCache(unittest.TestCase):
+    """LRU and TTL bounds of the in-process cache"""
+
+    def test_least_recently_used_invoice_is_evicted(self):
+        cache = invoice_cache.InvoiceCache(max_entries=2, ttl=60)
+        for key in ("a", "b"):
+            cache.put(key, {"InvoiceId": key}, cache.generation)
+        cache.get("a")
+        cache.put("c", {"InvoiceId": "c"}, cache.generation)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("a"))
+
+    def test_entries_expire(self):
+        clock = FakeClock()
+        cache = invoice_cache.InvoiceCache(max_entries=10, ttl=5, clock=clock)
+        cache.put("a", {"InvoiceId": "a"}, cache.generation)
+        clock.now = 4.9
+        self.assertIsNotNone(cache.get("a"))
+        clock.now = 5.0
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+    def test_value_read_before_an_invalidation_is_not_stored(self):
+        cache = invoice_cache.InvoiceCache(max_entries=10, ttl=60)
+        generation = cache.generation
+        # A write commits and invalidates while the old invoice is being read
+        cache.invalidate(["a"])
+        cache.put("a", {"InvoiceId": "a", "InvoiceTotal": "old"}, generation)
+        self.assertIsNone(cache.get("a"))
+
+    def test_disabled_by_zero_entries(self):
+        cache = invoice_cache.InvoiceCache(max_entries=0, ttl=60)
+        cache.put("a", {"InvoiceId": "a"}, cache.generation)
+        self.assertIsNone(cache.get("a"))
+
+
+class TestInvoiceReadThrough(unittest.TestCase):
+    """GET /invoice/{invoice_id} through the cache, invalidated by writes"""
+
+    def setUp(self):
+        init_db()
+        self.client = TestClient(app)
+        db_util.save_inv_extraction(extraction("CACHE-1", 10.0))
+        patcher = patch("db_util.get_versioned_invoice", wraps=db_util.get_versioned_invoice)
+        self.reads = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        clean_db()
+
+    def metric(self, name):
+        return sample_value(self.client.get("/metrics").text, name)
+
+    def test_repeat_reads_are_served_from_the_cache(self):
+        hits, misses = self.metric("invoice_cache_hits_total"), self.metric("invoice_cache_misses_total")
+        responses = [self.client.get("/invoice/CACHE-1") for _ in range(5)]
+        self.assertEqual({r.json()["InvoiceTotal"] for r in responses}, {10.0})
+        self.assertEqual(self.reads.call_count, 1)
+        self.assertEqual(self.metric("invoice_cache_hits_total"), hits + 4)
+        self.assertEqual(self.metric("invoice_cache_misses_total"), misses + 1)
+
+    def test_rewritten_invoice_is_read_again(self):
+        self.client.get("/invoice/CACHE-1")
+        db_util.save_inv_extraction(extraction("CACHE-1", 20.0, items=3))
+        response = self.client.get("/invoice/CACHE-1").json()
+        self.assertEqual((response["InvoiceTotal"], len(response["Items"])), (20.0, 3))
+
+        db_util.save_inv_extractions([extraction("CACHE-1", 30.0), extraction("CACHE-2", 5.0)])
+        self.assertEqual(self.client.get("/invoice/CACHE-1").json()["InvoiceTotal"], 30.0)
+        self.assertEqual(self.reads.call_count, 3)
+
+    def test_other_invoices_stay_cached(self):
+        self.client.get("/invoice/CACHE-1")
+        db_util.save_inv_extraction(extraction("CACHE-OTHER", 1.0))
+        self.client.get("/invoice/CACHE-1")
+        self.assertEqual(self.reads.call_count, 1)
+
+    def test_unknown_invoices_are_not_cached(self):
+        for _ in range(2):
+            self.assertEqual(self.client.get("/invoice/MISSING").status_code, 404)
+        self.assertEqual(self.reads.call_count, 2)
+        db_util.save_inv_extraction(extraction("MISSING", 1.0))
+        self.assertEqual(self.client.get("/invoice/MISSING").status_code, 200)
+
+    def test_disabled_cache_reads_the_database(self):
+        with patch("invoice_cache.INVOICE_CACHE_ENABLED", False):
+            for _ in range(2):
+                self.client.get("/invoice/CACHE-1")
+        self.assertEqual(self.reads.call_count, 2)
+
+    def test_clean_db_clears_the_cache(self):
+        self.client.get("/invoice/CACHE-1")
+        clean_db()
+        self.assertEqual(self.client.get("/invoice/CACHE-1").status_code, 404)
+
+    def test_concurrent_readers_and_writer(self):
+        # Readers must never keep serving an invoice older than the last write
+        stop = threading.Event()
+
+        def read():
+            while not stop.is_set():
+                invoice_cache.get_invoice("CACHE-1")
+
+        readers = [threading.Thread(target=read) for _ in range(4)]
+        for reader in readers:
+            reader.start()
+        try:
+            for total in range(11, 41):
+                db_util.save_inv_extraction(extraction("CACHE-1", float(total)))
+        finally:
+            stop.set()
+            for reader in readers:
+                reader.join()
+        self.assertEqual(invoice_cache.get_invoice("CACHE-1")["InvoiceTotal"], 40.0)
+
+
+class TestSharedInvalidation(unittest.TestCase):
+    """With INVOICE_CACHE_SHARED, writes of one process reach the others"""
+
+    def setUp(self):
+        init_db()
+        patcher = patch("invoice_cache.INVOICE_CACHE_SHARED", True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        db_util.save_inv_extraction(extraction("SHARED-1", 10.0))
+
+    def tearDown(self):
+        clean_db()
+
+    def test_other_process_drops_the_rewritten_invoice(self):
+        # The cache of another worker process, which does not see our writes
+        other = invoice_cache.InvoiceCache(max_entries=10, ttl=60)
+        log = invoice_cache.InvalidationLog(other, sync_seconds=0)
+        log.sync()
+        other.put("SHARED-1", db_util.getInvoiceById("SHARED-1"), other.generation)
+        other.put("SHARED-2", {"InvoiceId": "SHARED-2"}, other.generation)
+
+        db_util.save_inv_extraction(extraction("SHARED-1", 20.0))
+        log.sync()
+        self.assertIsNone(other.get("SHARED-1"))
+        self.assertIsNotNone(other.get("SHARED-2"))
+
+    def test_sync_is_rate_limited(self):
+        other = invoice_cache.InvoiceCache(max_entries=10, ttl=60)
+        clock = FakeClock()
+        log = invoice_cache.InvalidationLog(other, sync_seconds=1, clock=clock)
+        log.sync()
+        other.put("SHARED-1", {"InvoiceId": "SHARED-1"}, other.generation)
+        db_util.save_inv_extraction(extraction("SHARED-1", 20.0))
+        clock.now = 0.5
+        log.sync()
+        self.assertIsNotNone(other.get("SHARED-1"))
+        clock.now = 1.0
+        log.sync()
+        self.assertIsNone(other.get("SHARED-1"))
+
+    def test_old_invalidations_are_pruned(self):
+        with db_util.get_db() as conn:
+            conn.execute("INSERT INTO invoice_invalidations (InvoiceId, CreatedAt) VALUES ('OLD', 0)")
+            conn.commit()
+        db_util.save_inv_extraction(extraction("SHARED-1", 20.0))
+        with db_util.get_db() as conn:
+            ids = [row[0] for row in conn.execute("SELECT InvoiceId FROM invoice_invalidations")]
+        self.assertEqual(ids, ["SHARED-1", "SHARED-1"])
+
+    def test_reads_sync_before_using_the_cache(self):
+        with patch.object(invoice_cache.invalidation_log, "sync") as sync:
+            invoice_cache.get_invoice("SHARED-1")
+        sync.assert_called_once_with()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,221 @@
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import db_util
+import fake_oci
+import job_queue
+import oci_limiter
+from db_util import init_db, clean_db, get_db, getInvoiceById
+from app import app, process_document
+from test.test_extract_new import build_fake_oci_response
+
+
+class TestJobs(unittest.TestCase):
+    """Integration tests for POST /jobs and GET /jobs/{job_id}"""
+
+    def setUp(self):
+        init_db()
+        self.client = TestClient(app)
+        self.pdf_bytes = fake_oci.minimal_pdf("Job PDF content")
+        self.files = {"file": ("test.pdf", self.pdf_bytes, "application/pdf")}
+
+    def tearDown(self):
+        clean_db()
+
+    def submit(self):
+        response = self.client.post("/jobs", files=self.files)
+        self.assertEqual(response.status_code, 202)
+        return response.json()["jobId"]
+
+    def fake_client(self, mock_get_client, **kwargs):
+        mock_client = MagicMock()
+        mock_get_client.return_value = mock_client
+        mock_client.analyze_document.return_value = build_fake_oci_response(**kwargs)
+        return mock_client
+
+    def test_submit_returns_queued_job(self):
+        job_id = self.submit()
+        response = self.client.get(f"/jobs/{job_id}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], "queued")
+        self.assertNotIn("result", response.json())
+
+    def test_duplicate_submit_returns_same_job(self):
+        self.assertEqual(self.submit(), self.submit())
+
+    @patch("app.get_doc_client")
+    def test_processed_job_returns_extract_result(self, mock_get_client):
+        self.fake_client(mock_get_client, doc_type_confidence=0.95)
+        job_id = self.submit()
+
+        self.assertTrue(job_queue.process_next("test-worker", process_document))
+        self.assertFalse(job_queue.process_next("test-worker", process_document))
+
+        job = self.client.get(f"/jobs/{job_id}").json()
+        self.assertEqual(job["status"], "done")
+        self.assertEqual(set(job["result"]), {"confidence", "data", "dataConfidence", "predictionTime"})
+        self.assertEqual(job["result"]["data"]["InvoiceId"], "2910")
+        self.assertIsNotNone(getInvoiceById("2910"))
+
+    @patch("app.get_doc_client")
+    def test_resubmitted_pdf_uses_extraction_cache(self, mock_get_client):
+        mock_client = self.fake_client(mock_get_client, doc_type_confidence=0.95)
+        first = self.submit()
+        job_queue.process_next("test-worker", process_document)
+        second = self.submit()
+        job_queue.process_next("test-worker", process_document)
+
+        self.assertNotEqual(first, second)
+        self.assertEqual(job_queue.get(second)["status"], "done")
+        self.assertEqual(mock_client.analyze_document.call_count, 1)
+
+    @patch("app.get_doc_client")
+    def test_low_confidence_job_fails_with_400(self, mock_get_client):
+        self.fake_client(mock_get_client, doc_type_confidence=0.5)
+        job_id = self.submit()
+        job_queue.process_next("test-worker", process_document)
+
+        job = self.client.get(f"/jobs/{job_id}").json()
+        self.assertEqual(job["status"], "failed")
+        self.assertEqual(job["statusCode"], 400)
+
+    @patch("app.get_doc_client")
+    def test_oci_unavailable_is_retried_then_fails(self, mock_get_client):
+        mock_client = self.fake_client(mock_get_client)
+        mock_client.analyze_document.side_effect = Exception("OCI down")
+        job_id = self.submit()
+
+        with patch("job_queue.JOB_MAX_ATTEMPTS", 2):
+            job_queue.process_next("test-worker", process_document)
+            self.assertEqual(self.client.get(f"/jobs/{job_id}").json()["status"], "queued")
+            # Not claimed again before its retry delay is over
+            self.assertFalse(job_queue.process_next("test-worker", process_document))
+            self.make_available()
+            job_queue.process_next("test-worker", process_document)
+
+        job = self.client.get(f"/jobs/{job_id}").json()
+        self.assertEqual(job["status"], "failed")
+        self.assertEqual(job["statusCode"], 503)
+        self.assertEqual(job["attempts"], 2)
+
+    def make_available(self):
+        with get_db() as conn:
+            conn.execute("UPDATE jobs SET AvailableAt = ?", (time.time() - 1,))
+
+    def available_at(self, job_id):
+        with get_db() as conn:
+            return conn.execute("SELECT AvailableAt FROM jobs WHERE JobId = ?", (job_id,)).fetchone()[0]
+
+    def test_retry_waits_for_retry_after(self):
+        job_id = self.submit()
+        unavailable = HTTPException(status_code=503, detail="OCI unavailable", headers={"Retry-After": "30"})
+        before = time.time()
+        job_queue.process_next("test-worker", MagicMock(side_effect=unavailable))
+        self.assertEqual(job_queue.get(job_id)["status"], "queued")
+        self.assertGreaterEqual(self.available_at(job_id), before + 30)
+        self.assertIsNone(job_queue.claim("test-worker"))
+
+    def test_retry_delay_backs_off(self):
+        with patch("job_queue.JOB_RETRY_BASE_SECONDS", 2), patch("job_queue.JOB_RETRY_MAX_SECONDS", 10):
+            for attempts, (low, high) in {1: (1, 2), 2: (2, 4), 3: (4, 8), 5: (5, 10)}.items():
+                delay = job_queue.retry_delay(attempts)
+                self.assertTrue(low <= delay <= high, (attempts, delay))
+            self.assertEqual(job_queue.retry_delay(1, "9"), 9)
+            # Retry-After is capped by JOB_RETRY_MAX_SECONDS, and ignored if not a number
+            self.assertEqual(job_queue.retry_delay(1, "3600"), 10)
+            self.assertLessEqual(job_queue.retry_delay(1, "Wed, 21 Oct 2015 07:28:00 GMT"), 2)
+
+    def test_init_db_adds_available_at_to_existing_jobs(self):
+        original_path = db_util.DB_PATH
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "old.db")
+            # A queue created before retries were delayed
+            conn = sqlite3.connect(path)
+            conn.execute("""
+                CREATE TABLE jobs (JobId TEXT PRIMARY KEY, Status TEXT, Filename TEXT, PdfHash TEXT,
+                Document BLOB, Result TEXT, Error TEXT, StatusCode INTEGER, Attempts INTEGER,
+                WorkerId TEXT, LeaseExpiresAt REAL, CreatedAt REAL, UpdatedAt REAL)
+            """)
+            conn.execute("INSERT INTO jobs (JobId, Status, Document, Attempts, CreatedAt) VALUES ('OLD', 'queued', x'00', 0, 1)")
+            conn.commit()
+            conn.close()
+            try:
+                db_util.DB_PATH = path
+                init_db()
+                claimed = job_queue.claim("test-worker")
+                db_util.close_connection()
+            finally:
+                db_util.DB_PATH = original_path
+        self.assertEqual(claimed[0], "OLD")
+
+    def test_overloaded_job_is_requeued(self):
+        limiter = oci_limiter.AdaptiveLimiter(initial=1, max_limit=1, queue_size=0)
+        job_id = self.submit()
+        with patch("oci_limiter.limiter", limiter), limiter.slot():
+            job_queue.process_next("test-worker", process_document)
+        self.assertEqual(self.client.get(f"/jobs/{job_id}").json()["status"], "queued")
+        self.assertGreater(self.available_at(job_id), time.time())
+
+    def test_unexpected_error_fails_job_with_500(self):
+        job_id = self.submit()
+        with patch("traceback.print_exc"):
+            job_queue.process_next("test-worker", MagicMock(side_effect=RuntimeError("boom")))
+        job = self.client.get(f"/jobs/{job_id}").json()
+        self.assertEqual(job["status"], "failed")
+        self.assertEqual(job["statusCode"], 500)
+
+    def test_expired_lease_is_reclaimed(self):
+        job_id = self.submit()
+        self.assertIsNotNone(job_queue.claim("dead-worker"))
+        # A running job is not handed out twice while its lease is valid
+        self.assertIsNone(job_queue.claim("other-worker"))
+
+        with get_db() as conn:
+            conn.execute("UPDATE jobs SET LeaseExpiresAt = ?", (time.time() - 1,))
+        claimed = job_queue.claim("other-worker")
+        self.assertEqual(claimed[0], job_id)
+        self.assertEqual(claimed[2], 2)
+
+    @patch("app.get_doc_client")
+    def test_background_workers_drain_queue(self, mock_get_client):
+        self.fake_client(mock_get_client, doc_type_confidence=0.95)
+        job_id = self.submit()
+
+        with patch("job_queue.JOB_POLL_INTERVAL", 0.01):
+            workers = job_queue.start_workers(2, process_document)
+            try:
+                deadline = time.time() + 5
+                while time.time() < deadline:
+                    if job_queue.get(job_id)["status"] == "done":
+                        break
+                    time.sleep(0.01)
+            finally:
+                job_queue.stop_workers(workers, timeout=5)
+
+        self.assertEqual(job_queue.get(job_id)["status"], "done")
+
+    def test_unknown_job_returns_404(self):
+        response = self.client.get("/jobs/does-not-exist")
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {"detail": "Job not found"})
+
+    def test_invalid_file_type_returns_400(self):
+        files = {"file": ("test.txt", b"not a pdf", "text/plain")}
+        response = self.client.post("/jobs", files=files)
+        self.assertEqual(response.status_code, 400)
+
+    def test_lifespan_starts_and_stops_workers(self):
+        with patch("app.JOB_WORKERS", 1):
+            with TestClient(app) as client:
+                self.assertEqual(client.get("/jobs/missing").status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,161 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+import fake_oci
+import metrics
+from db_util import init_db, clean_db
+from app import app
+from test.test_extract_new import build_fake_oci_response
+
+
+def sample_value(text, sample):
+    """Returns the value of one sample line of a /metrics response, 0 if absent."""
+    for line in text.splitlines():
+        if line.startswith(sample + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+    """Per-stage histograms, request counters and gauges exposed at GET /metrics"""
+
+    STAGES = ("upload_read", "base64_encode", "oci_call", "parse", "confidence_validation", "db_write")
+
+    def setUp(self):
+        init_db()
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        clean_db()
+
+    def scrape(self):
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/plain"))
+        return response.text
+
+    @patch("app.get_doc_client")
+    def test_extract_records_every_stage(self, mock_get_client):
+        mock_get_client.return_value.analyze_document.return_value = build_fake_oci_response(doc_type_confidence=0.95)
+        before = self.scrape()
+
+        response = self.client.post("/extract", files={"file": ("a.pdf", fake_oci.minimal_pdf("Metrics"), "application/pdf")})
+        self.assertEqual(response.status_code, 200)
+        after = self.scrape()
+
+        for stage in self.STAGES:
+            sample = f'extract_stage_seconds_count{{stage="{stage}"}}'
+            self.assertEqual(sample_value(after, sample), sample_value(before, sample) + 1, stage)
+            # The +Inf bucket always equals the count
+            self.assertEqual(sample_value(after, f'extract_stage_seconds_bucket{{stage="{stage}",le="+Inf"}}'),
+                             sample_value(after, sample))
+
+    def test_requests_are_counted_by_endpoint_and_status(self):
+        sample = 'http_requests_total{method="GET",endpoint="getInvoice",status="404"}'
+        before = sample_value(self.scrape(), sample)
+        self.client.get("/invoice/missing")
+        self.client.get("/invoice/missing")
+        self.assertEqual(sample_value(self.scrape(), sample), before + 2)
+        self.assertIn("# TYPE http_requests_in_flight gauge", self.scrape())
+
+    def test_db_query_latency_is_recorded(self):
+        sample = 'db_query_seconds_count{query="getInvoiceById"}'
+        before = sample_value(self.scrape(), sample)
+        self.client.get("/invoice/missing")
+        self.assertEqual(sample_value(self.scrape(), sample), before + 1)
+
+
+class TestMetricsPrimitives(unittest.TestCase):
+    """Counter, gauge and histogram rendering and the multi-process merge"""
+
+    def setUp(self):
+        self.registry = list(metrics.REGISTRY)
+
+    def tearDown(self):
+        metrics.REGISTRY[:] = self.registry
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram("test_latency_seconds", "Test.", ("op",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 5):
+            histogram.labels("read").observe(value)
+        text = metrics.render_metrics()
+        self.assertIn('test_latency_seconds_bucket{op="read",le="0.1"} 1', text)
+        self.assertIn('test_latency_seconds_bucket{op="read",le="1.0"} 3', text)
+        self.assertIn('test_latency_seconds_bucket{op="read",le="+Inf"} 4', text)
+        self.assertIn('test_latency_seconds_sum{op="read"} 6.05', text)
+
+    def test_gauge_tracks_in_progress_and_labels_are_escaped(self):
+        gauge = metrics.Gauge("test_in_flight", "Test.")
+        with gauge.track_inprogress():
+            self.assertEqual(gauge.value, 1)
+        self.assertEqual(gauge.value, 0)
+        counter = metrics.Counter("test_total", "Test.", ("path",))
+        counter.labels('a"b').inc()
+        self.assertIn('test_total{path="a\\"b"} 1', metrics.render_metrics())
+
+    def write_worker(self, directory, pid, samples):
+        # The snapshot file of another worker process, with the given samples
+        data = metrics.snapshot()
+        for name, value in samples.items():
+            data[name]["samples"] = [[[], value]]
+        with open(os.path.join(directory, f"metrics-{pid}.json"), "w") as f:
+            json.dump(data, f)
+
+    def test_worker_processes_are_summed(self):
+        counter = metrics.Counter("test_jobs_total", "Test.")
+        gauge = metrics.Gauge("test_busy", "Test.")
+        counter.inc(2)
+        gauge.set(1)
+        with tempfile.TemporaryDirectory() as tmp, patch("metrics.MULTIPROC_DIR", tmp):
+            # Another worker process, still running
+            self.write_worker(tmp, os.getppid(), {"test_jobs_total": 5, "test_busy": 3})
+            text = metrics.render_metrics()
+            flusher = metrics.start_flusher()
+            metrics.stop_flusher(flusher)
+            with open(os.path.join(tmp, f"metrics-{os.getpid()}.json")) as f:
+                final = json.load(f)
+        self.assertIn("test_jobs_total 7", text)
+        self.assertIn("test_busy 4", text)
+        # A stopped process reports no gauges
+        self.assertEqual(final["test_busy"]["samples"], [])
+        self.assertEqual(final["test_jobs_total"]["samples"], [[[], 2]])
+
+    def test_gauges_of_dead_workers_are_ignored(self):
+        counter = metrics.Counter("test_jobs_total", "Test.")
+        gauge = metrics.Gauge("test_busy", "Test.")
+        counter.inc(2)
+        gauge.set(1)
+        # A worker that was killed without writing its final snapshot
+        dead = subprocess.Popen([sys.executable, "-c", "pass"])
+        dead.wait()
+        with tempfile.TemporaryDirectory() as tmp, patch("metrics.MULTIPROC_DIR", tmp):
+            self.write_worker(tmp, dead.pid, {"test_jobs_total": 5, "test_busy": 3})
+            text = metrics.render_metrics()
+        self.assertIn("test_jobs_total 7", text)
+        self.assertIn("test_busy 1", text)
+
+    def test_gauge_multiprocess_modes(self):
+        state = metrics.Gauge("test_state", "Test.", multiprocess_mode="liveall")
+        limit = metrics.Gauge("test_limit", "Test.", multiprocess_mode="max")
+        state.set(1)
+        limit.set(4)
+        with tempfile.TemporaryDirectory() as tmp, patch("metrics.MULTIPROC_DIR", tmp):
+            self.write_worker(tmp, os.getppid(), {"test_state": 0, "test_limit": 9})
+            text = metrics.render_metrics()
+        self.assertIn(f'test_state{{pid="{os.getpid()}"}} 1', text)
+        self.assertIn(f'test_state{{pid="{os.getppid()}"}} 0', text)
+        self.assertIn("test_limit 9", text)
+        # A single process exposes its own value, without a pid label
+        self.assertIn("test_state 1", metrics.render_metrics())
+        with self.assertRaises(ValueError):
+            metrics.Gauge("test_bad", "Test.", multiprocess_mode="sum")
+
+if __name__ == "__main__":
+    unittest.main()
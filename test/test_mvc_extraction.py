@@ -0,0 +1,126 @@
+import unittest
+from unittest.mock import patch, MagicMock
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+import fake_oci
+from db_util import init_db, clean_db
+from mvc_model.models import Invoice, Item, Confidence
+from mvc_model.models.base import Base
+from mvc_model.models.extraction import save_extraction
+from mvc_model.controller.controller import extract_invoice_controller
+from test.test_extract_new import build_fake_oci_response
+
+
+class TestMvcBulkSave(unittest.TestCase):
+    """The SQLAlchemy write path persists an extraction with one commit"""
+
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+        Base.metadata.create_all(self.engine)
+        self.db = sessionmaker(bind=self.engine)()
+        self.statements = []
+        self.commits = []
+        event.listen(self.engine, "before_cursor_execute", self.on_execute)
+        event.listen(self.engine, "commit", lambda conn: self.commits.append(conn))
+
+    def tearDown(self):
+        self.db.close()
+        self.engine.dispose()
+
+    def on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append((statement, executemany))
+
+    def test_save_extraction_single_commit_and_bulk_items(self):
+        items = [{"Description": f"Item {n}", "Name": f"Item {n}", "Quantity": n, "UnitPrice": 1.0, "Amount": float(n)} for n in range(250)]
+        save_extraction(
+            self.db,
+            {"InvoiceId": "BULK-1", "VendorName": "SuperStore", "InvoiceTotal": 10.0},
+            items,
+            {"VendorName": 0.9}
+        )
+
+        self.assertEqual(len(self.commits), 1)
+        item_inserts = [s for s in self.statements if s[0].startswith("INSERT INTO items")]
+        self.assertEqual(len(item_inserts), 1)
+        self.assertTrue(item_inserts[0][1])
+        # Invoice and confidence upserts, one SELECT of the stored items,
+        # their DELETE and the items: no per-item SELECTs
+        self.assertEqual(len(self.statements), 5)
+
+        self.assertEqual(self.db.query(Item).filter(Item.InvoiceId == "BULK-1").count(), 250)
+        self.assertEqual(self.db.get(Confidence, "BULK-1").VendorName, 0.9)
+        self.assertEqual(self.db.get(Invoice, "BULK-1").VendorName, "SuperStore")
+
+    def test_save_extraction_again_replaces_the_invoice(self):
+        invoice = save_extraction(self.db, {"InvoiceId": "BULK-3", "InvoiceTotal": 1.0},
+                                  [{"Name": "Old A"}, {"Name": "Old B"}], {"VendorName": 0.5})
+        self.assertEqual([item.Name for item in invoice.items], ["Old A", "Old B"])
+        again = save_extraction(self.db, {"InvoiceId": "BULK-3", "InvoiceTotal": 2.0},
+                                [{"Name": "New"}], {"VendorName": 0.8})
+
+        self.assertIs(again, invoice)
+        self.assertEqual(invoice.InvoiceTotal, 2.0)
+        self.assertEqual([item.Name for item in invoice.items], ["New"])
+        self.assertEqual(self.db.query(Invoice).count(), 1)
+        self.assertEqual(self.db.get(Confidence, "BULK-3").VendorName, 0.8)
+
+    def test_save_extraction_without_items(self):
+        save_extraction(self.db, {"InvoiceId": "BULK-2"}, [], {})
+        self.assertEqual(len(self.commits), 1)
+        self.assertEqual(self.db.query(Item).count(), 0)
+
+    @patch("extraction_cache.CACHE_ENABLED", False)
+    @patch("mvc_model.controller.controller.get_doc_client")
+    def test_controller_persists_with_one_commit(self, mock_get_client):
+        mock_client = MagicMock()
+        mock_get_client.return_value = mock_client
+        mock_client.analyze_document.return_value = build_fake_oci_response(doc_type_confidence=0.95)
+
+        result = extract_invoice_controller(self.db, fake_oci.minimal_pdf("Fake PDF content"))
+
+        self.assertEqual(result["data"]["InvoiceId"], "2910")
+        self.assertEqual(len(self.commits), 1)
+        self.assertEqual(self.db.query(Item).filter(Item.InvoiceId == "2910").count(), 1)
+
+    @patch("extraction_cache.CACHE_ENABLED", False)
+    @patch("mvc_model.controller.controller.get_doc_client")
+    def test_forced_re_extraction_of_a_saved_pdf(self, mock_get_client):
+        mock_client = MagicMock()
+        mock_get_client.return_value = mock_client
+        mock_client.analyze_document.return_value = build_fake_oci_response(doc_type_confidence=0.95)
+        pdf = fake_oci.minimal_pdf("Fake PDF content")
+
+        extract_invoice_controller(self.db, pdf)
+        extract_invoice_controller(self.db, pdf, force_extract=True)
+
+        self.assertEqual(mock_client.analyze_document.call_count, 2)
+        self.assertEqual(self.db.query(Invoice).count(), 1)
+        self.assertEqual(self.db.query(Item).filter(Item.InvoiceId == "2910").count(), 1)
+
+
+    @patch("mvc_model.controller.controller.get_doc_client")
+    def test_cache_hit_is_saved_to_the_mvc_database(self, mock_get_client):
+        mock_client = MagicMock()
+        mock_get_client.return_value = mock_client
+        mock_client.analyze_document.return_value = build_fake_oci_response(doc_type_confidence=0.95)
+        pdf = fake_oci.minimal_pdf("Cached in db_util")
+        # The extraction cache is in db_util's database, the MVC one is separate
+        init_db()
+        self.addCleanup(clean_db)
+
+        extract_invoice_controller(self.db, pdf)
+        self.db.query(Item).delete()
+        self.db.query(Invoice).delete()
+        self.db.commit()
+        result = extract_invoice_controller(self.db, pdf)
+
+        self.assertEqual(mock_client.analyze_document.call_count, 1)
+        self.assertEqual(result["predictionTime"], 0.0)
+        self.assertEqual(self.db.get(Invoice, "2910").VendorName, result["data"]["VendorName"])
+        self.assertEqual(self.db.query(Item).filter(Item.InvoiceId == "2910").count(), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+import unittest
+
+from sqlalchemy import event, insert
+from sqlalchemy.orm import sessionmaker
+
+from mvc_model import db as mvc_db
+from mvc_model.models import Invoice, Item
+from mvc_model.models.base import Base
+from mvc_model.models.invoice import get_invoice_by_id, get_invoice_by_vendor_name
+from mvc_model.models.item import get_items_by_invoice_id
+from mvc_model.controller.controller import get_invoice_with_items, getInvoiceByVendorNameCon
+
+
+# ---------------------------------------------------------------------------
+# The controller's vendor and invoice reads before eager loading, kept
+# verbatim as the reference the new ones must match.
+# ---------------------------------------------------------------------------
+def legacy_get_invoice_with_items(db,invoice_id):
+    invoice = get_invoice_by_id(db,invoice_id)
+    if invoice :
+        items = get_items_by_invoice_id (db,invoice_id)
+        invoice_with_items = {
+            "invoice" : invoice,
+            "items" : items
+        }
+        return invoice_with_items
+    return None
+
+
+def legacy_getInvoiceByVendorNameCon(db,vendor_name):
+    myinvoices = []
+    invoices = get_invoice_by_vendor_name(db,vendor_name)
+    if invoices :
+        for invoice in invoices:
+            invoice_id = invoice.InvoiceId
+            items = get_items_by_invoice_id(db,invoice_id)
+            invoice_with_items = {
+                "invoice" : invoice,
+                "items" : items
+            }
+            myinvoices.append(invoice_with_items)
+
+    return {"VendorName": vendor_name if invoices else "Unknown Vendor",
+            "TotalInvoices": len(invoices),
+            "invoices":myinvoices}
+
+
+"""
+    Converts ORM instances of a controller result to the dictionaries of
+    the as_dict=True results.
+"""
+def as_dicts(value):
+    if isinstance(value, (Invoice, Item)):
+        return {column.key: getattr(value, column.key) for column in type(value).__table__.columns}
+    if isinstance(value, dict):
+        return {key: as_dicts(v) for key, v in value.items()}
+    if isinstance(value, list):
+        return [as_dicts(v) for v in value]
+    return value
+
+
+"""
+    Fills a session's database with invoices of a few vendors, with
+    `items` line items each (none for every fifth invoice).
+"""
+def populate(db, invoices=60, items=3):
+    db.execute(insert(Invoice), [
+        {"InvoiceId": f"Q-{n:03d}", "VendorName": f"Vendor-{n % 3}", "InvoiceTotal": float(n)}
+        for n in range(invoices)
+    ])
+    db.execute(insert(Item), [
+        {"InvoiceId": f"Q-{n:03d}", "Name": f"Item {k}", "Quantity": k, "Amount": float(k)}
+        for n in range(invoices) if n % 5
+        for k in range(items)
+    ])
+    db.commit()
+
+
+class TestMvcReads(unittest.TestCase):
+    """Vendor and invoice reads of the controller in a bounded number of queries"""
+
+    def setUp(self):
+        self.engine = mvc_db.create_db_engine("sqlite://")
+        Base.metadata.create_all(self.engine)
+        self.session_factory = sessionmaker(bind=self.engine, expire_on_commit=False)
+        populate(self.session_factory())
+        self.db = self.session_factory()
+        self.statements = []
+        event.listen(self.engine, "before_cursor_execute", self.on_execute)
+
+    def tearDown(self):
+        self.db.close()
+        self.engine.dispose()
+
+    def on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def reference(self, func, *args):
+        # The legacy reads, in their own session so nothing is shared
+        db = self.session_factory()
+        try:
+            return as_dicts(func(db, *args))
+        finally:
+            db.close()
+
+    def test_vendor_invoices_in_two_queries(self):
+        result = getInvoiceByVendorNameCon(self.db, "Vendor-1")
+        # Touching every item issues no lazy load
+        self.assertEqual(sum(len(invoice["items"]) for invoice in result["invoices"]), 16 * 3)
+        self.assertEqual(len(self.statements), 2)
+        self.assertEqual(as_dicts(result), self.reference(legacy_getInvoiceByVendorNameCon, "Vendor-1"))
+
+    def test_vendor_invoices_as_dicts(self):
+        result = getInvoiceByVendorNameCon(self.db, "Vendor-2", as_dict=True)
+        self.assertEqual(len(self.statements), 2)
+        self.assertEqual(result, self.reference(legacy_getInvoiceByVendorNameCon, "Vendor-2"))
+        self.assertEqual(result["TotalInvoices"], 20)
+        self.assertIs(type(result["invoices"][0]["invoice"]), dict)
+        # Nothing was added to the session
+        self.assertEqual(len(self.db.identity_map), 0)
+
+    def test_unknown_vendor(self):
+        for as_dict in (False, True):
+            result = getInvoiceByVendorNameCon(self.db, "Nobody", as_dict=as_dict)
+            self.assertEqual(result, {"VendorName": "Unknown Vendor", "TotalInvoices": 0, "invoices": []})
+        self.assertEqual(len(self.statements), 2)
+
+    def test_invoice_with_items_in_one_query(self):
+        result = get_invoice_with_items(self.db, "Q-001")
+        self.assertEqual([item.Name for item in result["items"]], ["Item 0", "Item 1", "Item 2"])
+        self.assertEqual(len(self.statements), 1)
+        self.assertEqual(as_dicts(result), self.reference(legacy_get_invoice_with_items, "Q-001"))
+
+    def test_invoice_with_items_as_dicts(self):
+        for invoice_id in ("Q-001", "Q-005"):
+            self.assertEqual(get_invoice_with_items(self.db, invoice_id, as_dict=True),
+                             self.reference(legacy_get_invoice_with_items, invoice_id))
+        self.assertIsNone(get_invoice_with_items(self.db, "MISSING", as_dict=True))
+        self.assertIsNone(get_invoice_with_items(self.db, "MISSING"))
+
+    def test_queries_do_not_grow_with_the_vendor(self):
+        db = self.session_factory()
+        db.execute(insert(Invoice), [{"InvoiceId": f"BIG-{n}", "VendorName": "Big"} for n in range(450)])
+        db.execute(insert(Item), [{"InvoiceId": f"BIG-{n}", "Name": "Pen"} for n in range(450)])
+        db.commit()
+        db.close()
+        del self.statements[:]
+        result = getInvoiceByVendorNameCon(self.db, "Big")
+        self.assertEqual(result["TotalInvoices"], 450)
+        self.assertEqual(len(self.statements), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,207 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session, sessionmaker
+
+import fake_oci
+from mvc_model import db as mvc_db
+from mvc_model.models import Invoice, Item
+from mvc_model.models.base import Base
+from mvc_model.models.confidence import create_confidence
+from mvc_model.models.invoice import create_invoice, update_invoice
+from mvc_model.models.item import create_item
+from mvc_model.controller.controller import extract_invoice_controller
+from test.test_oci_parser import as_response
+
+
+def invoice_response(invoice_id, items):
+    invoice = fake_oci.synthetic_invoice(fake_oci.minimal_pdf(invoice_id))
+    invoice["fields"]["InvoiceId"] = invoice_id
+    invoice["items"] = [
+        {"Description": f"Item {n}", "Name": f"Item {n}", "Quantity": "1", "UnitPrice": "$2.50", "Amount": "$2.50"}
+        for n in range(items)
+    ]
+    return as_response(fake_oci.build_result(invoice))
+
+
+class SessionTestCase(unittest.TestCase):
+    """A session from a SessionLocal-like factory, counting what reaches the database"""
+
+    def setUp(self):
+        self.engine = mvc_db.create_db_engine("sqlite://")
+        Base.metadata.create_all(self.engine)
+        self.session_factory = sessionmaker(bind=self.engine, expire_on_commit=False)
+        self.db = self.session_factory()
+        self.statements = []
+        self.commits = []
+        self.flushes = []
+        event.listen(self.engine, "before_cursor_execute", self.on_execute)
+        event.listen(self.engine, "commit", lambda conn: self.commits.append(conn))
+        event.listen(self.db, "after_flush", lambda session, context: self.flushes.append(session))
+
+    def tearDown(self):
+        self.db.close()
+        self.engine.dispose()
+
+    def on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def selects(self):
+        return [s for s in self.statements if s.lstrip().upper().startswith("SELECT")]
+
+
+class TestExtractionUnitOfWork(SessionTestCase):
+    """One extraction through the controller is a fixed number of statements and one commit"""
+
+    @patch("extraction_cache.CACHE_ENABLED", False)
+    @patch("mvc_model.controller.controller.get_doc_client")
+    def test_statements_per_extraction_do_not_depend_on_items(self, mock_get_client):
+        counts = []
+        for invoice_id, items in (("UOW-1", 1), ("UOW-2", 40), ("UOW-3", 400)):
+            mock_client = MagicMock()
+            mock_client.analyze_document.return_value = invoice_response(invoice_id, items)
+            mock_get_client.return_value = mock_client
+            del self.statements[:], self.commits[:], self.flushes[:]
+
+            extract_invoice_controller(self.db, fake_oci.minimal_pdf(invoice_id))
+
+            counts.append(len(self.statements))
+            # Invoice and confidences upserts, one SELECT of the stored
+            # items, their DELETE and one bulk INSERT of the new ones;
+            # nothing left to flush
+            self.assertLessEqual(len(self.statements), 5, self.statements)
+            self.assertEqual(len(self.selects()), 1)
+            self.assertLessEqual(len(self.flushes), 1)
+            self.assertEqual(len(self.commits), 1)
+            self.assertEqual(self.db.query(Item).filter(Item.InvoiceId == invoice_id).count(), items)
+        self.assertEqual(len(set(counts)), 1)
+
+    @patch("extraction_cache.CACHE_ENABLED", False)
+    @patch("mvc_model.controller.controller.get_doc_client")
+    def test_failed_write_is_rolled_back(self, mock_get_client):
+        mock_client = MagicMock()
+        mock_client.analyze_document.return_value = invoice_response("UOW-FAIL", 3)
+        mock_get_client.return_value = mock_client
+        with patch("mvc_model.models.extraction.create_items", side_effect=RuntimeError("disk full")):
+            with self.assertRaises(RuntimeError):
+                extract_invoice_controller(self.db, fake_oci.minimal_pdf("UOW-FAIL"))
+        self.assertEqual(self.commits, [])
+        self.assertIsNone(self.db.get(Invoice, "UOW-FAIL"))
+
+
+class TestCrudHelpers(SessionTestCase):
+    """CRUD helpers commit on their own or join the caller's transaction"""
+
+    def test_helpers_join_the_unit_of_work(self):
+        with mvc_db.unit_of_work(self.db):
+            invoice = create_invoice(self.db, {"InvoiceId": "CRUD-1", "VendorName": "Old"}, commit=False)
+            create_confidence(self.db, {"InvoiceId": "CRUD-1", "VendorName": 0.9}, commit=False)
+            for n in range(5):
+                self.assertIsNotNone(create_item(self.db, {"InvoiceId": "CRUD-1", "Name": f"Item {n}"}, commit=False))
+            update_invoice(self.db, "CRUD-1", {"VendorName": "New"}, commit=False)
+            self.assertEqual(self.commits, [])
+        self.assertEqual(len(self.commits), 1)
+        # Only the first create_item looks the pending invoice up in the
+        # database; the others find it in the session
+        self.assertLessEqual(len(self.selects()), 1)
+        self.assertEqual(invoice.VendorName, "New")
+        self.assertEqual(self.db.query(Item).count(), 5)
+
+    def test_unit_of_work_rolls_back(self):
+        with self.assertRaises(ValueError):
+            with mvc_db.unit_of_work(self.db):
+                create_invoice(self.db, {"InvoiceId": "CRUD-2"}, commit=False)
+                self.db.flush()
+                raise ValueError("bad invoice")
+        self.assertEqual(self.commits, [])
+        self.assertIsNone(self.db.get(Invoice, "CRUD-2"))
+
+    def test_committing_helpers_do_not_refresh(self):
+        invoice = create_invoice(self.db, {"InvoiceId": "CRUD-3", "VendorName": "SuperStore"})
+        confidence = create_confidence(self.db, {"InvoiceId": "CRUD-3", "VendorName": 0.5})
+        self.assertEqual((invoice.VendorName, confidence.VendorName), ("SuperStore", 0.5))
+        self.assertEqual(len(self.commits), 2)
+        self.assertEqual(self.selects(), [])
+
+
+class TestRequestScopedSession(unittest.TestCase):
+    """get_db gives each request its own session and closes it"""
+
+    def setUp(self):
+        self.engine = mvc_db.create_db_engine("sqlite://")
+        Base.metadata.create_all(self.engine)
+        self.sessions = []
+        factory = sessionmaker(bind=self.engine, expire_on_commit=False)
+
+        def session_local():
+            session = factory()
+            self.sessions.append(session)
+            return session
+
+        patcher = patch("mvc_model.db.SessionLocal", session_local)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        app = FastAPI()
+
+        @app.post("/invoices/{invoice_id}")
+        def create(invoice_id: str, fail: bool = False, db: Session = Depends(mvc_db.get_db)):
+            create_invoice(db, {"InvoiceId": invoice_id}, commit=False)
+            db.flush()
+            if fail:
+                raise HTTPException(status_code=400, detail="rejected")
+            db.commit()
+            return {"sessions": len(self.sessions), "open": db.is_active}
+
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def stored(self, invoice_id):
+        with self.engine.connect() as conn:
+            return conn.execute(text('SELECT COUNT(*) FROM invoices WHERE "InvoiceId" = :id'), {"id": invoice_id}).scalar()
+
+    def test_one_session_per_request(self):
+        self.assertEqual(self.client.post("/invoices/REQ-1").status_code, 200)
+        self.assertEqual(self.client.post("/invoices/REQ-2").status_code, 200)
+        self.assertEqual(len(self.sessions), 2)
+        self.assertIsNot(self.sessions[0], self.sessions[1])
+        # Closed sessions hold no connection
+        self.assertTrue(all(session.get_bind() is self.engine and not session.in_transaction() for session in self.sessions))
+        self.assertEqual(self.stored("REQ-1"), 1)
+
+    def test_failed_request_is_rolled_back(self):
+        self.assertEqual(self.client.post("/invoices/REQ-3?fail=true").status_code, 400)
+        self.assertFalse(self.sessions[0].in_transaction())
+        self.assertEqual(self.stored("REQ-3"), 0)
+
+
+class TestEngine(unittest.TestCase):
+    """Pool and pragmas of the MVC engine"""
+
+    def test_sqlite_file_engine(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = mvc_db.create_db_engine(f"sqlite:///{os.path.join(tmp, 'mvc.db')}")
+            try:
+                self.assertEqual(engine.pool.size(), mvc_db.MVC_DB_POOL_SIZE)
+                self.assertEqual(engine.pool._max_overflow, mvc_db.MVC_DB_MAX_OVERFLOW)
+                with engine.connect() as conn:
+                    self.assertEqual(conn.execute(text("PRAGMA journal_mode")).scalar(), "wal")
+                    self.assertEqual(conn.execute(text("PRAGMA busy_timeout")).scalar(),
+                                     mvc_db.db_util.DB_SETTINGS["busy_timeout_ms"])
+            finally:
+                engine.dispose()
+
+    def test_default_engine_uses_the_app_database(self):
+        self.assertEqual(mvc_db.engine.url.database, mvc_db.db_util.DB_PATH)
+        self.assertFalse(mvc_db.SessionLocal.kw["expire_on_commit"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,207 @@
+import asyncio
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+import app as app_module
+import fake_oci
+import oci_client_pool
+import oci_limiter
+import oci_resilience
+from db_util import init_db, clean_db
+from app import app
+from mvc_model.controller.controller import extract_invoice_controller, TooManyRequestsError
+from test.test_metrics import sample_value
+
+
+class PeakTrackingClient(fake_oci.FakeDocumentClient):
+    """Fake OCI client recording the peak number of concurrent calls."""
+
+    def __init__(self, latency):
+        super().__init__(latency=f"fixed:{latency}")
+        self.active = 0
+        self.peak = 0
+        self.active_lock = threading.Lock()
+
+    def analyze_document(self, analyze_document_details, **kwargs):
+        with self.active_lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            return super().analyze_document(analyze_document_details, **kwargs)
+        finally:
+            with self.active_lock:
+                self.active -= 1
+
+
+class BlockedClient(PeakTrackingClient):
+    """Fake OCI client whose calls wait until release is set."""
+
+    def __init__(self):
+        super().__init__(latency=0)
+        self.release = threading.Event()
+
+    def analyze_document(self, analyze_document_details, **kwargs):
+        with self.active_lock:
+            self.active += 1
+        self.release.wait(10)
+        with self.active_lock:
+            self.active -= 1
+        return super().analyze_document(analyze_document_details, **kwargs)
+
+
+class TestAdaptiveLimiter(unittest.TestCase):
+    """AIMD limit, bounded queue and load shedding of oci_limiter"""
+
+    def test_queue_full_is_rejected_with_429(self):
+        limiter = oci_limiter.AdaptiveLimiter(initial=1, queue_size=0)
+        limiter.acquire()
+        with self.assertRaises(oci_limiter.Overloaded) as raised:
+            limiter.acquire()
+        self.assertEqual(raised.exception.status_code, 429)
+        self.assertGreaterEqual(raised.exception.retry_after, 1)
+
+    def test_queue_wait_times_out_with_503(self):
+        limiter = oci_limiter.AdaptiveLimiter(initial=1, queue_size=1, queue_timeout=0.01)
+        limiter.acquire()
+        with self.assertRaises(oci_limiter.Overloaded) as raised:
+            limiter.acquire()
+        self.assertEqual(raised.exception.status_code, 503)
+        # The timed out waiter left the queue
+        self.assertEqual(oci_limiter.queue_depth.value, 0)
+
+    def test_waiters_get_released_slots(self):
+        limiter = oci_limiter.AdaptiveLimiter(initial=1, queue_size=1, queue_timeout=5)
+        limiter.acquire()
+        threading.Timer(0.05, limiter.release).start()
+
+        async def wait_for_slot():
+            async with limiter.slot_async():
+                return limiter.in_flight
+
+        self.assertEqual(asyncio.run(wait_for_slot()), 1)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_limit_decreases_on_overload_once_per_round(self):
+        limiter = oci_limiter.AdaptiveLimiter(initial=10, min_limit=2, backoff=0.5)
+        limiter.on_overload()
+        # Calls that were in flight during the same overload do not cut it again
+        limiter.on_overload()
+        self.assertEqual(limiter.limit, 5)
+        for _ in range(5):
+            limiter.acquire()
+            limiter.release()
+        limiter.on_overload()
+        self.assertEqual(limiter.limit, 2.5)
+        for _ in range(2):
+            limiter.acquire()
+            limiter.release()
+        limiter.on_overload()
+        self.assertEqual(limiter.limit, 2)
+
+    def test_limit_grows_only_while_saturated(self):
+        limiter = oci_limiter.AdaptiveLimiter(initial=2, max_limit=3)
+        limiter.on_success(0.1)
+        self.assertEqual(limiter.limit, 2)
+        with limiter.slot(), limiter.slot():
+            for _ in range(10):
+                limiter.on_success(0.1)
+        self.assertEqual(limiter.limit, 3)
+
+    def test_throttling_shrinks_the_shared_limit(self):
+        limiter = oci_limiter.AdaptiveLimiter(initial=8, backoff=0.5)
+        fake = fake_oci.FakeDocumentClient(throttle_rate=1.0)
+        with patch("oci_limiter.limiter", limiter), patch("oci_resilience.OCI_BACKOFF_BASE", 0.001):
+            with self.assertRaises(Exception):
+                oci_resilience.call(fake.analyze, b"%PDF-1.4\n")
+        oci_resilience.breaker.reset()
+        self.assertEqual(limiter.limit, 4)
+        self.assertEqual(oci_limiter.concurrency_limit.value, 4)
+
+
+class TestExtractBackpressure(unittest.TestCase):
+    """/extract, /extract/batch and the MVC controller share one OCI limit"""
+
+    def setUp(self):
+        init_db()
+        self.client = TestClient(app)
+        self.files = {"file": ("test.pdf", fake_oci.minimal_pdf("Backpressure"), "application/pdf")}
+
+    def tearDown(self):
+        clean_db()
+
+    def test_batch_calls_never_exceed_the_limit(self):
+        fake = PeakTrackingClient(latency=0.05)
+        files = [("files", (f"{n}.pdf", fake_oci.minimal_pdf(str(n)), "application/pdf")) for n in range(6)]
+        limiter = oci_limiter.AdaptiveLimiter(initial=2, max_limit=2)
+        with patch("oci_limiter.limiter", limiter), patch("app.get_doc_client", return_value=fake):
+            response = self.client.post("/extract/batch?concurrency=6", files=files)
+        self.assertEqual(response.json()["Succeeded"], 6)
+        self.assertEqual(fake.peak, 2)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_full_queue_sheds_extractions_with_retry_after(self):
+        limiter = oci_limiter.AdaptiveLimiter(initial=1, max_limit=1, queue_size=0)
+        fake = fake_oci.FakeDocumentClient()
+        with patch("oci_limiter.limiter", limiter), patch("app.get_doc_client", return_value=fake):
+            # Another extraction (here: the MVC controller's) holds the only slot
+            with limiter.slot():
+                response = self.client.post("/extract", files=self.files)
+                with self.assertRaises(TooManyRequestsError):
+                    extract_invoice_controller(None, fake_oci.minimal_pdf("Controller"))
+                metrics_text = self.client.get("/metrics").text
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response.headers["Retry-After"]), 1)
+        self.assertEqual(fake.calls, 0)
+        self.assertEqual(sample_value(metrics_text, "oci_concurrency_limit"), 1)
+        self.assertGreaterEqual(sample_value(metrics_text, 'oci_limiter_rejections_total{reason="queue_full"}'), 2)
+
+    def test_cache_hit_does_not_wait_for_oci_calls_in_flight(self):
+        fake = BlockedClient()
+        limiter = oci_limiter.AdaptiveLimiter(initial=2, max_limit=2)
+        small_executor = app_module.ThreadPoolExecutor(max_workers=2)
+        cached = {"file": ("cached.pdf", fake_oci.minimal_pdf("Cached"), "application/pdf")}
+        with patch("oci_limiter.limiter", limiter), patch("app.get_doc_client", return_value=fake), \
+                patch("app.extract_executor", small_executor):
+            fake.release.set()
+            self.assertEqual(self.client.post("/extract", files=cached).status_code, 200)
+            fake.release.clear()
+            # As many slow OCI calls in flight as the executor of the cheap work has threads
+            calls = [threading.Thread(target=self.client.post, args=("/extract",),
+                                      kwargs={"files": {"file": (f"{n}.pdf", fake_oci.minimal_pdf(f"Slow {n}"), "application/pdf")}})
+                     for n in range(2)]
+            for call in calls:
+                call.start()
+            deadline = time.monotonic() + 5
+            while fake.active < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            start = time.perf_counter()
+            hit = self.client.post("/extract", files=cached)
+            seconds = time.perf_counter() - start
+            fake.release.set()
+            for call in calls:
+                call.join()
+        small_executor.shutdown()
+        self.assertEqual(hit.headers["X-Extraction-Cache"], "HIT")
+        self.assertLess(seconds, 2)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_limit_never_exceeds_the_oci_threads(self):
+        self.assertLessEqual(oci_limiter.limiter.max_limit, app_module.oci_executor._max_workers)
+        self.assertEqual(oci_client_pool.OCI_CLIENT_POOL_SIZE, oci_limiter.limiter.max_limit)
+
+    def test_queue_timeout_is_503(self):
+        limiter = oci_limiter.AdaptiveLimiter(initial=1, max_limit=1, queue_size=4, queue_timeout=0.02)
+        with patch("oci_limiter.limiter", limiter), limiter.slot():
+            start = time.perf_counter()
+            response = self.client.post("/extract", files=self.files)
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("Retry-After", response.headers)
+        self.assertLess(time.perf_counter() - start, 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,201 @@
+import glob
+import os
+import unittest
+
+import oci
+from oci.ai_document import models
+
+import fake_oci
+import oci_parser
+from oci_parser import format_date_to_iso
+from test.test_extract_new import build_fake_oci_response
+
+
+# ---------------------------------------------------------------------------
+# The parsing code app.py and the MVC controller each had before oci_parser,
+# kept verbatim as the reference the shared parser must match.
+# ---------------------------------------------------------------------------
+def legacy_clean_amount(key,value):
+
+    if not value:
+        return ""
+    try:
+        if key == "Quantity":
+            return int(
+            value.replace("$", "").replace(",", "").strip()
+        )
+        return float(
+            value.replace("$", "").replace(",", "").strip()
+        )
+    except ValueError:
+        return ""
+
+
+def legacy_parse_document_fields(response):
+    data={}
+    data_Confidence = {}
+    item = {}
+    all_items = []
+    for page in response.data.pages:
+        if page.document_fields:
+            for myfield in page.document_fields:
+                field_key =myfield.field_label.name if myfield.field_label and myfield.field_label.name else ""
+                field_value = myfield.field_value.text if myfield.field_value and myfield.field_value.text else ""
+                if field_key == "InvoiceDate":
+                    field_value = format_date_to_iso(field_value)
+                if field_key in ("InvoiceTotal", "SubTotal", "ShippingCost", "Amount", "UnitPrice","AmountDue"):
+                    field_value = legacy_clean_amount(field_key,field_value)
+                field_confidence = myfield.field_label.confidence if myfield.field_label and myfield.field_label.confidence is not None else 0.0
+                if field_key == "Items":
+                    all_items = []
+                    for i in myfield.field_value.items:
+                        item={}
+                        for j in i.field_value.items:
+                            item_key = j.field_label.name if j.field_label else ""
+                            item_value = j.field_value.text if j.field_value and j.field_value.text else ""
+                            if item_key in ("Quantity", "UnitPrice", "Amount"):
+                                item_value = legacy_clean_amount(item_key,item_value)
+                            item[item_key]=item_value
+                        all_items.append(item)
+                    field_value=all_items
+                data[field_key]=field_value
+                data_Confidence[field_key]=field_confidence
+    return data, data_Confidence
+
+
+def legacy_validate_confidence(response):
+    confid = 0.0
+    if response.data.detected_document_types:
+        for validCon in response.data.detected_document_types:
+            confid = validCon.confidence
+            if confid <0.9 :
+                raise ValueError("low confidence")
+    return confid
+
+
+"""
+    Wraps an AnalyzeDocumentResult like the SDK's response.
+"""
+def as_response(result):
+    return oci.response.Response(200, {}, result, None)
+
+
+def field(name, text, confidence=0.9, field_type="KEY_VALUE"):
+    label = models.FieldLabel(name=name, confidence=confidence) if name is not False else None
+    value = models.ValueString(text=text) if text is not False else None
+    return models.DocumentField(field_type=field_type, field_label=label, field_value=value)
+
+
+def items_field(lines, name="Items"):
+    return models.DocumentField(
+        field_type="LINE_ITEM_GROUP",
+        field_label=models.FieldLabel(name=name),
+        field_value=models.ValueArray(items=[
+            models.DocumentField(field_type="LINE_ITEM", field_value=models.ValueArray(items=line))
+            for line in lines
+        ])
+    )
+
+
+"""
+    A response exercising the corner cases of the parser: missing labels,
+    names, values, texts and confidences, fields repeated across pages,
+    two Items fields, unparseable amounts and dates, and empty pages.
+"""
+def edge_case_response():
+    first_page = models.Page(page_number=1, document_fields=[
+        field("InvoiceId", "INV-1"),
+        field("InvoiceDate", "Mar 06 2012", confidence=None),
+        field("InvoiceTotal", "$1,234.50"),
+        field("SubTotal", "abc"),
+        field("AmountDue", ""),
+        field("ShippingCost", None),
+        field("Quantity", "3"),
+        field("UnitPrice", "7"),
+        field(None, "nameless"),
+        field(False, "no label"),
+        field("VendorName", False),
+        items_field([[field("Quantity", "2"), field("UnitPrice", "$5.00"), field("Amount", "bad")]]),
+    ])
+    second_page = models.Page(page_number=2, document_fields=[
+        field("InvoiceDate", "not a date"),
+        field("InvoiceId", "INV-1-bis", confidence=0.5),
+        items_field([
+            [field("Quantity", "1.5"), field("Name", "Pen"), field(False, "unlabelled")],
+            [field("Amount", "$10"), field("Description", None), field("Quantity", False)],
+            [],
+        ]),
+    ])
+    empty_page = models.Page(page_number=3, document_fields=None)
+    return as_response(models.AnalyzeDocumentResult(
+        pages=[first_page, empty_page, second_page, models.Page(page_number=4, document_fields=[])],
+        detected_document_types=[models.DetectedDocumentType(document_type="INVOICE", confidence=0.97)]
+    ))
+
+
+"""
+    The responses of the golden test: the recorded sample invoices, a few
+    hundred synthetic ones, the mocked response of the endpoint tests and
+    the corner cases.
+"""
+def golden_responses():
+    fake = fake_oci.FakeDocumentClient()
+    responses = []
+    for path in sorted(glob.glob(os.path.join(fake_oci.SAMPLES_DIR, "*.pdf"))):
+        with open(path, "rb") as f:
+            responses.append(as_response(fake.analyze(f.read())))
+    for n in range(300):
+        responses.append(as_response(fake.analyze(fake_oci.minimal_pdf(f"golden {n}"))))
+    responses.append(build_fake_oci_response())
+    responses.append(build_fake_oci_response(include_document_fields=False))
+    responses.append(edge_case_response())
+    responses.append(as_response(models.AnalyzeDocumentResult(pages=[], detected_document_types=None)))
+    return responses
+
+
+class TestOciParserGolden(unittest.TestCase):
+    """The shared parser returns exactly what the copy-pasted parsers returned"""
+
+    def test_identical_output_to_the_legacy_parser(self):
+        responses = golden_responses()
+        self.assertGreater(len(responses), 300)
+        for n, response in enumerate(responses):
+            expected = legacy_parse_document_fields(response)
+            got = oci_parser.parse_fields(response)
+            self.assertEqual(got, expected, f"response {n}")
+            # Same types too: 5 and 5.0 compare equal
+            self.assertEqual(
+                [type(v) for v in got[0].values()] + [type(v) for v in got[1].values()],
+                [type(v) for v in expected[0].values()] + [type(v) for v in expected[1].values()],
+                f"response {n}"
+            )
+            for got_item, expected_item in zip(got[0].get("Items", []), expected[0].get("Items", [])):
+                self.assertEqual([type(v) for v in got_item.values()], [type(v) for v in expected_item.values()])
+            self.assertEqual(oci_parser.document_confidence(response), legacy_validate_confidence(response))
+
+    def test_edge_cases(self):
+        data, confidence = oci_parser.parse_fields(edge_case_response())
+        self.assertEqual(data["InvoiceId"], "INV-1-bis")
+        self.assertEqual(data["InvoiceDate"], "")
+        self.assertEqual(data["InvoiceTotal"], 1234.5)
+        self.assertEqual(data["Quantity"], "3")
+        self.assertEqual(data["UnitPrice"], 7.0)
+        self.assertEqual(data[""], "no label")
+        self.assertEqual(data["Items"], [
+            {"Quantity": "", "Name": "Pen", "": "unlabelled"},
+            {"Amount": 10.0, "Description": "", "Quantity": ""},
+            {},
+        ])
+        self.assertEqual(confidence["InvoiceId"], 0.5)
+        self.assertEqual(confidence[""], 0.0)
+
+    def test_low_document_confidence(self):
+        for value in (0.2, 0.89):
+            response = build_fake_oci_response(doc_type_confidence=value)
+            with self.assertRaises(oci_parser.LowConfidence):
+                oci_parser.document_confidence(response)
+        self.assertEqual(oci_parser.document_confidence(build_fake_oci_response(doc_type_confidence=0.9)), 0.9)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,173 @@
+import unittest
+from unittest.mock import patch, MagicMock
+
+import oci
+from fastapi.testclient import TestClient
+
+import fake_oci
+import oci_resilience
+from db_util import init_db, clean_db
+from app import app
+from test.test_extract_new import build_fake_oci_response
+from test.test_metrics import sample_value
+
+
+def service_error(status, headers=None):
+    return oci.exceptions.ServiceError(status, "Error", headers or {}, "injected")
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRetries(unittest.TestCase):
+    """Retry and timeout policy of oci_resilience.call"""
+
+    def setUp(self):
+        patcher = patch("oci_resilience.OCI_BACKOFF_BASE", 0.001)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        oci_resilience.breaker.reset()
+
+    def test_server_errors_are_retried_until_success(self):
+        func = MagicMock(side_effect=[service_error(503), service_error(429), "ok"])
+        before = oci_resilience.retries.value
+        self.assertEqual(oci_resilience.call(func, "request"), "ok")
+        self.assertEqual(func.call_count, 3)
+        self.assertEqual(oci_resilience.retries.value, before + 2)
+
+    def test_client_errors_are_not_retried(self):
+        func = MagicMock(side_effect=[service_error(400), "ok"])
+        with self.assertRaises(oci.exceptions.ServiceError):
+            oci_resilience.call(func)
+        self.assertEqual(func.call_count, 1)
+        func = MagicMock(side_effect=Exception("OCI down"))
+        with self.assertRaises(Exception):
+            oci_resilience.call(func)
+        self.assertEqual(func.call_count, 1)
+
+    def test_slow_calls_time_out_and_are_retried(self):
+        fake = fake_oci.FakeDocumentClient(latency="fixed:0.2", timeout=0.01)
+        with self.assertRaises(oci_resilience.requests.exceptions.ReadTimeout):
+            oci_resilience.call(fake.analyze, b"%PDF-1.4\n")
+        self.assertEqual(fake.calls, oci_resilience.OCI_MAX_ATTEMPTS)
+
+    def test_backoff_is_jittered_capped_and_honours_retry_after(self):
+        with patch("oci_resilience.OCI_BACKOFF_BASE", 1.0), patch("oci_resilience.OCI_BACKOFF_MAX", 4.0):
+            delays = [oci_resilience.backoff_delay(10) for _ in range(50)]
+            self.assertTrue(all(0 <= delay <= 4.0 for delay in delays))
+            self.assertGreater(len(set(delays)), 1)
+            self.assertGreaterEqual(oci_resilience.backoff_delay(0, service_error(429, {"retry-after": "3"})), 3)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """Closed, open and half open states of the error-rate breaker"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = oci_resilience.CircuitBreaker(failure_rate=0.5, min_calls=4, window=4,
+                                                     open_seconds=10, clock=self.clock)
+
+    def tearDown(self):
+        oci_resilience.breaker.reset()
+
+    def test_opens_on_error_rate_and_recovers_after_a_probe(self):
+        for failed in (False, True, False, True):
+            self.breaker.before_call()
+            self.breaker.record(failed)
+        self.assertEqual(self.breaker.state, oci_resilience.OPEN)
+        with self.assertRaises(oci_resilience.CircuitOpenError) as raised:
+            self.breaker.before_call()
+        self.assertEqual(raised.exception.retry_after, 10)
+
+        self.clock.now = 10
+        self.breaker.before_call()
+        self.assertEqual(self.breaker.state, oci_resilience.HALF_OPEN)
+        # Only one probe at a time
+        with self.assertRaises(oci_resilience.CircuitOpenError):
+            self.breaker.before_call()
+        self.breaker.record(failed=False)
+        self.assertEqual(self.breaker.state, oci_resilience.CLOSED)
+
+    def test_failed_probe_reopens(self):
+        for _ in range(4):
+            self.breaker.record(failed=True)
+        self.clock.now = 10
+        self.breaker.before_call()
+        self.breaker.record(failed=True)
+        self.assertEqual(self.breaker.state, oci_resilience.OPEN)
+        self.clock.now = 15
+        with self.assertRaises(oci_resilience.CircuitOpenError) as raised:
+            self.breaker.before_call()
+        self.assertEqual(raised.exception.retry_after, 5)
+
+    def test_stays_closed_below_min_calls(self):
+        for _ in range(3):
+            self.breaker.record(failed=True)
+        self.assertEqual(self.breaker.state, oci_resilience.CLOSED)
+
+
+class TestExtractWhenOCIIsDown(unittest.TestCase):
+    """POST /extract with OCI failing: fail fast, Retry-After and stale cache"""
+
+    def setUp(self):
+        init_db()
+        self.client = TestClient(app)
+        self.files = {"file": ("test.pdf", fake_oci.minimal_pdf("Resilience"), "application/pdf")}
+        breaker = oci_resilience.CircuitBreaker(min_calls=2, window=2, open_seconds=30)
+        for patcher in (patch("oci_resilience.breaker", breaker), patch("oci_resilience.OCI_BACKOFF_BASE", 0.001)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        clean_db()
+
+    def test_open_breaker_fails_fast_with_retry_after(self):
+        fake = fake_oci.FakeDocumentClient(error_rate=1.0)
+        with patch("app.get_doc_client", return_value=fake):
+            first = self.client.post("/extract", files=self.files)
+            second = self.client.post("/extract", files=self.files)
+            metrics_text = self.client.get("/metrics").text
+
+        self.assertEqual(first.status_code, 503)
+        self.assertEqual(second.status_code, 503)
+        self.assertEqual(second.json(), first.json())
+        # The breaker opened after 2 failed attempts, the second request never reached OCI
+        self.assertEqual(fake.calls, 2)
+        self.assertTrue(1 <= int(second.headers["Retry-After"]) <= 30)
+        self.assertEqual(sample_value(metrics_text, "oci_circuit_state"), 1)
+        self.assertGreaterEqual(sample_value(metrics_text, 'oci_call_errors_total{kind="server_error"}'), 2)
+
+    @patch("app.get_doc_client")
+    def test_forced_extraction_serves_stale_cache(self, mock_get_client):
+        mock_client = MagicMock()
+        mock_get_client.return_value = mock_client
+        mock_client.analyze_document.return_value = build_fake_oci_response(doc_type_confidence=0.95)
+        fresh = self.client.post("/extract", files=self.files)
+
+        mock_client.analyze_document.side_effect = service_error(503)
+        stale = self.client.post("/extract", files=self.files, headers={"Cache-Control": "no-cache"})
+        self.assertEqual(stale.status_code, 200)
+        self.assertEqual(stale.headers["X-Extraction-Cache"], "STALE")
+        self.assertEqual(stale.json()["data"], fresh.json()["data"])
+
+        with patch("oci_resilience.SERVE_STALE", False):
+            response = self.client.post("/extract", files=self.files, headers={"Cache-Control": "no-cache"})
+        self.assertEqual(response.status_code, 503)
+
+    @patch("app.get_doc_client")
+    def test_unavailable_without_cache_is_503(self, mock_get_client):
+        mock_get_client.return_value.analyze_document.side_effect = service_error(503)
+        response = self.client.post("/extract", files=self.files, headers={"Cache-Control": "no-cache"})
+        self.assertEqual(response.status_code, 503)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import glob
+import threading
+import unittest
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+import fake_oci
+import pdf_validation
+from db_util import init_db, clean_db
+from app import app
+from mvc_model.controller.controller import extract_invoice_controller, InvalidPDFError
+from test.test_metrics import sample_value
+
+VALID = fake_oci.minimal_pdf("Valid")
+
+
+def reason(pdf_bytes, **limits):
+    """Returns the rejection reason of a file, "valid" if it passes."""
+    try:
+        pdf_validation.validate_pdf(pdf_bytes, **limits)
+    except pdf_validation.InvalidPDF as e:
+        return e.reason
+    return "valid"
+
+
+class TestValidatePdf(unittest.TestCase):
+    """Local structural checks of pdf_validation"""
+
+    def test_sample_invoices_are_valid(self):
+        for path in glob.glob("invoices_sample/*.pdf"):
+            with open(path, "rb") as f:
+                info = pdf_validation.validate_pdf(f.read())
+            self.assertEqual((info["version"], info["pages"]), ("1.4", 1), path)
+
+    def test_malformed_files_are_rejected(self):
+        xref = VALID.rfind(b"xref")
+        cases = {
+            "empty": b"",
+            "not_pdf": b"<html><body>invoice</body></html>",
+            "truncated": VALID[:len(VALID) // 2],
+            "broken_xref": VALID[:xref] + b"XREF" + VALID[xref + 4:],
+            "encrypted": VALID.replace(b"trailer\n<<", b"trailer\n<< /Encrypt 9 0 R", 1),
+            "no_pages": fake_oci.minimal_pdf(pages=0),
+        }
+        for expected, pdf_bytes in cases.items():
+            self.assertEqual(reason(pdf_bytes), expected)
+
+    def test_size_and_page_limits(self):
+        self.assertEqual(reason(VALID, max_bytes=len(VALID) - 1), "too_large")
+        self.assertEqual(reason(fake_oci.minimal_pdf(pages=4), max_pages=3), "too_many_pages")
+        self.assertEqual(pdf_validation.validate_pdf(fake_oci.minimal_pdf(pages=3), max_pages=3)["pages"], 3)
+
+    def test_page_count_without_page_tree_count(self):
+        pdf_bytes = VALID.replace(b" /Count 1", b"")
+        self.assertEqual(pdf_validation.count_pages(pdf_bytes), 1)
+        # Page tree compressed into an object stream: unknown, not rejected
+        self.assertIsNone(pdf_validation.count_pages(b"%PDF-1.5\n1 0 obj\n<< /Type /ObjStm >>\nendobj\n"))
+
+
+class TestValidationBeforeOCI(unittest.TestCase):
+    """Invalid uploads are rejected without calling OCI"""
+
+    def setUp(self):
+        init_db()
+        self.client = TestClient(app)
+        self.fake = fake_oci.FakeDocumentClient()
+        patcher = patch("app.get_doc_client", return_value=self.fake)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        clean_db()
+
+    def post(self, path, pdf_bytes, field="file"):
+        return self.client.post(path, files=[(field, ("invoice.pdf", pdf_bytes, "application/pdf"))])
+
+    def test_extract_rejects_encrypted_pdf(self):
+        before = sample_value(self.client.get("/metrics").text, 'pdf_validation_rejections_total{reason="encrypted"}')
+        encrypted = VALID.replace(b"trailer\n<<", b"trailer\n<< /Encrypt 9 0 R", 1)
+        response = self.post("/extract", encrypted)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["detail"], "Invalid document: the PDF is encrypted. Please upload a valid PDF invoice.")
+        self.assertEqual(self.fake.calls, 0)
+        after = sample_value(self.client.get("/metrics").text, 'pdf_validation_rejections_total{reason="encrypted"}')
+        self.assertEqual(after, before + 1)
+
+    def test_extract_rejects_oversized_pdf_with_413(self):
+        with patch("pdf_validation.PDF_MAX_BYTES", len(VALID) - 1):
+            response = self.post("/extract", VALID)
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(self.fake.calls, 0)
+
+    def test_jobs_and_batch_reject_invalid_pdfs(self):
+        self.assertEqual(self.post("/jobs", b"").status_code, 400)
+
+        files = [("files", ("good.pdf", VALID, "application/pdf")),
+                 ("files", ("empty.pdf", b"", "application/pdf"))]
+        results = self.client.post("/extract/batch", files=files).json()["results"]
+        self.assertEqual([entry["status"] for entry in results], [200, 400])
+        self.assertEqual(self.fake.calls, 1)
+
+    def validating_threads(self, inline_bytes):
+        # Names of the threads that validated the uploads of each endpoint
+        threads = []
+        validate = pdf_validation.validate_pdf
+
+        def record(pdf_bytes):
+            threads.append(threading.current_thread().name)
+            return validate(pdf_bytes)
+
+        with patch("app.PDF_VALIDATE_INLINE_BYTES", inline_bytes), \
+                patch("pdf_validation.validate_pdf", side_effect=record):
+            self.assertEqual(self.post("/extract", VALID).status_code, 200)
+            self.assertEqual(self.post("/jobs", VALID).status_code, 202)
+            self.assertEqual(self.post("/extract/batch", VALID, field="files").status_code, 200)
+        self.assertEqual(len(threads), 3)
+        return threads
+
+    def test_large_pdfs_are_validated_off_the_event_loop(self):
+        self.assertTrue(all(name.startswith("extract") for name in self.validating_threads(len(VALID) - 1)))
+        self.assertFalse(any(name.startswith("extract") for name in self.validating_threads(len(VALID))))
+
+    def test_controller_rejects_invalid_pdf(self):
+        with self.assertRaises(InvalidPDFError):
+            extract_invoice_controller(None, b"not a pdf")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import db_util
+from db_util import init_db, clean_db, save_inv_extraction, getInvoiceById, get_invoices_by_vendor
+
+
+class TestQueryPlans(unittest.TestCase):
+    """
+    Guards the hot queries against regressing to full table scans.
+    The statements actually issued by db_util are captured and checked
+    with EXPLAIN QUERY PLAN.
+    """
+
+    def setUp(self):
+        init_db()
+        save_inv_extraction({"data": {
+            "InvoiceId": "PLAN-1",
+            "VendorName": "PlanVendor",
+            "InvoiceDate": "2012-03-06T00:00:00+00:00",
+            "Items": [{"Description": "Pen", "Name": "Pen", "Quantity": 1, "UnitPrice": 1.0, "Amount": 1.0}]
+        }})
+
+    def tearDown(self):
+        clean_db()
+
+    def capture(self, func, *args):
+        statements = []
+        conn = db_util.get_connection()
+        conn.set_trace_callback(statements.append)
+        try:
+            func(*args)
+        finally:
+            conn.set_trace_callback(None)
+        return [s for s in statements if s.lstrip().upper().startswith(("SELECT", "DELETE", "UPDATE"))]
+
+    def plan(self, sql, params=()):
+        with db_util.get_db() as conn:
+            return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+    def assert_no_table_scans(self, statements):
+        self.assertTrue(statements)
+        for sql in statements:
+            for detail in self.plan(sql):
+                self.assertFalse(
+                    detail.startswith(("SCAN invoices", "SCAN items")),
+                    f"full table scan in plan {detail!r} for {sql}"
+                )
+
+    def test_get_invoice_by_id_uses_indexes(self):
+        statements = self.capture(getInvoiceById, "PLAN-1")
+        self.assert_no_table_scans(statements)
+        details = [d for sql in statements for d in self.plan(sql)]
+        self.assertIn("SEARCH items USING INDEX idx_items_invoice_id (InvoiceId=?)", details)
+
+    def test_get_invoices_by_vendor_uses_indexes(self):
+        statements = self.capture(get_invoices_by_vendor, "PlanVendor")
+        self.assert_no_table_scans(statements)
+        details = [d for sql in statements for d in self.plan(sql)]
+        self.assertIn("SEARCH invoices USING INDEX idx_invoices_vendor_date_id (VendorName=?)", details)
+
+    def test_vendor_keyset_page_is_a_range_search(self):
+        after = ("2012-03-06T00:00:00+00:00", "PLAN-0")
+        statements = self.capture(get_invoices_by_vendor, "PlanVendor", 10, after)
+        self.assert_no_table_scans(statements)
+        page_plan = self.plan(statements[0])
+        self.assertEqual(
+            page_plan,
+            ["SEARCH invoices USING INDEX idx_invoices_vendor_date_id (VendorName=? AND (InvoiceDate,InvoiceId)>(?,?))"]
+        )
+
+    def test_vendor_count_uses_index(self):
+        statements = self.capture(db_util.count_invoices_by_vendor, "PlanVendor")
+        self.assertEqual(
+            self.plan(statements[0]),
+            ["SEARCH invoices USING COVERING INDEX idx_invoices_vendor_date_id (VendorName=?)"]
+        )
+
+    def test_save_inv_extraction_uses_indexes(self):
+        statements = self.capture(save_inv_extraction, {"data": {"InvoiceId": "PLAN-1", "Items": []}})
+        self.assert_no_table_scans(statements)
+
+    def test_invoice_date_range_uses_index(self):
+        details = self.plan(
+            "SELECT InvoiceId FROM invoices WHERE InvoiceDate >= ? AND InvoiceDate < ?",
+            ("2012-01-01", "2013-01-01")
+        )
+        self.assertTrue(any("idx_invoices_invoice_date" in d for d in details), details)
+
+
+class TestIndexMigration(unittest.TestCase):
+
+    def test_init_db_adds_indexes_to_existing_database(self):
+        original_path = db_util.DB_PATH
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "old.db")
+            # A database created by the original schema, without secondary indexes
+            conn = sqlite3.connect(path)
+            conn.execute("CREATE TABLE invoices (InvoiceId TEXT PRIMARY KEY, VendorName TEXT, InvoiceDate TEXT)")
+            conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY AUTOINCREMENT, InvoiceId TEXT)")
+            conn.commit()
+            conn.close()
+            try:
+                db_util.DB_PATH = path
+                init_db()
+                with db_util.get_db() as conn:
+                    indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+                db_util.close_connection()
+            finally:
+                db_util.DB_PATH = original_path
+        self.assertTrue({"idx_invoices_vendor_date_id", "idx_invoices_invoice_date", "idx_items_invoice_id"} <= indexes)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,147 @@
+import asyncio
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import httpx
+
+import db_util
+import fake_oci
+import replay
+from db_util import init_db, clean_db
+from app import app
+
+
+class RecordingClient:
+    """Stands in for httpx.AsyncClient and records the peak number of requests in flight."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.requests = []
+
+    async def request(self, method, path, **kwargs):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        self.requests.append((method, path))
+        await asyncio.sleep(self.latency)
+        self.in_flight -= 1
+        return httpx.Response(200)
+
+
+class TestReplay(unittest.TestCase):
+    """Traffic capture replay (replay.py)"""
+
+    def setUp(self):
+        init_db()
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        clean_db()
+        self.tmp.cleanup()
+
+    def write_capture(self, entries):
+        path = os.path.join(self.tmp.name, "capture.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+        return path
+
+    def test_capture_is_ordered_by_timestamp(self):
+        path = self.write_capture([
+            {"ts": "2023-10-11T16:00:01+00:00", "method": "get", "path": "/invoice/2"},
+            {"ts": "2023-10-11T16:00:00.5+00:00", "method": "GET", "path": "/invoice/1"},
+        ])
+        entries = replay.load_capture(path)
+        self.assertEqual([entry["path"] for entry in entries], ["/invoice/1", "/invoice/2"])
+        self.assertEqual(entries[0]["method"], "GET")
+        self.assertAlmostEqual(entries[1]["ts"] - entries[0]["ts"], 0.5)
+
+    def test_invalid_capture_line_is_reported(self):
+        path = self.write_capture([{"ts": 1, "method": "GET"}])
+        with self.assertRaisesRegex(ValueError, "capture.jsonl:1"):
+            replay.load_capture(path)
+
+    def test_replay_against_the_app_reports_per_route(self):
+        entries = [
+            {"ts": 0.0, "method": "POST", "path": "/extract", "file": "invoice_Aaron_Bergman_36259.pdf"},
+            {"ts": 0.1, "method": "GET", "path": "/invoice/36259"},
+            {"ts": 0.2, "method": "GET", "path": "/invoice/missing"},
+        ]
+
+        async def run():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://replay") as client:
+                replayer = replay.Replayer(client, speed=10, concurrency=1, payload_dir=fake_oci.SAMPLES_DIR,
+                                           route_names=replay.RouteNames(app.routes))
+                elapsed = await replayer.run(entries)
+            return replayer, elapsed
+
+        with patch("app.get_doc_client", return_value=fake_oci.FakeDocumentClient()):
+            replayer, elapsed = asyncio.run(run())
+
+        self.assertEqual(replayer.errors, {"POST /extract": 0, "GET /invoice/{invoice_id}": 1})
+        self.assertEqual(len(replayer.latencies["GET /invoice/{invoice_id}"]), 2)
+        # Scaled by speed=10 the capture spans 20 ms
+        self.assertGreaterEqual(elapsed, 0.02)
+        self.assertIn("GET /invoice/{invoice_id}", replayer.report(elapsed))
+
+    def test_speed_scales_the_original_timing(self):
+        entries = [{"ts": ts, "method": "GET", "path": "/metrics"} for ts in (0.0, 0.2, 0.4)]
+        client = RecordingClient()
+        elapsed = asyncio.run(replay.Replayer(client, speed=4).run(entries))
+        self.assertGreaterEqual(elapsed, 0.1)
+        self.assertLess(elapsed, 0.4)
+
+    def test_max_throughput_respects_concurrency(self):
+        entries = [{"ts": n, "method": "GET", "path": "/metrics"} for n in range(12)]
+        client = RecordingClient(latency=0.01)
+        elapsed = asyncio.run(replay.Replayer(client, speed=None, concurrency=3).run(entries))
+        self.assertEqual(len(client.requests), 12)
+        self.assertEqual(client.max_in_flight, 3)
+        # 12 timestamps one second apart are sent without waiting
+        self.assertLess(elapsed, 1)
+
+    def test_missing_payload_fails_only_its_request(self):
+        entries = [
+            {"ts": 0.0, "method": "POST", "path": "/extract", "file": "missing.pdf"},
+            {"ts": 0.0, "method": "GET", "path": "/metrics"},
+        ]
+        client = RecordingClient()
+        replayer = replay.Replayer(client, speed=None, payload_dir=self.tmp.name)
+        asyncio.run(replayer.run(entries))
+        self.assertEqual(replayer.errors, {"POST /extract": 1, "GET /metrics": 0})
+        self.assertEqual(client.requests, [("GET", "/metrics")])
+
+    def run_main(self, *argv):
+        output = io.StringIO()
+        # main() points db_util at a temporary database
+        with patch("db_util.DB_PATH", db_util.DB_PATH), contextlib.redirect_stdout(output):
+            replay.main(list(argv))
+        return output.getvalue()
+
+    def test_payloads_are_found_next_to_the_capture(self):
+        shutil.copy(os.path.join(fake_oci.SAMPLES_DIR, "invoice_Aaron_Bergman_36259.pdf"), self.tmp.name)
+        path = self.write_capture([
+            {"ts": 0.0, "method": "POST", "path": "/extract", "file": "invoice_Aaron_Bergman_36259.pdf"},
+        ])
+        report = self.run_main(path, "--max", "--latency", "fixed:0", "--no-warm-up")
+        self.assertRegex(report, r"POST /extract +1 +0 ")
+
+    def test_sample_reads_find_their_invoices_at_full_speed(self):
+        sample = os.path.join(os.path.dirname(replay.__file__), "benchmarks", "captures", "sample.jsonl")
+        missing = sum(entry["path"] == "/invoice/does-not-exist" for entry in replay.load_capture(sample))
+        report = self.run_main(sample, "--max", "--latency", "fixed:0.05")
+        # Only the reads of an invoice that never exists fail
+        self.assertRegex(report, rf"GET /invoice/{{invoice_id}} +36 +{missing} ")
+        self.assertRegex(report, r"POST /extract +16 +0 ")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,184 @@
+import asyncio
+import base64
+import mmap
+import tempfile
+import tracemalloc
+import unittest
+from unittest.mock import patch
+
+from fastapi import UploadFile
+from fastapi.testclient import TestClient
+
+import extraction_cache
+import fake_oci
+import pdf_validation
+import uploads
+from db_util import init_db, clean_db
+from app import app, build_analyze_request
+from test.test_metrics import sample_value
+
+VALID = fake_oci.minimal_pdf("Valid")
+# Larger than the 1 KiB spool threshold the tests use
+SPOOLED = fake_oci.minimal_pdf("x" * 4096)
+# A large scanned invoice, padded to 16 MiB
+LARGE_PDF_BYTES = 16 * 1024 * 1024
+
+
+"""
+    Builds an UploadFile the way Starlette does: the content is written to
+    a SpooledTemporaryFile in chunks and spills to disk past the threshold.
+"""
+def spooled_upload(pdf_bytes, spool_bytes=uploads.UPLOAD_SPOOL_BYTES):
+    file = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+    for offset in range(0, len(pdf_bytes), 64 * 1024):
+        file.write(pdf_bytes[offset:offset + 64 * 1024])
+    file.seek(0)
+    return UploadFile(file, filename="invoice.pdf")
+
+
+"""
+    Peak memory allocated by Python while running func.
+"""
+def peak_allocation(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+class TestReadUpload(unittest.TestCase):
+    """Uploads are read from the spool without copying them into memory"""
+
+    def test_small_upload_is_read_from_memory(self):
+        content = uploads.read_upload(spooled_upload(VALID))
+        self.assertIsInstance(content, bytes)
+        self.assertEqual(content, VALID)
+
+    def test_spooled_upload_is_memory_mapped(self):
+        content = uploads.read_upload(spooled_upload(SPOOLED, spool_bytes=1024))
+        self.assertIsInstance(content, mmap.mmap)
+        self.assertEqual(content[:], SPOOLED)
+        # Everything done with the PDF before the OCI call works on the map
+        self.assertEqual(pdf_validation.validate_pdf(content)["bytes"], len(SPOOLED))
+        self.assertEqual(extraction_cache.pdf_hash(content), extraction_cache.pdf_hash(SPOOLED))
+        self.assertEqual(uploads.base64_encode(content), base64.b64encode(SPOOLED).decode("ascii"))
+
+    def test_empty_spooled_upload(self):
+        upload = spooled_upload(b"", spool_bytes=0)
+        upload.file.rollover()
+        self.assertEqual(uploads.read_upload(upload), b"")
+
+    def test_base64_encode_matches_one_shot_encoding(self):
+        for size in (0, 1, 2, 3, uploads.BASE64_CHUNK_BYTES - 1, uploads.BASE64_CHUNK_BYTES, 2 * uploads.BASE64_CHUNK_BYTES + 2):
+            data = bytes(range(256)) * (size // 256) + bytes(size % 256)
+            self.assertEqual(uploads.base64_encode(data), base64.b64encode(data).decode("ascii"), size)
+
+    def test_peak_allocation_for_a_large_pdf(self):
+        pdf_bytes = fake_oci.minimal_pdf("x" * LARGE_PDF_BYTES)
+        size = len(pdf_bytes)
+        upload = spooled_upload(pdf_bytes)
+        del pdf_bytes
+
+        def before():
+            # What /extract did: read the upload, then encode it in one go
+            upload.file.seek(0)
+            content = upload.file.read()
+            pdf_validation.validate_pdf(content, max_bytes=size)
+            extraction_cache.pdf_hash(content)
+            base64.b64encode(content).decode("utf-8")
+
+        def after():
+            content = uploads.read_upload(upload)
+            pdf_validation.validate_pdf(content, max_bytes=size)
+            extraction_cache.pdf_hash(content)
+            build_analyze_request(content)
+
+        old_peak = peak_allocation(before)
+        new_peak = peak_allocation(after)
+        print(f"\npeak allocation for a {size >> 20} MiB PDF: {old_peak / size:.2f}x before, {new_peak / size:.2f}x now")
+        # Only the Base64 buffer and the str handed to the OCI SDK (4/3 of
+        # the PDF each) are allocated, never a copy of the PDF itself
+        self.assertLess(new_peak, 2.8 * size)
+        self.assertLess(new_peak, old_peak - size / 2)
+
+
+class TestUploadLimit(unittest.TestCase):
+    """Oversized request bodies are rejected while they are streamed in"""
+
+    def setUp(self):
+        init_db()
+        self.client = TestClient(app)
+        self.fake = fake_oci.FakeDocumentClient()
+        patcher = patch("app.get_doc_client", return_value=self.fake)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        clean_db()
+
+    def test_extract_reads_a_spooled_upload(self):
+        with patch("starlette.formparsers.MultiPartParser.spool_max_size", 1024), \
+                patch("uploads.read_upload", wraps=uploads.read_upload) as read_upload:
+            response = self.client.post("/extract", files={"file": ("invoice.pdf", SPOOLED, "application/pdf")})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.fake.calls, 1)
+        self.assertTrue(read_upload.call_args.args[0].file._rolled)
+
+    def test_declared_content_length_over_the_limit(self):
+        before = sample_value(self.client.get("/metrics").text, "uploads_too_large_total")
+        with patch("uploads.UPLOAD_MAX_BYTES", 1024):
+            response = self.client.post("/extract", files={"file": ("invoice.pdf", VALID + b"%" * 2048, "application/pdf")})
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response.json()["detail"], "Upload too large. The maximum is 1024 bytes.")
+        self.assertEqual(self.fake.calls, 0)
+        after = sample_value(self.client.get("/metrics").text, "uploads_too_large_total")
+        self.assertEqual(after, before + 1)
+
+    def test_streamed_body_over_the_limit(self):
+        def chunks():
+            for _ in range(8):
+                yield b"x" * 512
+
+        # No Content-Length: the body is counted as it arrives
+        with patch("uploads.UPLOAD_MAX_BYTES", 1024):
+            response = self.client.post("/jobs", content=chunks(), headers={"Content-Type": "multipart/form-data; boundary=b"})
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(self.client.get("/jobs/unknown").status_code, 404)
+
+    def test_batch_has_its_own_limit(self):
+        middleware = uploads.UploadLimitMiddleware(app, max_bytes=1024)
+        self.assertEqual(middleware.limit_for("/extract"), 1024)
+        self.assertEqual(middleware.limit_for("/extract/batch"), uploads.BATCH_UPLOAD_MAX_BYTES)
+        files = [("files", ("a.pdf", VALID, "application/pdf")), ("files", ("b.pdf", VALID, "application/pdf"))]
+        with patch("uploads.UPLOAD_MAX_BYTES", len(VALID)):
+            response = self.client.post("/extract/batch", files=files)
+        self.assertEqual(response.status_code, 200)
+
+    def test_stops_reading_once_the_limit_is_exceeded(self):
+        messages = [{"type": "http.request", "body": b"x" * 512, "more_body": True} for _ in range(8)]
+        received = []
+        sent = []
+
+        async def receive():
+            received.append(1)
+            return messages[len(received) - 1]
+
+        async def send(message):
+            sent.append(message)
+
+        async def read_body(scope, receive, send):
+            while (await receive())["more_body"]:
+                pass
+
+        middleware = uploads.UploadLimitMiddleware(read_body, max_bytes=1024)
+        scope = {"type": "http", "path": "/extract", "headers": []}
+        with self.assertRaises(Exception) as raised:
+            asyncio.run(middleware(scope, receive, send))
+        self.assertEqual(raised.exception.status_code, 413)
+        self.assertEqual(len(received), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,7 +2,7 @@ import unittest
 from datetime import datetime, date, timezone
 
 # Change this import if needed:
-from app import format_date_to_iso, clean_amount
+from oci_parser import format_date_to_iso, clean_amount
 
 
 class TestFormatDateToIso(unittest.TestCase):
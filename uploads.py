@@ -0,0 +1,118 @@
+import binascii
+import mmap
+import os
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from starlette.formparsers import MultiPartParser
+
+import metrics
+import pdf_validation
+
+# Uploaded files larger than this are spooled to a temporary file on disk
+# while the request body is parsed, instead of being kept in memory
+UPLOAD_SPOOL_BYTES = int(os.getenv("UPLOAD_SPOOL_BYTES", str(1024 * 1024)))
+# Request bodies larger than this are rejected with 413 while they are
+# received; the slack over PDF_MAX_BYTES covers the multipart framing
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(pdf_validation.PDF_MAX_BYTES + 64 * 1024)))
+# Same limit for /extract/batch, which receives many documents at once
+BATCH_UPLOAD_MAX_BYTES = int(os.getenv("BATCH_UPLOAD_MAX_BYTES", str(256 * 1024 * 1024)))
+# Base64 input is encoded this many bytes at a time (a multiple of 3, so
+# the encoded chunks concatenate without padding in between)
+BASE64_CHUNK_BYTES = 3 * 256 * 1024
+
+MultiPartParser.spool_max_size = UPLOAD_SPOOL_BYTES
+
+uploads_too_large = metrics.Counter(
+    "uploads_too_large_total",
+    "Request bodies rejected with 413 because they exceeded the upload limit."
+)
+
+
+class UploadLimitMiddleware:
+    """
+    ASGI middleware enforcing the upload size limit while the request body
+    is streamed in: a request declaring a larger Content-Length is answered
+    with 413 without reading its body, and a body that grows past the limit
+    is cut off with 413 as soon as it does, before it is fully buffered.
+    """
+
+    def __init__(self, app, max_bytes=None, batch_max_bytes=None):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.batch_max_bytes = batch_max_bytes
+
+    def limit_for(self, path):
+        """The limit of a path, UPLOAD_MAX_BYTES or BATCH_UPLOAD_MAX_BYTES unless given."""
+        if path.rstrip("/").endswith("/batch"):
+            return BATCH_UPLOAD_MAX_BYTES if self.batch_max_bytes is None else self.batch_max_bytes
+        return UPLOAD_MAX_BYTES if self.max_bytes is None else self.max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        limit = self.limit_for(scope["path"])
+        detail = f"Upload too large. The maximum is {limit} bytes."
+
+        declared = dict(scope["headers"]).get(b"content-length", b"")
+        if declared.isdigit() and int(declared) > limit:
+            uploads_too_large.inc()
+            response = JSONResponse({"detail": detail}, status_code=413, headers={"Connection": "close"})
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    uploads_too_large.inc()
+                    raise HTTPException(status_code=413, detail=detail, headers={"Connection": "close"})
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+"""
+    Returns the content of an uploaded file without copying a spooled file
+    into memory: a small upload still held in memory is returned as bytes,
+    one spooled to disk as a read-only memory map of the temporary file.
+    Both support len(), find()/rfind(), slicing, re and hashlib. The map is
+    released with its last reference.
+    Parameters:
+        upload (UploadFile): The uploaded file.
+    Returns:
+        bytes | mmap.mmap: The content of the file.
+"""
+def read_upload(upload):
+    file = upload.file
+    file.seek(0)
+    # SpooledTemporaryFile has no public way to tell where its data is
+    if not getattr(file, "_rolled", True):
+        return file.read()
+    file.flush()
+    if os.fstat(file.fileno()).st_size == 0:
+        return b""
+    return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+"""
+    Base64 encodes data chunk by chunk into a buffer of the final size, so
+    no full-size intermediate bytes object is made besides the result.
+    Parameters:
+        data (bytes-like): The data to encode, e.g. the result of read_upload.
+    Returns:
+        str: The Base64 encoding of data.
+"""
+def base64_encode(data):
+    with memoryview(data) as view:
+        size = view.nbytes
+        encoded = bytearray(4 * ((size + 2) // 3))
+        position = 0
+        for offset in range(0, size, BASE64_CHUNK_BYTES):
+            chunk = binascii.b2a_base64(view[offset:offset + BASE64_CHUNK_BYTES], newline=False)
+            encoded[position:position + len(chunk)] = chunk
+            position += len(chunk)
+    return encoded.decode("ascii")
@@ -0,0 +1,29 @@
+import argparse
+import threading
+
+import blob_store
+import db_util
+import job_queue
+from app import process_document
+
+"""
+    Standalone job worker entry point.
+    Drains the extraction job queue stored in the SQLite database. Start as
+    many worker processes as needed against the same database file; each
+    job is claimed by exactly one worker.
+    Usage:
+        python worker.py --threads 4
+"""
+if __name__ == "__main__": # pragma: no cover
+    parser = argparse.ArgumentParser(description="Invoice extraction job worker")
+    parser.add_argument("--threads", type=int, default=1, help="worker threads in this process")
+    args = parser.parse_args()
+
+    db_util.init_db()
+    blob_store.start()
+    workers = job_queue.start_workers(args.threads, process_document)
+    try:
+        # Wait until interrupted
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        job_queue.stop_workers(workers)